@@ -1,12 +1,22 @@
 import deepl
+import heapq
+import itertools
+import json
 import os
+import stat
 import sys
 import time
 import traceback
+import zipfile
+from bisect import bisect_right
+from contextlib import contextmanager
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 import re  # Для регулярных выражений
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter  # Устанавливается вместе с deepl
+from urllib3.util.retry import Retry
 
 # === ДОБАВИТЬ ПОСЛЕ ВСЕХ ИМПОРТОВ (перед проверкой DEEPL_API_KEY) ===
 
@@ -33,12 +43,18 @@ except ImportError:
     print("Перевод будет выполнен без использования глоссария.")
     glossary_entries = None
 
+# orjson сериализует JSON заметно быстрее стандартного модуля; если не установлен - используем json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # --- Проверка и импорт python-docx ---
 try:
     from docx import Document
     from docx.shared import Pt  # Для возможной работы со стилями, если понадобится
-    from docx.text.paragraph import Paragraph
     from docx.text.run import Run
+    from lxml import etree  # Устанавливается вместе с python-docx
 except ImportError:
     print("Ошибка: Необходима библиотека python-docx.")
     print("Пожалуйста, установите ее: pip install python-docx")
@@ -54,10 +70,62 @@ load_dotenv(BASE_DIR / '.env')
 # Получаем ключ из переменных окружения
 DEEPL_API_KEY = os.getenv('DEEPL_API_KEY', '')
 
-SUPPORTED_EXTENSIONS = ['.docx', '.pdf']
+# Локальный кэш ответов DeepL (использование и глоссарии), чтобы не делать лишних запросов при запуске
+DEEPL_CACHE_PATH = BASE_DIR / '.deepl_cache.json'
+DEEPL_CACHE_TTL = 300  # Время жизни кэша использования в секундах
+USAGE_CACHE_SAFE_RATIO = 0.9  # Кэш использования доверяем, только если израсходовано меньше 90% лимита
+
+SUPPORTED_EXTENSIONS = frozenset({'.docx', '.pdf'})  # Множество: проверка suffix in ... без перебора списка
 TRANSLATION_SUFFIX = "_to_{target_lang_code}"
+ERROR_LOG_NAME = "translation_errors.log"  # Журнал ошибок пакетного перевода (в целевой папке)
+ERROR_REPORT_NAME = "translation_errors.json"  # Те же ошибки в JSON для автоматической обработки
 MAX_CONCURRENT_TRANSLATIONS = 1  # Всегда последовательный перевод
-PAUSE_BETWEEN_REQUESTS = 2  # Пауза между запросами в секундах
+PREFLIGHT_MAX_WORKERS = 16  # Потоки для проверки существования выходных файлов перед переводом
+ESTIMATE_MAX_WORKERS = 8  # Потоки для подсчета символов при оценке стоимости
+SCANDIR_MAX_WORKERS = min(32, (os.cpu_count() or 1) * 4)  # Потоки для параллельного обхода папок (сетевые диски)
+POSTPROCESS_MAX_WORKERS = min(4, os.cpu_count() or 1)  # Процессы для пост-обработки DOCX (локальная работа, без DeepL)
+DOCUMENT_POLL_MAX_WORKERS = 2  # Документов, одновременно ожидающих перевода в DeepL при пакетной обработке
+DOWNLOAD_CHUNK_SIZE = 64 * 1024  # Размер блока при скачивании переведенного документа
+PAUSE_BETWEEN_REQUESTS = 2  # Пауза после запроса, на который DeepL ответил перегрузкой (в секундах)
+HTTP_POOL_SIZE = 4  # Размер пула HTTPS-соединений к DeepL
+HTTP_MAX_RETRIES = 5  # Повторы при 429/5xx с учетом заголовка Retry-After
+
+# Лимиты пакетного перевода текста DeepL (translate_text со списком строк)
+TEXT_BATCH_MAX_ITEMS = 50  # Максимум строк в одном запросе
+TEXT_BATCH_MAX_BYTES = 70 * 1024  # Максимальный размер запроса в байтах UTF-8
+
+# Тег текстового узла <w:t> в WordprocessingML
+W_NAMESPACE = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+W_PARAGRAPH_TAG = f'{{{W_NAMESPACE}}}p'
+W_TEXT_TAG = f'{{{W_NAMESPACE}}}t'
+XML_SPACE_ATTR = '{http://www.w3.org/XML/1998/namespace}space'
+# Части DOCX с текстом, в которых исправляются плейсхолдеры: основной текст и колонтитулы
+DOCX_TEXT_PART_PATTERN = re.compile(r'word/(?:document|header\d*|footer\d*)\.xml')
+
+# УЛУЧШЕННОЕ РЕГУЛЯРНОЕ ВЫРАЖЕНИЕ v3 для исправления искаженных плейсхолдеров формул
+EQN_PLACEHOLDER_PATTERN = re.compile(
+    r'(<<Eqn(\d+))'  # Группа 1: <<Eqn<цифры>, Группа 2: только цифры
+    r'(?!\d)'  # номер целиком - без отката внутрь номера (<<Eqn12.eps>> не должен стать <<Eqn1.eps>>)
+    r'(?!'  # Начало негативного просмотра вперед (убеждаемся, что ДАЛЬШЕ НЕ...)
+    r'\.eps>>'  # ...ровно ".eps>>"
+    r'([,\s]|$)'  # ...за которым идет запятая, пробел или конец строки/параграфа
+    r')'  # Конец негативного просмотра
+    r'([\.\w>]+)?'  # Группа 3 Translate_politics (опциональная): Захватываем сам "мусор" - точки, буквы(eps), >.
+)
+# Строка для замены: Восстанавливаем правильный формат, используя Группу 2 (цифры)
+EQN_PLACEHOLDER_REPLACEMENT = r'<<Eqn\2.eps>>'
+
+# Поиск самых больших файлов: анализируемые форматы и примерное число символов на байт файла
+LARGEST_FILES_EXT_PATTERN = re.compile(r'\.(docx|pdf|txt|doc|rtf|odt)$', re.IGNORECASE)
+LARGEST_FILES_CHAR_RATIOS = {
+    '.docx': 0.7,  # Для документов Word - примерная оценка
+    '.pdf': 0.4,  # Для PDF - очень грубая оценка
+    '.txt': 1.0,  # Для текстовых файлов - примерно равно размеру
+    '.doc': 0.7,
+    '.rtf': 0.3,  # Для RTF - содержит много разметки
+    '.odt': 0.7,
+}
+LARGEST_FILES_DEFAULT_RATIO = 0.5
 
 LANGUAGE_OPTIONS = {
     "1": {"name": "Русский -> Английский (US)", "source": "RU", "target": "EN-US"},
@@ -66,6 +134,11 @@ LANGUAGE_OPTIONS = {
     # Добавьте другие языки при необходимости
 }
 
+# Меню выбора направления перевода собирается один раз
+LANGUAGE_MENU = "\nВыберите направление перевода:\n" + "\n".join(
+    f"  {key}: {value['name']}" for key, value in LANGUAGE_OPTIONS.items())
+LANGUAGE_CHOICE_PROMPT = f"Введите номер ({', '.join(LANGUAGE_OPTIONS.keys())}): "
+
 
 # --- Helper Functions ---
 
@@ -81,12 +154,10 @@ def check_api_key_placeholder():
 
 def get_translation_direction():
     """Запрашивает направление перевода у пользователя"""
-    print("\nВыберите направление перевода:")
-    for key, value in LANGUAGE_OPTIONS.items():
-        print(f"  {key}: {value['name']}")
+    print(LANGUAGE_MENU)
 
     while True:
-        choice = input(f"Введите номер ({', '.join(LANGUAGE_OPTIONS.keys())}): ").strip()
+        choice = input(LANGUAGE_CHOICE_PROMPT).strip()
         if choice in LANGUAGE_OPTIONS:
             selected_lang = LANGUAGE_OPTIONS[choice]
             print(f"Выбрано: {selected_lang['name']}")
@@ -95,13 +166,134 @@ def get_translation_direction():
             print("Ошибка: Неверный выбор. Пожалуйста, введите один из предложенных номеров.")
 
 
-def initialize_translator(api_key):
-    """Initializes the DeepL translator and checks usage."""
+def dump_json(obj):
+    """Сериализует объект в JSON с отступами (UTF-8 bytes): через orjson, если он установлен, иначе через json."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+
+
+def load_json(data):
+    """Разбирает JSON из UTF-8 bytes: через orjson, если он установлен, иначе через json."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data.decode('utf-8'))
+
+
+def load_deepl_cache():
+    """Читает локальный кэш DeepL. При отсутствии или повреждении файла возвращает пустой словарь."""
+    try:
+        with open(DEEPL_CACHE_PATH, 'rb') as f:
+            cache = load_json(f.read())
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_deepl_cache(cache):
+    """Сохраняет локальный кэш DeepL. Ошибки записи не критичны и игнорируются."""
+    cache['ts'] = time.time()
+    try:
+        with open(DEEPL_CACHE_PATH, 'wb') as f:
+            f.write(dump_json(cache))
+    except OSError as e:
+        print(f"Предупреждение: Не удалось сохранить кэш DeepL: {e}")
+
+
+def _usage_to_cache(usage):
+    """Преобразует объект использования DeepL в словарь для кэша."""
+    document = getattr(usage, 'document', None)
+    return {
+        'character': {'count': usage.character.count, 'limit': usage.character.limit},
+        'document': {'count': document.count, 'limit': document.limit} if document and document.valid else None,
+        'ts': time.time()
+    }
+
+
+def _usage_from_cache(cache):
+    """
+    Возвращает использование из кэша в виде объекта с атрибутами как у deepl.Usage,
+    если кэш свежий и до лимита еще далеко. Иначе None.
+    """
+    cached_usage = cache.get('usage')
+    if not cached_usage or time.time() - cached_usage.get('ts', 0) > DEEPL_CACHE_TTL:
+        return None
+
+    character = cached_usage.get('character') or {}
+    char_count, char_limit = character.get('count'), character.get('limit')
+    if char_count is None or (char_limit is not None and char_count >= char_limit * USAGE_CACHE_SAFE_RATIO):
+        return None
+
+    document = cached_usage.get('document')
+    if document and document.get('limit') is not None and document.get('count') is not None \
+            and document['count'] >= document['limit'] * USAGE_CACHE_SAFE_RATIO:
+        return None
+
+    return SimpleNamespace(
+        character=SimpleNamespace(count=char_count, limit=char_limit),
+        document=SimpleNamespace(valid=True, **document) if document else None
+    )
+
+
+class PressureTrackingRetry(Retry):
+    """Retry, запоминающий время последнего повтора - признак того, что DeepL ограничивает запросы."""
+    last_retry_time = 0.0
+
+    def increment(self, *args, **kwargs):
+        PressureTrackingRetry.last_retry_time = time.time()
+        return super().increment(*args, **kwargs)
+
+
+def configure_translator_session(translator):
+    """
+    Настраивает HTTPS-сессию переводчика: пул keep-alive соединений и повторы при 429/5xx
+    с учетом Retry-After. Встроенные повторы клиента DeepL отключаются, чтобы не умножать их.
+    """
+    session = getattr(getattr(translator, '_client', None), '_session', None)
+    if session is None:
+        return  # Внутреннее устройство клиента DeepL изменилось - остаемся на его настройках
+
+    retry = PressureTrackingRetry(
+        total=HTTP_MAX_RETRIES,
+        backoff_factor=2,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=None,  # Запросы DeepL - это POST, по умолчанию urllib3 их не повторяет
+        respect_retry_after_header=True,
+        raise_on_status=False  # Последний ответ отдаем клиенту DeepL, он превратит его в исключение
+    )
+    session.mount('https://', HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE,
+                                          max_retries=retry))
+    deepl.http_client.max_network_retries = 0
+
+
+def initialize_translator(api_key, quiet=False):
+    """
+    Initializes the DeepL translator and checks usage.
+    В тихом режиме (quiet=True, автоматический запуск) проверка лимитов и калькулятор затрат пропускаются:
+    при исчерпании квоты DeepL сам вернет ошибку при переводе.
+    """
+    if quiet:
+        try:
+            translator = deepl.Translator(api_key)
+            configure_translator_session(translator)
+            return translator
+        except Exception as e:
+            print(f"\nНепредвиденная ошибка при инициализации DeepL: {e}")
+            sys.exit(1)
+
     print("\nИнициализация переводчика DeepL...")
     try:
         translator = deepl.Translator(api_key)
-        print("Проверка лимитов DeepL API...")
-        usage = translator.get_usage()
+        configure_translator_session(translator)
+        deepl_cache = load_deepl_cache()
+        usage = _usage_from_cache(deepl_cache)
+        if usage is not None:
+            print("Лимиты DeepL API взяты из локального кэша (проверка была менее 5 минут назад)...")
+        else:
+            print("Проверка лимитов DeepL API...")
+            usage = translator.get_usage()
+            deepl_cache['usage'] = _usage_to_cache(usage)
+            save_deepl_cache(deepl_cache)
 
         # Character limit check
         char_count = usage.character.count
@@ -193,40 +385,64 @@ def initialize_translator(api_key):
         sys.exit(1)
 
 
-def get_or_create_glossary(translator, source_lang, target_lang):
-    """Получает существующий глоссарий или создает новый."""
+def get_or_create_glossary(translator, source_lang, target_lang, quiet=False):
+    """Получает существующий глоссарий или создает новый. При quiet=True выводятся только предупреждения."""
+    log = (lambda *args, **kwargs: None) if quiet else print
     # Если глоссарий не был импортирован, возвращаем None
     if glossary_entries is None:
         return None
 
     # Проверяем, что направление перевода поддерживается глоссарием
     if source_lang != "RU" or target_lang not in ["EN-US", "EN-GB", "EN"]:
-        print("Глоссарий доступен только для перевода с русского на английский.")
+        log("Глоссарий доступен только для перевода с русского на английский.")
         return None
 
     glossary_name = f"Universal Scientific Terms RU-EN v1"
 
     try:
+        deepl_cache = load_deepl_cache()
+
+        # Сначала ищем глоссарий в локальном кэше и проверяем, что он еще существует
+        for cached in deepl_cache.get('glossaries', []):
+            if cached.get('name') == glossary_name and cached.get('source') == "RU" and cached.get('target') == "EN":
+                try:
+                    glossary = translator.get_glossary(cached['id'])
+                except deepl.DeepLException:
+                    break  # Глоссарий удален - ищем заново по списку
+                log(f"✅ Найден глоссарий из кэша: {glossary.name} (ID: {glossary.glossary_id})")
+                log(f"   Количество терминов: {glossary.entry_count}")
+                return glossary
+
         # Пытаемся найти существующий глоссарий
-        print("\nПроверка существующих глоссариев...")
+        log("\nПроверка существующих глоссариев...")
         glossaries = translator.list_glossaries()
+        deepl_cache['glossaries'] = [
+            {'name': g.name, 'id': g.glossary_id, 'source': g.source_lang, 'target': g.target_lang,
+             'entry_count': g.entry_count}
+            for g in glossaries
+        ]
+        save_deepl_cache(deepl_cache)
 
         for glossary in glossaries:
             if glossary.name == glossary_name and glossary.source_lang == "RU" and glossary.target_lang == "EN":
-                print(f"✅ Найден существующий глоссарий: {glossary.name} (ID: {glossary.glossary_id})")
-                print(f"   Количество терминов: {glossary.entry_count}")
+                log(f"✅ Найден существующий глоссарий: {glossary.name} (ID: {glossary.glossary_id})")
+                log(f"   Количество терминов: {glossary.entry_count}")
                 return glossary
 
         # Если глоссарий не найден, создаем новый
-        print("Создание нового глоссария научных терминов...")
+        log("Создание нового глоссария научных терминов...")
         glossary = translator.create_glossary(
             name=glossary_name,
             source_lang="RU",
             target_lang="EN",
             entries=glossary_entries
         )
-        print(f"✅ Глоссарий успешно создан: {glossary.name} (ID: {glossary.glossary_id})")
-        print(f"   Количество терминов: {len(glossary_entries)}")
+        deepl_cache['glossaries'].append(
+            {'name': glossary.name, 'id': glossary.glossary_id, 'source': glossary.source_lang,
+             'target': glossary.target_lang, 'entry_count': glossary.entry_count})
+        save_deepl_cache(deepl_cache)
+        log(f"✅ Глоссарий успешно создан: {glossary.name} (ID: {glossary.glossary_id})")
+        log(f"   Количество терминов: {len(glossary_entries)}")
         return glossary
 
     except deepl.DeepLException as e:
@@ -239,66 +455,89 @@ def get_or_create_glossary(translator, source_lang, target_lang):
         return None
 
 
+def _walk_supported_files(root):
+    """Обходит дерево папок одним проходом os.scandir и возвращает пути (строки) поддерживаемых файлов."""
+    supported_suffixes = tuple(SUPPORTED_EXTENSIONS)
+    stack = [root]
+    while stack:
+        current_dir = stack.pop()
+        try:
+            with os.scandir(current_dir) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file():
+                        name = entry.name
+                        if name.startswith('~$'):
+                            continue
+                        if name.lower().endswith(supported_suffixes):
+                            yield entry.path
+        except OSError as e:
+            print(f"Предупреждение: Не удалось прочитать папку '{current_dir}': {e}. Пропуск.")
+
+
 def find_files_to_translate(source_root_path):
     """Recursively finds files with supported extensions, excluding temporary files."""
     print("\nПоиск файлов для перевода...")
-    files_found = []
-    for extension in SUPPORTED_EXTENSIONS:
-        extension_pattern = "".join([f"[{c.lower()}{c.upper()}]" for c in extension[1:]])
-        pattern = f"*.{extension_pattern}"
-        # print(f"Поиск файлов с шаблоном: {pattern} в {source_root_path}") # Debug log
-        files_found.extend(list(source_root_path.rglob(pattern)))
-
     processed_paths = set()
-    files_to_process = []
-    for f in files_found:
+    for file_path_str in _walk_supported_files(str(source_root_path)):
         try:
-            resolved_f = f.resolve()
-            if resolved_f.is_file() and not resolved_f.name.startswith('~$') and resolved_f not in processed_paths:
-                files_to_process.append(resolved_f)
-                processed_paths.add(resolved_f)
+            processed_paths.add(Path(file_path_str).resolve())
         except Exception as e:
-            print(f"Предупреждение: Не удалось обработать путь файла '{f}': {e}. Пропуск.")
+            print(f"Предупреждение: Не удалось обработать путь файла '{file_path_str}': {e}. Пропуск.")
 
-    files_to_process.sort()
-    print(f"Найдено {len(files_to_process)} файлов с расширениями {SUPPORTED_EXTENSIONS} (исключая временные файлы).")
+    files_to_process = sorted(processed_paths)
+    print(f"Найдено {len(files_to_process)} файлов с расширениями {', '.join(sorted(SUPPORTED_EXTENSIONS))} (исключая временные файлы).")
     return files_to_process
 
 
+def _count_docx_chars(file_path):
+    """Считает символы в узлах <w:t> основного текста DOCX потоковым разбором, без загрузки документа целиком."""
+    total_chars = 0
+    with zipfile.ZipFile(file_path) as docx_zip, docx_zip.open('word/document.xml') as xml_stream:
+        for _, text_element in etree.iterparse(xml_stream, events=('end',), tag=W_TEXT_TAG, huge_tree=True):
+            if text_element.text:
+                total_chars += len(text_element.text)
+            text_element.clear()
+    return total_chars
+
+
+def _estimate_file_chars(file_path):
+    """Возвращает количество символов файла: точное для DOCX, грубую оценку по размеру для PDF. None при ошибке."""
+    try:
+        if file_path.suffix.lower() == '.docx':
+            try:
+                return _count_docx_chars(file_path)
+            except (zipfile.BadZipFile, KeyError, etree.XMLSyntaxError):
+                pass  # Поврежденный DOCX - используем оценку по размеру
+
+        # Грубая оценка: размер файла * коэффициент (очень грубо)
+        file_size = file_path.stat().st_size
+        if file_path.suffix.lower() == '.docx':
+            return int(file_size * 0.5)
+        elif file_path.suffix.lower() == '.pdf':
+            return int(file_size * 0.3)
+        return int(file_size * 0.4)
+    except Exception:
+        return None
+
+
 def estimate_translation_cost(file_paths):
-    """Оценивает примерную стоимость перевода файлов"""
+    """Оценивает стоимость перевода файлов: для DOCX по реальному количеству символов, для PDF по размеру"""
     total_chars = 0
     file_estimates = []
 
     print("\n📊 Оценка стоимости перевода...")
     print("-" * 60)
 
-    for file_path in file_paths[:10]:  # Показываем первые 10 файлов
-        try:
-            # Грубая оценка: ~2000 символов на страницу для DOCX, ~3000 для PDF
-            file_size = file_path.stat().st_size
-
-            if file_path.suffix.lower() == '.docx':
-                # Примерная оценка: размер файла * 0.5 (очень грубо)
-                estimated_chars = int(file_size * 0.5)
-            elif file_path.suffix.lower() == '.pdf':
-                # Примерная оценка: размер файла * 0.3 Translate_politics (очень грубо)
-                estimated_chars = int(file_size * 0.3)
-            else:
-                estimated_chars = int(file_size * 0.4)
-
+    # Чтение архивов - в основном ввод-вывод и распаковка, поэтому считаем файлы параллельно
+    with ThreadPoolExecutor(max_workers=ESTIMATE_MAX_WORKERS) as executor:
+        for file_path, estimated_chars in zip(file_paths, executor.map(_estimate_file_chars, file_paths)):
+            if estimated_chars is None:
+                continue
             total_chars += estimated_chars
             file_estimates.append((file_path.name, estimated_chars))
 
-        except Exception:
-            continue
-
-    # Экстраполируем на все файлы, если их больше 10
-    if len(file_paths) > 10:
-        avg_chars = total_chars / min(10, len(file_paths))
-        total_chars = int(avg_chars * len(file_paths))
-        print(f"Анализ первых 10 файлов из {len(file_paths)}...")
-
     # Расчет стоимости
     PRICE_PER_MILLION = 20.00  # EUR
     millions = total_chars / 1_000_000
@@ -306,16 +545,98 @@ def estimate_translation_cost(file_paths):
 
     print(f"\n💰 ОЦЕНКА СТОИМОСТИ:")
     print(f"  • Файлов для перевода: {len(file_paths)}")
-    print(f"  • Примерное количество символов: {total_chars:,}")
+    print(f"  • Количество символов: {total_chars:,}")
     print(f"  • Тариф: €{PRICE_PER_MILLION:.2f} за 1 млн символов")
     print(f"  • ПРИМЕРНАЯ СТОИМОСТЬ: €{estimated_cost:.2f}")
     print("-" * 60)
-    print("⚠️  Это грубая оценка. Реальная стоимость зависит от")
-    print("   фактического содержания документов.")
+    print("⚠️  Для DOCX учитывается текст основной части документа,")
+    print("   для PDF используется грубая оценка по размеру файла.")
 
     return total_chars, estimated_cost
 
 
+@contextmanager
+def atomic_write_path(target_path):
+    """
+    Выдает путь временного файла рядом с target_path. После успешной записи атомарно
+    подменяет им целевой файл (os.replace), при ошибке удаляет временный файл - исходный файл не повреждается.
+    """
+    target_path = Path(target_path)
+    tmp_path = target_path.with_name(target_path.name + '.tmp')
+    try:
+        yield tmp_path
+        os.replace(tmp_path, target_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def _fix_eqn_placeholders_in_paragraph(paragraph):
+    """
+    Исправляет плейсхолдеры в узлах <w:t> одного параграфа <w:p>. Возвращает количество исправлений.
+    Совпадения ищутся по тексту всего параграфа (плейсхолдер может быть разорван между runs):
+    исправление пишется в узел, где совпадение начинается, его остаток удаляется из следующих узлов.
+    Остальной текст остается в своих узлах - форматирование runs и положение табуляций сохраняются.
+    """
+    # Узлы вложенных параграфов (надписи) обрабатываются вместе со своим параграфом
+    text_nodes = [node for node in paragraph.iter(W_TEXT_TAG)
+                  if next(node.iterancestors(W_PARAGRAPH_TAG)) is paragraph]
+    node_texts = [node.text or '' for node in text_nodes]
+    text = ''.join(node_texts)
+    # Быстрая проверка для оптимизации - ищем хотя бы начало плейсхолдера
+    if '<<Eqn' not in text:
+        return 0
+
+    node_starts = list(itertools.accumulate((len(t) for t in node_texts[:-1]), initial=0))
+    pieces = [[] for _ in text_nodes]
+
+    def keep(start, end):
+        """Раскладывает неизмененный текст [start, end) по узлам, в которых он был"""
+        i = bisect_right(node_starts, start) - 1
+        while start < end:
+            node_end = node_starts[i] + len(node_texts[i])
+            if start < node_end:
+                pieces[i].append(text[start:min(end, node_end)])
+                start = min(end, node_end)
+            i += 1
+
+    changes_made = 0
+    position = 0
+    for match in EQN_PLACEHOLDER_PATTERN.finditer(text):
+        replacement = match.expand(EQN_PLACEHOLDER_REPLACEMENT)
+        # Совпадение может дать тот же текст (например, "<<Eqn1.eps>>)") - такой текст не переносим
+        if replacement == match.group():
+            continue
+        keep(position, match.start())
+        pieces[bisect_right(node_starts, match.start()) - 1].append(replacement)
+        position = match.end()
+        changes_made += 1
+    if not changes_made:
+        return 0
+    keep(position, len(text))
+
+    for node, old_text, node_pieces in zip(text_nodes, node_texts, pieces):
+        new_text = ''.join(node_pieces)
+        if new_text != old_text:
+            node.text = new_text
+            if new_text != new_text.strip():
+                node.set(XML_SPACE_ATTR, 'preserve')
+    return changes_made
+
+
+def _fix_eqn_placeholders_in_xml(xml_stream):
+    """
+    Потоково разбирает XML части DOCX и исправляет плейсхолдеры по параграфам <w:p>.
+    Возвращает (корневой элемент, количество исправлений).
+    Узлы не очищаются: если часть изменилась, ее нужно сериализовать целиком.
+    """
+    changes_made = 0
+    context = etree.iterparse(xml_stream, events=('end',), tag=W_PARAGRAPH_TAG, huge_tree=True)
+    for _, paragraph in context:
+        changes_made += _fix_eqn_placeholders_in_paragraph(paragraph)
+    return context.root, changes_made
+
+
 def clean_translated_docx(docx_path):
     """
     Открывает переведенный DOCX и исправляет искаженные плейсхолдеры
@@ -328,77 +649,32 @@ def clean_translated_docx(docx_path):
             print(f"  -> ОШИБКА Пост-обработки: Файл не найден {docx_path}")
             return False
 
-        document = Document(docx_path)
         changes_made = 0  # Счетчик изменений для логирования
-
-        # УЛУЧШЕННОЕ РЕГУЛЯРНОЕ ВЫРАЖЕНИЕ v3:
-        pattern = re.compile(
-            r'(<<Eqn(\d+))'  # Группа 1: <<Eqn<цифры>, Группа 2: только цифры
-            r'(?!'  # Начало негативного просмотра вперед (убеждаемся, что ДАЛЬШЕ НЕ...)
-            r'\.eps>>'  # ...ровно ".eps>>"
-            r'([,\s]|$)'  # ...за которым идет запятая, пробел или конец строки/параграфа
-            r')'  # Конец негативного просмотра
-            r'([\.\w>]+)?'  # Группа 3 Translate_politics (опциональная): Захватываем сам "мусор" - точки, буквы(eps), >.
-        )
-
-        # Строка для замены: Восстанавливаем правильный формат, используя Группу 2 (цифры)
-        replacement_pattern = r'<<Eqn\2.eps>>'
-
-        # Вспомогательная функция для обработки параграфа
-        def process_paragraph(para: Paragraph):
-            nonlocal changes_made
-            # Быстрая проверка для оптимизации - ищем хотя бы начало плейсхолдера
-            if '<<Eqn' not in para.text:
-                return False
-
-            original_text = para.text
-            # Применяем замену ко всему тексту параграфа
-            new_text = pattern.sub(replacement_pattern, original_text)
-
-            if new_text != original_text:
-                # Считаем количество реальных замен (хотя бы примерно)
-                # Это не идеально точно, но дает представление
-                num_replacements = len(pattern.findall(original_text))
-                changes_made += num_replacements
-
-                # Простой способ обновления: очистить параграф и вставить новый текст
-                para.clear()  # Очищает все runs и текст
-                para.add_run(new_text)  # Добавляет новый текст одним run (может сбросить форматирование)
-
-                # Debug Log (можно раскомментировать для отладки)
-                # print(f"    Debug: Replaced in para. Orig: '{original_text}'. New: '{new_text}'")
-                return True
-            return False
-
-        # --- Основная логика обхода документа ---
-        # Итерация по параграфам в основном тексте
-        for para in document.paragraphs: process_paragraph(para)
-
-        # Итерация по таблицам
-        for table in document.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for para in cell.paragraphs: process_paragraph(para)
-
-        # Итерация по колонтитулам (если нужно)
-        for section in document.sections:
-            # Headers
-            for para in section.header.paragraphs: process_paragraph(para)
-            for table in section.header.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        for para in cell.paragraphs: process_paragraph(para)
-            # Footers
-            for para in section.footer.paragraphs: process_paragraph(para)
-            for table in section.footer.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        for para in cell.paragraphs: process_paragraph(para)
-        # --- Конец обхода ---
+        fixed_parts = {}  # Имя части архива -> исправленный XML
+
+        # Читаем DOCX как ZIP-архив: разбираем только XML основного текста и колонтитулов,
+        # не загружая весь пакет (изображения, стили и т.д.) через python-docx
+        with zipfile.ZipFile(docx_path) as source_zip:
+            for part_name in source_zip.namelist():
+                if not DOCX_TEXT_PART_PATTERN.fullmatch(part_name):
+                    continue
+                with source_zip.open(part_name) as xml_stream:
+                    root, part_changes = _fix_eqn_placeholders_in_xml(xml_stream)
+                if part_changes:
+                    fixed_parts[part_name] = etree.tostring(root, xml_declaration=True, encoding='UTF-8',
+                                                            standalone=True)
+                    changes_made += part_changes
 
         if changes_made > 0:
             print(f"  -> Пост-обработка V3: Исправлено ~{changes_made} искаженных плейсхолдеров в {docx_path.name}")
-            document.save(docx_path)  # Перезаписываем файл
+            # Пишем новый архив во временный файл (неизмененные части копируются как есть) и атомарно подменяем исходный
+            with atomic_write_path(docx_path) as tmp_path, zipfile.ZipFile(docx_path) as source_zip, \
+                    zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED) as target_zip:
+                for item in source_zip.infolist():
+                    data = fixed_parts.get(item.filename)
+                    if data is None:
+                        data = source_zip.read(item)
+                    target_zip.writestr(item, data)
         else:
             print(
                 f"  -> Пост-обработка V3: Искаженные плейсхолдеры (требующие исправления) не найдены в {docx_path.name}")
@@ -411,29 +687,177 @@ def clean_translated_docx(docx_path):
     except Exception as e:
         # Используем f-string для форматирования
         print(f"  -> КРИТИЧЕСКАЯ ОШИБКА Пост-обработки: Не удалось обработать {docx_path.name}: {e}")
-        print(traceback.format_exc())  # Для отладки
+        traceback.print_exc()  # Для отладки
         return False
 
 
+def _iter_all_paragraphs(document):
+    """
+    Один проход по всем параграфам документа: основной текст, ячейки таблиц, колонтитулы и их таблицы.
+    Колонтитулы, связанные с предыдущим разделом, пропускаются: их содержимое уже пройдено
+    (а у первого раздела такой колонтитул пуст, и обращение к нему создало бы лишнее определение).
+    """
+    def iter_container(container):
+        yield from container.paragraphs
+        for table in container.tables:
+            for row in table.rows:
+                for cell in row.cells:
+                    yield from cell.paragraphs
+
+    yield from iter_container(document)
+    for section in document.sections:
+        for container in (section.header, section.footer):
+            if not container.is_linked_to_previous:
+                yield from iter_container(container)
+
+
+def _collect_docx_runs(document):
+    """
+    Собирает все runs с непустым текстом из основного текста, таблиц и колонтитулов.
+    Объединенные ячейки таблиц возвращают один и тот же run несколько раз - такие дубли отбрасываются.
+    """
+    runs = []
+    seen_elements = set()
+    for para in _iter_all_paragraphs(document):
+        for run in para.runs:
+            if run._r in seen_elements or not run.text.strip():
+                continue
+            seen_elements.add(run._r)
+            runs.append(run)
+    return runs
+
+
+def _iter_text_batches(texts, max_items=TEXT_BATCH_MAX_ITEMS, max_bytes=TEXT_BATCH_MAX_BYTES):
+    """Жадно разбивает список строк на пакеты (start, end) с учетом лимитов DeepL по количеству и размеру."""
+    batch_start = 0
+    batch_bytes = 0
+    for i, text in enumerate(texts):
+        text_bytes = len(text.encode('utf-8'))
+        if i > batch_start and (i - batch_start >= max_items or batch_bytes + text_bytes > max_bytes):
+            yield batch_start, i
+            batch_start = i
+            batch_bytes = 0
+        batch_bytes += text_bytes
+    if batch_start < len(texts):
+        yield batch_start, len(texts)
+
+
+def translate_docx_in_place(doc_path, translator, source_lang, target_lang, glossary=None, output_path=None):
+    """
+    Переводит DOCX через текстовый API DeepL пакетами вместо загрузки документа целиком.
+    Текст каждого run заменяется переводом, поэтому форматирование runs сохраняется.
+    Сохраняет результат в output_path (или поверх doc_path). Возвращает количество переведенных runs.
+    """
+    document = Document(doc_path)
+    runs = _collect_docx_runs(document)
+    texts = [run.text for run in runs]
+
+    translation_kwargs = {
+        "source_lang": source_lang,
+        "target_lang": target_lang,
+        "preserve_formatting": True
+    }
+    if glossary:
+        translation_kwargs["glossary"] = glossary
+
+    for batch_start, batch_end in _iter_text_batches(texts):
+        results = translator.translate_text(texts[batch_start:batch_end], **translation_kwargs)
+        for run, result in zip(runs[batch_start:batch_end], results):
+            run.text = result.text
+
+    with atomic_write_path(output_path if output_path is not None else doc_path) as tmp_path:
+        document.save(str(tmp_path))
+    return len(runs)
+
+
+_postprocess_executor = None  # Пул процессов пост-обработки, создается при первом использовании
+
+
+def get_postprocess_executor():
+    """Возвращает общий пул процессов для пост-обработки DOCX."""
+    global _postprocess_executor
+    if _postprocess_executor is None:
+        _postprocess_executor = ProcessPoolExecutor(max_workers=POSTPROCESS_MAX_WORKERS)
+    return _postprocess_executor
+
+
+_document_executor = None  # Потоки ожидания и скачивания документов DeepL, создаются при первом использовании
+
+
+def get_document_executor():
+    """Возвращает общий пул потоков для ожидания перевода и скачивания документов DeepL."""
+    global _document_executor
+    if _document_executor is None:
+        _document_executor = ThreadPoolExecutor(max_workers=DOCUMENT_POLL_MAX_WORKERS)
+    return _document_executor
+
+
+def _finish_document_translation(translator, document_handle, input_path_str, output_path):
+    """
+    Ждет завершения перевода загруженного документа и скачивает результат (выполняется в фоновом потоке).
+    Возвращает итоговый словарь результата в том же формате, что и translate_single_document.
+    """
+    output_path_str = str(output_path)
+    try:
+        status = translator.translate_document_wait_until_done(document_handle)
+        if not status.ok:
+            raise deepl.DocumentTranslationException(
+                f"Ошибка при переводе документа: {status.error_message or 'неизвестная ошибка'}", document_handle)
+        with atomic_write_path(output_path) as tmp_path, open(tmp_path, 'wb') as output_file:
+            translator.translate_document_download(document_handle, output_file, chunk_size=DOWNLOAD_CHUNK_SIZE)
+        # Одна запись в stdout, чтобы строки фоновых потоков не перемешивались
+        sys.stdout.write(f"  -> Перевод '{output_path.name}' получен от DeepL.\n")
+        return {"status": "success", "input": input_path_str, "output": output_path_str}
+    except deepl.DeepLException as e:
+        error_msg = f"Ошибка перевода документа DeepL: {e}"
+        sys.stdout.write(f"  -> ОШИБКА ({Path(input_path_str).name}): {error_msg}\n")
+        return {"status": "error", "input": input_path_str, "error": error_msg,
+                "quota_exceeded": isinstance(e, deepl.QuotaExceededException),
+                "rate_limited": isinstance(e, deepl.TooManyRequestsException)}
+    except OSError as e:
+        error_msg = f"Не удалось сохранить перевод '{output_path_str}': {e}"
+        sys.stdout.write(f"  -> ОШИБКА: {error_msg}\n")
+        return {"status": "error", "input": input_path_str, "error": error_msg}
+
+
+def write_log_lines(lines):
+    """Выводит накопленные строки журнала одной записью в stdout."""
+    if lines:
+        sys.stdout.write("\n".join(lines) + "\n")
+
+
 def translate_single_document(input_path, output_path, translator, target_lang, source_lang, file_index, total_files,
-                              source_root_path, glossary=None):
-    """Translates a single document and handles errors. Includes enhanced post-processing for DOCX."""
+                              source_root_path, glossary=None, background=False, display_path=None):
+    """
+    Translates a single document and handles errors. Includes enhanced post-processing for DOCX.
+    display_path - готовый относительный путь для вывода; если не задан, вычисляется от source_root_path.
+    При background=True следующий файл можно переводить, не дожидаясь окончания работы с этим:
+    пост-обработка DOCX отправляется в пул процессов (future в ключе "post_processing_future"),
+    а документ загружается в DeepL, и ожидание перевода со скачиванием идет в фоновом потоке
+    (future с итоговым результатом в ключе "translation_future").
+    """
     # Конвертируем Path объекты в строки для DeepL API и логгирования
     input_path_str = str(input_path)
     output_path_str = str(output_path)
 
-    try:
-        relative_path_for_display = input_path.relative_to(source_root_path)
-    except ValueError:
-        relative_path_for_display = input_path
-    except Exception as e:
-        relative_path_for_display = f"Ошибка при определении пути: {input_path_str}"  # Используем str
-        print(f"Предупреждение: Не удалось определить относительный путь для отображения: {e}")
+    if display_path is not None:
+        relative_path_for_display = display_path
+    else:
+        try:
+            relative_path_for_display = input_path.relative_to(source_root_path)
+        except ValueError:
+            relative_path_for_display = input_path
+        except Exception as e:
+            relative_path_for_display = f"Ошибка при определении пути: {input_path_str}"  # Используем str
+            print(f"Предупреждение: Не удалось определить относительный путь для отображения: {e}")
 
+    # Сообщения о файле собираем и выводим одной записью в stdout до и после перевода
     # Используем имена файлов из Path объектов для большей точности
-    print(f"\n[{file_index}/{total_files}] Обработка файла: {relative_path_for_display}")
-    print(f"  Перевод '{input_path.name}' -> '{output_path.name}'...")
-    print(f"     (Языки: {source_lang} -> {target_lang})")
+    log_lines = [
+        f"\n[{file_index}/{total_files}] Обработка файла: {relative_path_for_display}",
+        f"  Перевод '{input_path.name}' -> '{output_path.name}'...",
+        f"     (Языки: {source_lang} -> {target_lang})"
+    ]
 
     post_processing_error_occurred = False  # Флаг для отслеживания ошибок пост-обработки
 
@@ -445,37 +869,81 @@ def translate_single_document(input_path, output_path, translator, target_lang,
 
         # Добавляем логирование использования глоссария
         if glossary:
-            print(f"     (Используется глоссарий: {glossary.name})")
+            log_lines.append(f"     (Используется глоссарий: {glossary.name})")
+        write_log_lines(log_lines)
+        sys.stdout.flush()
+        log_lines = []
 
         # Передаем глоссарий в функцию перевода, если он доступен
-        translation_kwargs = {
-            "input_path": input_path_str,  # DeepL требует строку
-            "output_path": output_path_str,  # DeepL требует строку
-            "target_lang": target_lang,
-            "source_lang": source_lang
-        }
-
-        if glossary:
-            translation_kwargs["glossary"] = glossary
-
-        translator.translate_document_from_filepath(**translation_kwargs)
-
-        end_time = time.time()
-        print(f"  -> УСПЕШНО переведен за {end_time - start_time:.2f} сек.")
-
-        # Добавляем паузу между запросами
-        print(f"  -> Пауза {PAUSE_BETWEEN_REQUESTS} секунды перед следующим запросом...")
-        time.sleep(PAUSE_BETWEEN_REQUESTS)
+        if input_path.suffix.lower() == '.docx':
+            # DOCX переводим пакетами через текстовый API - без загрузки документа и паузы между файлами
+            runs_count = translate_docx_in_place(input_path_str, translator, source_lang, target_lang,
+                                                 glossary=glossary, output_path=output_path_str)
+            end_time = time.time()
+            log_lines.append(
+                f"  -> УСПЕШНО переведен за {end_time - start_time:.2f} сек. (фрагментов текста: {runs_count})")
+        elif background:
+            # Загружаем документ и сразу возвращаемся: ожидание перевода на стороне DeepL и скачивание
+            # идут в фоновом потоке, пока основной цикл работает со следующим файлом
+            with open(input_path_str, 'rb') as input_file:
+                document_handle = translator.translate_document_upload(
+                    input_file, source_lang=source_lang, target_lang=target_lang, glossary=glossary,
+                    filename=input_path.name)
+            log_lines.append(f"  -> Загружен в DeepL за {time.time() - start_time:.2f} сек., перевод ожидается в фоне...")
+            write_log_lines(log_lines)
+            return {
+                "status": "success",
+                "input": input_path_str,
+                "output": output_path_str,
+                "translation_future": get_document_executor().submit(
+                    _finish_document_translation, translator, document_handle, input_path_str, output_path)
+            }
+        else:
+            translation_kwargs = {
+                "input_path": input_path_str,  # DeepL требует строку
+                "output_path": output_path_str,  # DeepL требует строку
+                "target_lang": target_lang,
+                "source_lang": source_lang
+            }
+
+            if glossary:
+                translation_kwargs["glossary"] = glossary
+
+            translator.translate_document_from_filepath(**translation_kwargs)
+
+            end_time = time.time()
+            log_lines.append(f"  -> УСПЕШНО переведен за {end_time - start_time:.2f} сек.")
+
+            # Пауза нужна, только если DeepL сигнализировал о перегрузке во время этого перевода
+            if PressureTrackingRetry.last_retry_time >= start_time:
+                log_lines.append(
+                    f"  -> DeepL перегружен, пауза {PAUSE_BETWEEN_REQUESTS} секунды перед следующим запросом...")
+                write_log_lines(log_lines)
+                sys.stdout.flush()
+                log_lines = []
+                time.sleep(PAUSE_BETWEEN_REQUESTS)
 
         # --- ИНТЕГРАЦИЯ ПОСТ-ОБРАБОТКИ ---
-        if output_path.suffix.lower() == '.docx':
-            print(f"  -> Запуск пост-обработки V3 для {output_path.name}...")
+        if output_path.suffix.lower() == '.docx' and background:
+            log_lines.append(f"  -> Пост-обработка V3 для {output_path.name} запущена в фоне...")
+            write_log_lines(log_lines)
+            return {
+                "status": "success",
+                "input": input_path_str,
+                "output": output_path_str,
+                "post_processing_future": get_postprocess_executor().submit(clean_translated_docx, output_path)
+            }
+        elif output_path.suffix.lower() == '.docx':
+            log_lines.append(f"  -> Запуск пост-обработки V3 для {output_path.name}...")
+            write_log_lines(log_lines)
             # Передаем Path объект в функцию очистки
             cleaning_successful = clean_translated_docx(output_path)
             if not cleaning_successful:
                 # Логируем предупреждение и устанавливаем флаг
                 print(f"  -> ПРЕДУПРЕЖДЕНИЕ: Пост-обработка файла {output_path.name} завершилась с ошибкой.")
                 post_processing_error_occurred = True  # Отмечаем ошибку пост-обработки
+        else:
+            write_log_lines(log_lines)
         # --- КОНЕЦ ИНТЕГРАЦИИ ---
 
         # Возвращаем статус и пути. Добавляем информацию об ошибке пост-обработки.
@@ -520,9 +988,42 @@ def translate_single_document(input_path, output_path, translator, target_lang,
         # Перехват других непредвиденных ошибок (включая возможные ошибки при вызове clean_translated_docx)
         error_msg = f"Непредвиденная ошибка при обработке файла '{input_path_str}': {e}"
         print(f"  -> КРИТИЧЕСКАЯ ОШИБКА: {error_msg}")
-        print(traceback.format_exc())
+        traceback.print_exc()
+        # Храним само исключение без стека вызовов: кадры не удерживаются в памяти до конца пакета,
+        # а текст формируется только при записи итогового журнала ошибок
+        e.__traceback__ = None
         return {"status": "error", "input": input_path_str, "output": output_path_str,
-                "error": f"{error_msg}\n{traceback.format_exc()}"}
+                "error": error_msg, "exception": e}
+
+
+def write_error_log(error_details, log_path):
+    """Записывает подробности ошибок и предупреждений пакетного перевода в файл журнала."""
+    with open(log_path, 'w', encoding='utf-8') as log_file:
+        for i, err_info in enumerate(error_details, 1):
+            log_file.write(f"{i}. [{err_info.get('status', 'error')}] {err_info.get('file', 'Неизвестный файл')}\n")
+            log_file.write(f"   {err_info.get('error', 'Нет деталей')}\n")
+            exception = err_info.get('exception')
+            if exception is not None:
+                log_file.writelines(
+                    f"   {line}" for line in traceback.format_exception_only(type(exception), exception))
+            log_file.write("\n")
+
+
+def write_error_report(error_details, report_path):
+    """Сохраняет ошибки и предупреждения пакетного перевода в JSON для автоматической обработки."""
+    report = []
+    for err_info in error_details:
+        exception = err_info.get('exception')
+        report.append({
+            "status": err_info.get('status', 'error'),
+            "file": str(err_info.get('file', '')),
+            "output": err_info.get('output'),
+            "error": str(err_info.get('error', '')),
+            "exception": "".join(traceback.format_exception_only(type(exception), exception)).strip()
+            if exception is not None else None
+        })
+    with open(report_path, 'wb') as report_file:
+        report_file.write(dump_json(report))
 
 
 def process_translations(translator, file_paths, source_root_path, target_root_path, source_lang, target_lang,
@@ -539,60 +1040,120 @@ def process_translations(translator, file_paths, source_root_path, target_root_p
 
     actual_suffix = suffix_pattern.format(target_lang_code=target_lang.lower().replace("-", "_"))
 
-    # Всегда используем 1 поток для последовательной обработки
-    max_workers = 1
     processing_mode = "ПОСЛЕДОВАТЕЛЬНОЙ"
 
     print(f"\nЗапуск {processing_mode} обработки {total_files} файлов...")
     print("-" * 30)
 
-    executor = ThreadPoolExecutor(max_workers=max_workers)
-    future_to_path_obj = {}  # Храним Path объекты
-    files_submitted = 0
-
-    for i, input_path_obj in enumerate(file_paths):  # Используем Path объект
-        if stop_processing:
+    pending_results = []  # Результаты, работа над которыми еще идет в фоне (перевод документа или пост-обработка)
+    documents_in_flight = []  # Документы, загруженные в DeepL и еще не скачанные
+
+    def tally_result(result, input_filename_str):
+        """Учитывает итоговый результат файла в счетчиках и списке ошибок."""
+        nonlocal success_count, success_with_warnings, error_count, stop_processing
+        if result['status'] == "success":
+            success_count += 1
+        elif result['status'] == "success_with_postprocessing_error":
+            # Успешный перевод, но проблема с очисткой
+            success_with_warnings += 1
+            # Добавляем информацию об ошибке пост-обработки в общий список ошибок
+            errors_list.append({
+                "status": "warning",  # Используем статус warning
+                "file": result.get('input', input_filename_str),
+                "output": result.get('output'),
+                "error": f"Ошибка пост-обработки файла {Path(result.get('output', '')).name}"
+            })
+        elif result['status'] == "error":
+            # Ошибка перевода или другая критическая ошибка
+            error_count += 1
+            # Убедимся, что ключ 'file' есть в словаре ошибки для отчета
+            if 'file' not in result: result['file'] = result.get('input', input_filename_str)
+            errors_list.append(result)
+            # Проверяем на критические ошибки API для остановки
+            if (result.get("quota_exceeded") or result.get("rate_limited")) and not stop_processing:
+                print("\n*** Обнаружено превышение квоты или лимита запросов DeepL. ***")
+                print("*** Оставшиеся файлы не будут отправляться на перевод. ***")
+                stop_processing = True
+        else:
+            # Непредвиденный статус
             print(
-                f"\n[{i + 1}/{total_files}] Пропуск отправки файла {input_path_obj.name} из-за критической ошибки API.")
-            continue
+                f"Предупреждение: Неизвестный статус результата '{result.get('status')}' для файла {input_filename_str}")
+            error_count += 1  # Считаем как ошибку
+            errors_list.append({"status": "error", "file": input_filename_str,
+                                "error": f"Неизвестный статус результата: {result.get('status')}"})
+
+    def resolve_pending_result(result):
+        """Дожидается фоновой работы над файлом и возвращает его итоговый результат."""
+        if result.get('translation_future') is not None:
+            try:
+                return result['translation_future'].result()
+            except Exception as exc:
+                return {"status": "error", "input": result['input'], "error": f"Ошибка фонового перевода: {exc}"}
 
-        file_index = i + 1
         try:
-            relative_path_for_target = input_path_obj.relative_to(source_root_path)
-            output_path_obj = target_root_path / relative_path_for_target.with_name(
-                f"{input_path_obj.stem}{actual_suffix}{input_path_obj.suffix}")
-        except Exception as e:
+            cleaning_successful = result['post_processing_future'].result()
+        except Exception as exc:
+            print(f"  -> ПРЕДУПРЕЖДЕНИЕ: Пост-обработка файла {Path(result['output']).name} завершилась с ошибкой: {exc}")
+            cleaning_successful = False
+        return {
+            "status": "success" if cleaning_successful else "success_with_postprocessing_error",
+            "input": result['input'],
+            "output": result['output']
+        }
+
+    # --- Предварительный проход: выходные пути и проверки пропуска до начала перевода ---
+    # Относительные пути считаем срезом строки: пути файлов уже разрешены, relative_to здесь лишний
+    source_root_prefix = str(source_root_path) + os.sep
+    planned_files = []  # (номер файла, входной Path, выходной Path, относительный путь для вывода)
+    for i, input_path_obj in enumerate(file_paths):  # Используем Path объект
+        file_index = i + 1
+        input_path_str = str(input_path_obj)
+        if not input_path_str.startswith(source_root_prefix):
             print(
-                f"\n[{file_index}/{total_files}] Ошибка при расчете выходного пути для {input_path_obj.name}: {e}. Пропуск файла.")
+                f"\n[{file_index}/{total_files}] Ошибка при расчете выходного пути для {input_path_obj.name}: "
+                f"файл вне папки {source_root_path}. Пропуск файла.")
             error_count += 1
             # Добавляем детали ошибки
-            errors_list.append(
-                {"status": "error", "file": str(input_path_obj), "error": f"Ошибка при расчете выходного пути: {e}"})
+            errors_list.append({"status": "error", "file": input_path_str,
+                                "error": f"Ошибка при расчете выходного пути: файл вне папки {source_root_path}"})
             continue
+        relative_path_str = input_path_str[len(source_root_prefix):]
 
         # --- Skip Checks ---
         if input_path_obj.stem.endswith(actual_suffix):
-            try:
-                display_path = input_path_obj.relative_to(source_root_path)
-            except ValueError:
-                display_path = input_path_obj.name
-            print(f"\n[{file_index}/{total_files}] Пропуск (файл уже имеет суффикс '{actual_suffix}'): {display_path}")
+            print(f"\n[{file_index}/{total_files}] Пропуск (файл уже имеет суффикс '{actual_suffix}'): {relative_path_str}")
             skipped_suffix_count += 1
             continue
 
-        if output_path_obj.exists():
-            try:
-                display_path = output_path_obj.relative_to(target_root_path)
-            except ValueError:
-                display_path = output_path_obj.name
+        output_relative_str = os.path.join(os.path.dirname(relative_path_str),
+                                           f"{input_path_obj.stem}{actual_suffix}{input_path_obj.suffix}")
+        planned_files.append((file_index, input_path_obj, target_root_path / output_relative_str, relative_path_str))
+
+    # Проверки существования выходных файлов - независимые stat-вызовы, выполняем их пакетом в пуле потоков
+    with ThreadPoolExecutor(max_workers=PREFLIGHT_MAX_WORKERS) as executor:
+        output_exists_flags = list(executor.map(lambda planned: planned[2].exists(), planned_files))
+
+    files_to_translate = []
+    for planned, output_exists in zip(planned_files, output_exists_flags):
+        file_index, input_path_obj, output_path_obj, relative_path_str = planned
+        if output_exists:
+            display_path = os.path.join(os.path.dirname(relative_path_str), output_path_obj.name)
             print(f"\n[{file_index}/{total_files}] Пропуск (переведенный файл уже существует): {display_path}")
             skipped_exists_count += 1
             continue
-        # --- End Skip Checks ---
+        files_to_translate.append(planned)
+    # --- End Skip Checks ---
 
-        # Submit the translation task
-        future = executor.submit(
-            translate_single_document,
+    print(f"\nК переводу: {len(files_to_translate)} из {total_files} файлов.")
+
+    for file_index, input_path_obj, output_path_obj, relative_path_str in files_to_translate:
+        if stop_processing:
+            print(
+                f"\n[{file_index}/{total_files}] Пропуск отправки файла {input_path_obj.name} из-за критической ошибки API.")
+            continue
+
+        # Переводим файл напрямую: перевод всегда последовательный, пул потоков здесь не нужен
+        result = translate_single_document(
             input_path_obj,  # Передаем Path
             output_path_obj,  # Передаем Path
             translator,
@@ -601,65 +1162,29 @@ def process_translations(translator, file_paths, source_root_path, target_root_p
             file_index,
             total_files,
             source_root_path,  # Path
-            glossary  # Передаем глоссарий
+            glossary,  # Передаем глоссарий
+            True,  # Пост-обработка DOCX и ожидание перевода документов в фоне, параллельно со следующими файлами
+            relative_path_str  # Готовый относительный путь для вывода
         )
-        future_to_path_obj[future] = input_path_obj  # Храним Path объект
-        files_submitted += 1
-
-    print(f"\nОтправлено {files_submitted} заданий на перевод. Ожидание завершения...")
-
-    # --- Сбор результатов ---
-    try:
-        for future in as_completed(future_to_path_obj):
-            input_path_obj = future_to_path_obj[future]
-            input_filename_str = str(input_path_obj)  # Строка для логов
-            try:
-                result = future.result()  # Получаем результат из потока
-
-                if result['status'] == "success":
-                    success_count += 1
-                elif result['status'] == "success_with_postprocessing_error":
-                    # Успешный перевод, но проблема с очисткой
-                    success_with_warnings += 1
-                    # Добавляем информацию об ошибке пост-обработки в общий список ошибок
-                    errors_list.append({
-                        "status": "warning",  # Используем статус warning
-                        "file": result.get('input', input_filename_str),
-                        "output": result.get('output'),
-                        "error": f"Ошибка пост-обработки файла {Path(result.get('output', '')).name}"
-                    })
-                elif result['status'] == "error":
-                    # Ошибка перевода или другая критическая ошибка
-                    error_count += 1
-                    # Убедимся, что ключ 'file' есть в словаре ошибки для отчета
-                    if 'file' not in result: result['file'] = result.get('input', input_filename_str)
-                    errors_list.append(result)
-                    # Проверяем на критические ошибки API для остановки
-                    if result.get("quota_exceeded") or result.get("rate_limited"):
-                        if not stop_processing:
-                            print("\n*** Обнаружено превышение квоты или лимита запросов DeepL. ***")
-                            print("*** Новые задания не будут отправляться. Дождитесь завершения текущих. ***")
-                        stop_processing = True
-                else:
-                    # Непредвиденный статус
-                    print(
-                        f"Предупреждение: Неизвестный статус результата '{result.get('status')}' для файла {input_filename_str}")
-                    error_count += 1  # Считаем как ошибку
-                    errors_list.append({"status": "error", "file": input_filename_str,
-                                        "error": f"Неизвестный статус результата: {result.get('status')}"})
-
+        if result.get('translation_future') is not None:
+            # Документ переводится на стороне DeepL - ограничиваем число одновременно ожидающих документов
+            documents_in_flight.append(result)
+            pending_results.append(result)
+            while len(documents_in_flight) > DOCUMENT_POLL_MAX_WORKERS:
+                oldest = documents_in_flight.pop(0)
+                pending_results.remove(oldest)
+                tally_result(resolve_pending_result(oldest), oldest['input'])
+        elif result.get('post_processing_future') is not None:
+            # Перевод готов, итог пост-обработки учитываем после ее завершения
+            pending_results.append(result)
+        else:
+            tally_result(result, str(input_path_obj))
 
-            except Exception as exc:
-                # Ошибка получения результата из самого future (редко)
-                error_count += 1
-                error_msg = f"Критическая ошибка при получении результата для файла '{input_filename_str}': {exc}"
-                print(f"  -> КРИТИЧЕСКАЯ ОШИБКА ПОТОКА: {error_msg}")
-                print(traceback.format_exc())
-                errors_list.append(
-                    {"status": "error", "file": input_filename_str, "error": f"{error_msg}\n{traceback.format_exc()}"})
-    finally:
-        # Гарантированно закрываем пул потоков
-        executor.shutdown(wait=True)
+    # --- Ожидание фоновых переводов документов и пост-обработки DOCX ---
+    if pending_results:
+        print(f"\nОжидание завершения фоновой обработки {len(pending_results)} файлов...")
+    for result in pending_results:
+        tally_result(resolve_pending_result(result), result['input'])
 
     print("-" * 30)
     print("Обработка завершена.")
@@ -681,7 +1206,7 @@ def handle_single_file(translator):
             break
         else:
             print(f"Ошибка: Файл не найден или не поддерживается.")
-            print(f"Поддерживаемые форматы: {', '.join(SUPPORTED_EXTENSIONS)}")
+            print(f"Поддерживаемые форматы: {', '.join(sorted(SUPPORTED_EXTENSIONS))}")
 
     # 2. Запрашиваем направление перевода
     source_lang, target_lang = get_translation_direction()
@@ -737,6 +1262,37 @@ def handle_single_file(translator):
     print("=" * 50)
 
 
+def _scan_directory(directory):
+    """Читает одну папку через os.scandir. Возвращает (DirEntry не-папок, пути подпапок)."""
+    files = []
+    subdirs = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                else:
+                    files.append(entry)
+    except OSError as e:
+        print(f"Предупреждение: Не удалось прочитать папку '{directory}': {e}. Пропуск.")
+    return files, subdirs
+
+
+def _scandir_recursive(path):
+    """
+    Рекурсивно обходит папку и возвращает DirEntry всех не-папок.
+    Папки читаются параллельно в пуле потоков: на сетевых дисках (NFS/SMB) задержки scandir/stat перекрываются.
+    """
+    with ThreadPoolExecutor(max_workers=SCANDIR_MAX_WORKERS) as executor:
+        pending = {executor.submit(_scan_directory, str(path))}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                pending.update(executor.submit(_scan_directory, subdir) for subdir in subdirs)
+                yield from files
+
+
 def find_largest_files():
     """Найти 10 самых больших файлов по количеству символов"""
     print("\n--- Поиск 10 самых больших файлов ---")
@@ -756,91 +1312,84 @@ def find_largest_files():
     print(f"\nПоиск файлов в: {search_path}")
     print("Анализ размеров файлов...")
     
-    # Собираем информацию о файлах
-    file_data = []
+    # Держим только 10 самых больших файлов (min-heap), а не список всех найденных
+    top_heap = []
+    analyzed_files = 0
     total_files = 0
     errors = 0
     
-    # Поддерживаемые расширения для анализа
-    extensions_to_check = ['.docx', '.pdf', '.txt', '.doc', '.rtf', '.odt']
-    
-    for ext in extensions_to_check:
-        pattern = f"*{ext}"
-        for file_path in search_path.rglob(pattern):
-            total_files += 1
-            try:
-                if file_path.is_file() and not file_path.name.startswith('~$'):
-                    # Получаем размер файла
-                    file_size = file_path.stat().st_size
-                    
-                    # Оценка количества символов по типу файла
-                    if ext in ['.txt']:
-                        # Для текстовых файлов - примерно равно размеру
-                        estimated_chars = file_size
-                    elif ext in ['.docx', '.doc', '.odt']:
-                        # Для документов Word - примерная оценка
-                        estimated_chars = int(file_size * 0.7)
-                    elif ext in ['.pdf']:
-                        # Для PDF - очень грубая оценка
-                        estimated_chars = int(file_size * 0.4)
-                    elif ext in ['.rtf']:
-                        # Для RTF - содержит много разметки
-                        estimated_chars = int(file_size * 0.3)
-                    else:
-                        estimated_chars = int(file_size * 0.5)
-                    
-                    file_data.append({
-                        'path': file_path,
-                        'size': file_size,
-                        'chars': estimated_chars,
-                        'type': ext
-                    })
-            except Exception as e:
-                errors += 1
-                print(f"Ошибка при анализе файла {file_path.name}: {e}")
+    # Один проход по дереву вместо отдельного rglob для каждого расширения
+    for entry in _scandir_recursive(search_path):
+        ext_match = LARGEST_FILES_EXT_PATTERN.search(entry.name)
+        if not ext_match:
+            continue
+        ext = '.' + ext_match.group(1).lower()
+        total_files += 1
+        try:
+            if entry.name.startswith('~$'):
+                continue
+            # Один stat на файл: для обычных файлов lstat, для ссылок - stat цели.
+            # Тип берем из уже полученного st_mode, без отдельного вызова is_file()
+            file_stat = entry.stat(follow_symlinks=entry.is_symlink())
+            if stat.S_ISREG(file_stat.st_mode):
+                file_size = file_stat.st_size
+                
+                # Оценка количества символов по типу файла
+                ratio = LARGEST_FILES_CHAR_RATIOS.get(ext, LARGEST_FILES_DEFAULT_RATIO)
+                estimated_chars = file_size if ratio == 1.0 else int(file_size * ratio)
+                
+                # Кортеж (символы, размер, путь, тип): символы первыми, чтобы кортежи сравнивались по ним.
+                # Путь храним строкой - Path строится только для файлов, попавших в топ-10
+                file_item = (estimated_chars, file_size, entry.path, ext)
+                analyzed_files += 1
+                if len(top_heap) < 10:
+                    heapq.heappush(top_heap, file_item)
+                else:
+                    heapq.heappushpop(top_heap, file_item)
+        except Exception as e:
+            errors += 1
+            print(f"Ошибка при анализе файла {entry.name}: {e}")
     
-    if not file_data:
+    if not top_heap:
         print(f"\nНе найдено файлов для анализа в указанной папке.")
-        print(f"Поддерживаемые форматы: {', '.join(extensions_to_check)}")
+        print(f"Поддерживаемые форматы: {', '.join(LARGEST_FILES_CHAR_RATIOS)}")
         return
     
-    # Сортируем по количеству символов (убывание)
-    file_data.sort(key=lambda x: x['chars'], reverse=True)
-    
-    # Берем топ-10
-    top_files = file_data[:10]
+    # Топ-10 по количеству символов (убывание)
+    top_files = sorted(top_heap, reverse=True)
     
     print(f"\n{'=' * 80}")
     print(f"ТОП-10 САМЫХ БОЛЬШИХ ФАЙЛОВ ПО КОЛИЧЕСТВУ СИМВОЛОВ")
     print(f"{'=' * 80}")
-    print(f"Всего проанализировано файлов: {len(file_data)}")
+    print(f"Всего проанализировано файлов: {analyzed_files}")
     if errors > 0:
         print(f"Ошибок при анализе: {errors}")
     print(f"{'=' * 80}")
     
-    for idx, file_info in enumerate(top_files, 1):
+    for idx, (chars, size, file_path_str, ext) in enumerate(top_files, 1):
+        file_path = Path(file_path_str)
         try:
             # Относительный путь для удобства
-            rel_path = file_info['path'].relative_to(search_path)
+            rel_path = file_path.relative_to(search_path)
         except ValueError:
-            rel_path = file_info['path'].name
+            rel_path = file_path.name
         
         # Форматирование размеров
-        size_mb = file_info['size'] / (1024 * 1024)
-        chars_millions = file_info['chars'] / 1_000_000
+        size_mb = size / (1024 * 1024)
+        chars_millions = chars / 1_000_000
         
         print(f"\n{idx}. {rel_path}")
-        print(f"   Тип: {file_info['type']}")
-        print(f"   Размер файла: {size_mb:.2f} MB ({file_info['size']:,} байт)")
-        print(f"   Примерное кол-во символов: {file_info['chars']:,} (~{chars_millions:.2f} млн)")
+        print(f"   Тип: {ext}")
+        print(f"   Размер файла: {size_mb:.2f} MB ({size:,} байт)")
+        print(f"   Примерное кол-во символов: {chars:,} (~{chars_millions:.2f} млн)")
         
         # Оценка стоимости перевода для этого файла
         cost_per_file = chars_millions * 20.00  # €20 за миллион
         print(f"   Примерная стоимость перевода: €{cost_per_file:.2f}")
     
     # Общая статистика по топ-10
-    total_chars = sum(f['chars'] for f in top_files)
-    total_size = sum(f['size'] for f in top_files)
+    total_chars = sum(file_info[0] for file_info in top_files)
+    total_size = sum(file_info[1] for file_info in top_files)
     total_cost = (total_chars / 1_000_000) * 20.00
     
     print(f"\n{'=' * 80}")
@@ -955,7 +1504,7 @@ def handle_folder_translation(translator):
     found_count = len(files_to_translate)
     processed_total = success + warnings + skipped_suffix + skipped_exists + errors
 
-    print(f"Всего найдено файлов ({', '.join(SUPPORTED_EXTENSIONS)}): {found_count}")
+    print(f"Всего найдено файлов ({', '.join(sorted(SUPPORTED_EXTENSIONS))}): {found_count}")
     print(f"Всего обработано (включая пропущенные): {processed_total}")
     print(f"  Успешно переведено и очищено (если DOCX): {success}")
     print(f"  Успешно переведено, но с ошибкой пост-обработки (DOCX): {warnings}")
@@ -981,11 +1530,19 @@ def handle_folder_translation(translator):
                 prefix = "Предупреждение"
 
             error_message_full = str(err_info.get('error', 'Нет деталей'))
-            error_message_short = error_message_full.splitlines()[0]
+            error_message_short = error_message_full.partition('\n')[0]
 
             print(f"  {i + 1}. Файл: {file_display_name}")
             print(f"     {prefix}: {error_message_short}")
 
+        error_log_path = target_root_path / ERROR_LOG_NAME
+        try:
+            write_error_log(error_details, error_log_path)
+            write_error_report(error_details, target_root_path / ERROR_REPORT_NAME)
+            print(f"\nПодробный журнал ошибок: {error_log_path}")
+        except OSError as e:
+            print(f"\nНе удалось записать журнал ошибок: {e}")
+
     print(f"\nПереведенные файлы сохранены в: {target_root_path}")
     print("-" * 30)
 
@@ -1000,10 +1557,12 @@ if __name__ == "__main__":
 
     # Проверяем API ключ
     check_api_key_placeholder()
-    translator = initialize_translator(DEEPL_API_KEY)
+    # В автоматическом режиме вывод никто не читает - пропускаем проверку лимитов и баннеры
+    automatic_mode = bool(args.no_interactive and args.input)
+    translator = initialize_translator(DEEPL_API_KEY, quiet=automatic_mode)
 
     # Проверяем, запущен ли скрипт в автоматическом режиме
-    if args.no_interactive and args.input:
+    if automatic_mode:
         # === АВТОМАТИЧЕСКИЙ РЕЖИМ ===
         input_path = Path(args.input)
 
@@ -1011,9 +1570,9 @@ if __name__ == "__main__":
             print(f"❌ Ошибка: Файл не найден: {input_path}")
             sys.exit(1)
 
-        if not input_path.suffix.lower() in SUPPORTED_EXTENSIONS:
+        if input_path.suffix.lower() not in SUPPORTED_EXTENSIONS:
             print(f"❌ Ошибка: Неподдерживаемый формат файла: {input_path.suffix}")
-            print(f"Поддерживаемые форматы: {', '.join(SUPPORTED_EXTENSIONS)}")
+            print(f"Поддерживаемые форматы: {', '.join(sorted(SUPPORTED_EXTENSIONS))}")
             sys.exit(1)
 
         # Определяем выходной файл
@@ -1029,7 +1588,7 @@ if __name__ == "__main__":
         print(f"Направление: {args.source} -> {args.target}")
 
         # Получаем глоссарий если применимо
-        glossary = get_or_create_glossary(translator, args.source, args.target)
+        glossary = get_or_create_glossary(translator, args.source, args.target, quiet=True)
 
         # Выполняем перевод
         result = translate_single_document(
@@ -10,7 +10,18 @@ EQN RESTORATION BATCH - FIXED VERSION V2
 4. Правильное восстановление последовательности после исправления
 """
 
+import os
 import sys
+import html
+import io
+import itertools
+import shutil
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from typing import NamedTuple
+import zipfile
 from pathlib import Path
 import re
 from datetime import datetime
@@ -18,12 +29,149 @@ import json
 
 try:
     from docx import Document
+    from lxml import etree
 except ImportError:
     print("Ошибка: Необходима библиотека python-docx.")
     print("Установите: pip install python-docx")
     sys.exit(1)
 
 
+# Текст документа читается прямо из XML внутри DOCX-архива, без объектной модели python-docx
+DOCX_TEXT_RE = re.compile(rb'<w:t(?:\s[^>]*)?>([^<]*)</w:t>|</w:p>')
+DOCX_HEADER_FOOTER_RE = re.compile(r'word/(header|footer)\d*\.xml')
+# Узлы WordprocessingML, по которым идет замена плейсхолдеров в тексте
+W_NAMESPACE = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+W_PARAGRAPH_TAG = f'{{{W_NAMESPACE}}}p'
+W_TEXT_TAG = f'{{{W_NAMESPACE}}}t'
+XML_SPACE_ATTR = '{http://www.w3.org/XML/1998/namespace}space'
+
+# Суффиксы перевода в конце имени файла (без расширения) и в конце имени папки
+TRANSLATED_NAME_SUFFIX_RE = re.compile(r'(?:_translated_en[-_]us|_to_en[-_]us|_en|_EN)$')
+TRANSLATED_FOLDER_SUFFIX_RE = re.compile(r'(?:_to_en_us|_en|_EN|_translated)$')
+
+RESTORE_MAX_WORKERS = os.cpu_count() or 1  # Процессы для параллельной обработки пар документов
+INPUT_STRIP_CHARS = ' \t\r\n"\''  # Пробелы и кавычки вокруг введенного пути снимаются одним strip
+RESULTS_RECORDS_NAME = '_results.jsonl'  # Построчные записи о каждом файле пакета (в папке результатов)
+
+
+def _docx_text_part_names(names):
+    """Части DOCX с текстом в порядке _fast_docx_text: документ, затем все header, затем все footer"""
+    headers_footers = [name for name in names if DOCX_HEADER_FOOTER_RE.fullmatch(name)]
+    headers_footers.sort(key=lambda name: (not name.startswith('word/header'), name))
+    return ['word/document.xml'] + headers_footers
+
+
+def _fast_docx_text(docx_source):
+    """
+    Быстро извлекает текст DOCX: основной текст (включая таблицы), затем верхние и нижние колонтитулы.
+    docx_source - путь к файлу или файловый объект. Параграфы разделяются переводом строки.
+    """
+    with zipfile.ZipFile(docx_source) as docx_zip:
+        parts = []
+        # Детерминированный порядок: документ, затем все header, затем все footer
+        for part_name in _docx_text_part_names(docx_zip.namelist()):
+            xml_data = docx_zip.read(part_name)
+            for match in DOCX_TEXT_RE.finditer(xml_data):
+                text = match.group(1)
+                parts.append(b'\n' if text is None else text)
+    if parts and parts[-1] == b'\n':
+        parts.pop()  # Как и "\n".join(...) по параграфам - без перевода строки в конце
+    return html.unescape(b''.join(parts).decode('utf-8'))
+
+
+def _replace_in_text_nodes(text_nodes, pattern, replace):
+    """
+    Заменяет совпадения pattern в тексте одного параграфа, разложенном по узлам <w:t>.
+    Совпадения ищутся по склеенному тексту (плейсхолдер может быть разорван между runs): замена пишется
+    в узел, где совпадение начинается, его остаток удаляется из следующих узлов. Остальной текст остается
+    в своих узлах, форматирование runs сохраняется. Возвращает число совпадений.
+    """
+    node_texts = [node.text or '' for node in text_nodes]
+    text = ''.join(node_texts)
+    matches = list(pattern.finditer(text))
+    if not matches:
+        return 0
+
+    node_starts = list(itertools.accumulate((len(t) for t in node_texts[:-1]), initial=0))
+    pieces = [[] for _ in text_nodes]
+
+    def keep(start, end):
+        """Раскладывает неизмененный текст [start, end) по узлам, в которых он был"""
+        i = bisect_right(node_starts, start) - 1
+        while start < end:
+            node_end = node_starts[i] + len(node_texts[i])
+            if start < node_end:
+                pieces[i].append(text[start:min(end, node_end)])
+                start = min(end, node_end)
+            i += 1
+
+    position = 0
+    for match in matches:
+        keep(position, match.start())
+        pieces[bisect_right(node_starts, match.start()) - 1].append(replace(match))
+        position = match.end()
+    keep(position, len(text))
+
+    for node, old_text, node_pieces in zip(text_nodes, node_texts, pieces):
+        new_text = ''.join(node_pieces)
+        if new_text != old_text:
+            node.text = new_text
+            if new_text != new_text.strip():
+                node.set(XML_SPACE_ATTR, 'preserve')
+    return len(matches)
+
+
+def _rewrite_docx_text(docx_bytes, output_path, pattern, replace):
+    """
+    Заменяет совпадения pattern в тексте узлов <w:t> (replace(match) -> новая строка) и пишет DOCX в output_path.
+    Части и параграфы обходятся в том же порядке, что и в _fast_docx_text, поэтому i-е совпадение здесь -
+    i-й плейсхолдер из найденных в тексте. Разметка, имена медиа и связи (.rels) не затрагиваются,
+    неизмененные части копируются как есть. Возвращает число совпадений.
+    """
+    total = 0
+    fixed_parts = {}
+    with zipfile.ZipFile(io.BytesIO(docx_bytes)) as source_zip:
+        for part_name in _docx_text_part_names(source_zip.namelist()):
+            part_total = 0
+            text_nodes = []
+            # Как в DOCX_TEXT_RE: текст копится по </w:t>, параграф завершается по </w:p>
+            context = etree.iterparse(io.BytesIO(source_zip.read(part_name)), events=('end',),
+                                      tag=(W_TEXT_TAG, W_PARAGRAPH_TAG), huge_tree=True)
+            for _, element in context:
+                if element.tag == W_TEXT_TAG:
+                    text_nodes.append(element)
+                elif text_nodes:
+                    part_total += _replace_in_text_nodes(text_nodes, pattern, replace)
+                    text_nodes = []
+            if text_nodes:
+                part_total += _replace_in_text_nodes(text_nodes, pattern, replace)
+            if part_total:
+                fixed_parts[part_name] = etree.tostring(context.root, xml_declaration=True, encoding='UTF-8',
+                                                        standalone=True)
+                total += part_total
+
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        if not fixed_parts:
+            output_path.write_bytes(docx_bytes)
+            return total
+        with zipfile.ZipFile(output_path, 'w', compression=zipfile.ZIP_DEFLATED) as target_zip:
+            for item in source_zip.infolist():
+                data = fixed_parts.get(item.filename)
+                if data is None:
+                    data = source_zip.read(item)
+                target_zip.writestr(item, data)
+    return total
+
+
+class ProcessResult(NamedTuple):
+    """Результат process_document: флаги и счетчики вместо разбора текста сообщения"""
+    ok: bool
+    had_placeholders: bool = False  # В документах были плейсхолдеры (иначе файл просто скопирован)
+    damaged_fixed: int = 0  # Исправлено поврежденных плейсхолдеров
+    replaced: int = 0  # Заменено плейсхолдеров по оригиналу
+    message: str = ""
+
+
 class PlaceholderRestorer:
     """Класс для восстановления последовательности плейсхолдеров"""
     
@@ -41,11 +189,21 @@ class PlaceholderRestorer:
         
         # Паттерн для поиска поврежденных плейсхолдеров
         # Находит варианты: <EqnXXX.eps>>, <<EqnXXX.eps>, <EqnXXX.eps>, EqnXXX.eps>>
+        # Группы: 1 - открывающие <, 2 - номер, 3 - .eps, 4 - закрывающие >, 5 - запятая
         self.pattern_damaged = re.compile(
-            r'(?:<{1,2})?Eqn\d+(?:\.eps)?(?:>{1,2})?(?:,)?', 
+            r'(<{1,2})?Eqn(\d+)(\.eps)?(>{1,2})?(,)?', 
             re.IGNORECASE
         )
         
+        # Паттерны для восстановления последовательности (компилируются один раз, а не на каждый документ)
+        self.pattern_strict = re.compile(r'<<Eqn\d+(?:\.eps)?>>', re.IGNORECASE)
+        self.pattern_robust = re.compile(r'[<\\>,\s]*?Eqn\d+(?:\.eps)?[<\\>,\s]*', re.IGNORECASE)
+        # Только сам плейсхолдер, без соседних пробелов и запятых - для замены и удаления в тексте
+        self.pattern_token = re.compile(r'<*Eqn\d+(?:\.eps)?>*', re.IGNORECASE)
+        
+        # Плейсхолдеры уже прочитанных оригиналов: (путь, mtime_ns, размер) -> список
+        self._orig_cache = {}
+        
     def find_and_fix_damaged_placeholders(self, text, para_info=""):
         """
         Находит и исправляет поврежденные плейсхолдеры в тексте
@@ -57,25 +215,12 @@ class PlaceholderRestorer:
         def fix_placeholder(match):
             nonlocal fixed_count
             original = match.group(0)
-            
-            # Извлекаем номер плейсхолдера
-            num_match = re.search(r'Eqn(\d+)', original, re.IGNORECASE)
-            if not num_match:
-                return original
-                
-            num = num_match.group(1)
+            opening, num, eps, closing, comma = match.groups()
             
             # Проверяем, нужно ли исправление
-            if not original.startswith('<<') or not original.endswith('>>'):
-                # Строим правильный плейсхолдер
-                if '.eps' in original.lower():
-                    correct = f'<<Eqn{num}.eps>>'
-                else:
-                    correct = f'<<Eqn{num}>>'
-                    
-                # Сохраняем запятую если она была
-                if original.endswith(','):
-                    correct += ','
+            if opening != '<<' or closing != '>>' or comma:
+                # Строим правильный плейсхолдер, сохраняя запятую если она была
+                correct = f"<<Eqn{num}{'.eps' if eps else ''}>>{comma or ''}"
                     
                 if original != correct:
                     fixed_count += 1
@@ -93,6 +238,41 @@ class PlaceholderRestorer:
         
         return fixed_text, fixed_count, fixes
     
+    def _iter_paragraphs(self, document):
+        """
+        Обходит все параграфы документа одним генератором: основной текст, таблицы, колонтитулы.
+        Возвращает пары (параграф, сведения_о_расположении).
+        """
+        for i, para in enumerate(document.paragraphs):
+            yield para, {'para_index': i, 'location': 'paragraph'}
+        for t_idx, table in enumerate(document.tables):
+            for r_idx, row in enumerate(table.rows):
+                for c_idx, cell in enumerate(row.cells):
+                    for p_idx, para in enumerate(cell.paragraphs):
+                        yield para, {
+                            'table': t_idx,
+                            'row': r_idx,
+                            'cell': c_idx,
+                            'para_in_cell': p_idx,
+                            'location': 'table'
+                        }
+        for section in document.sections:
+            for para in section.header.paragraphs:
+                yield para, {'location': 'header'}
+            for para in section.footer.paragraphs:
+                yield para, {'location': 'footer'}
+    
+    def _collect_damaged(self, text, location_info, problems):
+        """Добавляет в problems поврежденные плейсхолдеры параграфа (один проход регулярным выражением)"""
+        for match in self.pattern_damaged.finditer(text):
+            candidate = match.group(0)
+            if not self.pattern_placeholder.fullmatch(candidate):
+                problems.append({
+                    **location_info,
+                    'text': text[:100] + '...' if len(text) > 100 else text,
+                    'damaged': candidate
+                })
+    
     def check_document_for_damaged_placeholders(self, doc_path):
         """
         Проверяет документ на наличие поврежденных плейсхолдеров
@@ -106,161 +286,143 @@ class PlaceholderRestorer:
             print(f"⚠️  Не удалось открыть {doc_path.name}: {e}")
             return problems
             
-        # Проверяем параграфы
-        for i, para in enumerate(document.paragraphs):
-            if para.text:
-                # Находим все возможные плейсхолдеры
-                all_matches = self.pattern_damaged.findall(para.text)
-                correct_matches = self.pattern_placeholder.findall(para.text)
-                
-                # Если есть разница, значит есть поврежденные
-                if len(all_matches) > len(correct_matches):
-                    for match in all_matches:
-                        if not self.pattern_placeholder.match(match):
-                            problems.append({
-                                'para_index': i,
-                                'location': 'paragraph',
-                                'text': para.text[:100] + '...' if len(para.text) > 100 else para.text,
-                                'damaged': match
-                            })
-                    
-        # Проверяем таблицы
-        for t_idx, table in enumerate(document.tables):
-            for r_idx, row in enumerate(table.rows):
-                for c_idx, cell in enumerate(row.cells):
-                    for p_idx, para in enumerate(cell.paragraphs):
-                        if para.text:
-                            all_matches = self.pattern_damaged.findall(para.text)
-                            correct_matches = self.pattern_placeholder.findall(para.text)
-                            
-                            if len(all_matches) > len(correct_matches):
-                                for match in all_matches:
-                                    if not self.pattern_placeholder.match(match):
-                                        problems.append({
-                                            'table': t_idx,
-                                            'row': r_idx,
-                                            'cell': c_idx,
-                                            'para_in_cell': p_idx,
-                                            'location': 'table',
-                                            'text': para.text[:100] + '...' if len(para.text) > 100 else para.text,
-                                            'damaged': match
-                                        })
+        for para, location_info in self._iter_paragraphs(document):
+            text = para.text
+            if text:
+                self._collect_damaged(text, location_info, problems)
         
         return problems
-        
-    def extract_placeholders_list(self, doc_path):
+    
+    def analyze(self, doc_path):
         """
-        Извлекает список всех плейсхолдеров из документа в порядке появления
+        Открывает документ один раз и за один обход параграфов возвращает
+        (поврежденные плейсхолдеры, список правильных плейсхолдеров)
         """
+        problems = []
         placeholders = []
         
         try:
             document = Document(doc_path)
         except Exception as e:
             print(f"⚠️  Не удалось открыть {doc_path.name}: {e}")
-            return []
+            return problems, placeholders
             
-        # Параграфы
-        for para in document.paragraphs:
-            if para.text:
-                matches = self.pattern_placeholder.findall(para.text)
-                placeholders.extend(matches)
-                
-        # Таблицы
-        for table in document.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for para in cell.paragraphs:
-                        if para.text:
-                            matches = self.pattern_placeholder.findall(para.text)
-                            placeholders.extend(matches)
-                            
-        # Колонтитулы
-        for section in document.sections:
-            for para in section.header.paragraphs:
-                if para.text:
-                    matches = self.pattern_placeholder.findall(para.text)
-                    placeholders.extend(matches)
-            for para in section.footer.paragraphs:
-                if para.text:
-                    matches = self.pattern_placeholder.findall(para.text)
-                    placeholders.extend(matches)
-                    
-        return placeholders
+        for para, location_info in self._iter_paragraphs(document):
+            text = para.text
+            if text:
+                self._collect_damaged(text, location_info, problems)
+                placeholders.extend(self.pattern_placeholder.findall(text))
+        
+        return problems, placeholders
+        
+    def extract_placeholders_list(self, doc_path):
+        """
+        Извлекает список всех плейсхолдеров из документа в порядке появления
+        """
+        # Плейсхолдеры не разрываются разметкой, поэтому достаточно текста из XML без python-docx
+        text = self._get_all_text_from_docx(doc_path)
+        if text is None:
+            return []
+        return self.pattern_placeholder.findall(text)
         
     def process_document(self, doc_path, output_path=None, original_doc_path=None, fix_damaged=True, force_mode=False):
         """
         ТОЧНАЯ КОПИЯ ЛОГИКИ из ai_studio_code.py - EQN RESTORATION BATCH VERSION 10.2
+        Возвращает ProcessResult.
         """
         
         # Используем точную логику из process_document_binary
-        original_text = self._get_all_text_from_docx(original_doc_path)
-        if original_text is None: 
-            return False, "Не удалось прочитать оригинальный файл."
+        # Один оригинал может сопоставляться с несколькими переводами - не разбираем его повторно
+        try:
+            original_stat = original_doc_path.stat()
+            cache_key = (str(original_doc_path), original_stat.st_mtime_ns, original_stat.st_size)
+        except OSError:
+            cache_key = None
+        original_placeholders = self._orig_cache.get(cache_key)
+        if original_placeholders is None:
+            original_text = self._get_all_text_from_docx(original_doc_path)
+            if original_text is None: 
+                return ProcessResult(False, message="Не удалось прочитать оригинальный файл.")
 
-        pattern_strict = re.compile(r'<<Eqn\d+(?:\.eps)?>>', re.IGNORECASE)
-        original_placeholders = pattern_strict.findall(original_text)
+            original_placeholders = self.pattern_strict.findall(original_text)
+            if cache_key is not None:
+                self._orig_cache[cache_key] = original_placeholders
 
-        translation_text = self._get_all_text_from_docx(doc_path)
+        # Файл перевода читается один раз: байты нужны и для анализа текста, и для замены
+        try:
+            translation_bytes = doc_path.read_bytes()
+        except OSError as e:
+            print(f"⚠️  Ошибка чтения {doc_path.name}: {e}")
+            return ProcessResult(False, message="Не удалось прочитать файл перевода.")
+        translation_text = self._get_all_text_from_docx(doc_path, translation_bytes)
         if translation_text is None: 
-            return False, "Не удалось прочитать файл перевода."
+            return ProcessResult(False, message="Не удалось прочитать файл перевода.")
 
-        pattern_robust = re.compile(r'[<\\>,\s]*?Eqn\d+(?:\.eps)?[<\\>,\s]*', re.IGNORECASE)
-        translation_placeholders_found = pattern_robust.findall(translation_text)
+        translation_placeholders_found = self.pattern_robust.findall(translation_text)
 
         try:
             if not original_placeholders:
                 if not translation_placeholders_found:
                     # ОБЯЗАТЕЛЬНО создаем родительские папки перед копированием
                     output_path.parent.mkdir(parents=True, exist_ok=True)
-                    import shutil
-                    shutil.copy(doc_path, output_path)
-                    return True, "Плейсхолдеры не найдены, файл скопирован."
+                    # Метаданные не нужны: copyfile копирует средствами ядра (sendfile/copy_file_range)
+                    shutil.copyfile(doc_path, output_path)
+                    return ProcessResult(True, message="Плейсхолдеры не найдены, файл скопирован.")
                 else:
                     print(f"         - ВНИМАНИЕ: В оригинале нет плейсхолдеров. Удаление {len(translation_placeholders_found)} лишних из перевода...")
-                    with open(doc_path, 'rb') as f:
-                        binary_content = f.read()
-                    for placeholder_to_remove in translation_placeholders_found:
-                        binary_content = binary_content.replace(placeholder_to_remove.encode('utf-8'), b'')
-                    output_path.parent.mkdir(parents=True, exist_ok=True)
-                    with open(output_path, 'wb') as f:
-                        f.write(binary_content)
-                    return True, f"Успешно удалено {len(translation_placeholders_found)} лишних плейсхолдеров."
+                    # Все лишние плейсхолдеры удаляются одним проходом по тексту узлов <w:t>
+                    _rewrite_docx_text(translation_bytes, output_path, self.pattern_token, lambda match: '')
+                    return ProcessResult(
+                        True,
+                        had_placeholders=True,
+                        message=f"Успешно удалено {len(translation_placeholders_found)} лишних плейсхолдеров."
+                    )
 
             if len(original_placeholders) != len(translation_placeholders_found):
                 message = f"Обнаружено несоответствие: {len(original_placeholders)} в оригинале vs {len(translation_placeholders_found)} в переводе."
                 if not force_mode:
-                    return False, f"{message} Обработка остановлена."
+                    return ProcessResult(False, had_placeholders=True, message=f"{message} Обработка остановлена.")
                 else:
                     print(f"         ⚠️  {message}")
                     print("         - Активирован ПРИНУДИТЕЛЬНЫЙ РЕЖИМ. Лишние плейсхолдеры будут проигнорированы.")
                     translation_placeholders_found = translation_placeholders_found[:len(original_placeholders)]
 
-            with open(doc_path, 'rb') as f:
-                binary_content = f.read()
+            # Один проход по тексту узлов <w:t>: i-й найденный плейсхолдер заменяется i-м из оригинала
+            replacements = deque(original_placeholders[:len(translation_placeholders_found)])
+            replacements_total = len(replacements)
 
-            for i, placeholder_to_replace in enumerate(translation_placeholders_found):
-                binary_content = binary_content.replace(
-                    placeholder_to_replace.encode('utf-8', 'replace'),
-                    original_placeholders[i].encode('utf-8', 'replace'),
-                    1
-                )
+            def replace_next(match):
+                return replacements.popleft() if replacements else match.group(0)
 
-            output_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(output_path, 'wb') as f:
-                f.write(binary_content)
+            _rewrite_docx_text(translation_bytes, output_path, self.pattern_token, replace_next)
+            replaced_count = replacements_total - len(replacements)
             
-            return True, f"Успешно заменено: {len(original_placeholders)} плейсхолдеров."
+            return ProcessResult(
+                True,
+                had_placeholders=True,
+                replaced=replaced_count,
+                message=f"Успешно заменено: {len(original_placeholders)} плейсхолдеров."
+            )
 
         except Exception as e:
             import traceback
             traceback.print_exc()
-            return False, f"Критическая ошибка на этапе обработки: {e}"
+            return ProcessResult(False, message=f"Критическая ошибка на этапе обработки: {e}")
             
-    def _get_all_text_from_docx(self, doc_path):
-        """Безопасно извлекает ВЕСЬ текст из документа для АНАЛИЗА."""
+    def _get_all_text_from_docx(self, doc_path, doc_bytes=None):
+        """
+        Безопасно извлекает ВЕСЬ текст из документа для АНАЛИЗА.
+        Если переданы doc_bytes (уже прочитанное содержимое файла), файл повторно не читается.
+        """
+        source = doc_path if doc_bytes is None else io.BytesIO(doc_bytes)
         try:
-            document = Document(doc_path)
+            return _fast_docx_text(source)
+        except Exception:
+            pass  # Нестандартный DOCX - читаем через python-docx
+        try:
+            if doc_bytes is not None:
+                source = io.BytesIO(doc_bytes)
+            document = Document(source)
             full_text = []
             for para in document.paragraphs: 
                 full_text.append(para.text)
@@ -320,6 +482,31 @@ class PlaceholderRestorer:
                 print(f"   В оригинале на {diff} плейсхолдеров больше")
 
 
+def _walk_docx(root, skip_restored=False):
+    """
+    Рекурсивно обходит папку через os.scandir и возвращает DirEntry .docx файлов (без временных ~$).
+    skip_restored=True дополнительно отбрасывает уже восстановленные файлы (_restored в имени).
+    Фильтр работает по строке entry.name, до создания каких-либо Path.
+    """
+    stack = [str(root)]
+    while stack:
+        current_dir = stack.pop()
+        try:
+            with os.scandir(current_dir) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        name = entry.name
+                        if not name.endswith('.docx') or name.startswith('~$'):
+                            continue
+                        if skip_restored and '_restored' in name:
+                            continue
+                        yield entry
+        except OSError as e:
+            print(f"⚠️  Не удалось прочитать папку {current_dir}: {e}")
+
+
 def find_translation_original_pairs(translations_root, originals_root, translation_suffix='_to_en_us'):
     """
     Находит пары переведенных и оригинальных файлов с одинаковой структурой папок
@@ -334,245 +521,297 @@ def find_translation_original_pairs(translations_root, originals_root, translati
     pairs = []
     not_found = []
     
-    # Список возможных суффиксов перевода
-    possible_suffixes = ['_translated_en-us', '_translated_en_us', '_to_en_us', '_to_en-us', '_en', '_EN']
+    # Индекс оригиналов строится одним обходом: относительный путь (в нижнем регистре) -> полный путь.
+    # Вместо stat() на каждый перевод - поиск в словаре
+    originals_prefix_len = len(os.path.join(str(originals_root), ''))
+    originals_index = {
+        entry.path[originals_prefix_len:].lower(): entry.path
+        for entry in _walk_docx(originals_root)
+    }
     
-    # Рекурсивно находим все .docx файлы в папке переводов
-    for translation_file in translations_root.rglob("*.docx"):
-        # Пропускаем временные файлы
-        if translation_file.name.startswith("~$"):
-            continue
-            
-        # Пропускаем уже обработанные файлы
-        if "_restored" in translation_file.name:
-            continue
-            
-        # Получаем относительный путь от корня переводов
-        try:
-            relative_path = translation_file.relative_to(translations_root)
-        except ValueError:
-            continue
-            
-        # Определяем имя оригинала (убираем суффикс перевода)
-        original_name = translation_file.name
-        for suffix in possible_suffixes:
-            if suffix in translation_file.stem:
-                original_stem = translation_file.stem.replace(suffix, '')
-                original_name = original_stem + translation_file.suffix
-                break
+    # Рекурсивно находим все .docx файлы в папке переводов.
+    # Пути собираются строками; Path создается только для результатов
+    translations_prefix_len = len(os.path.join(str(translations_root), ''))
+    originals_root_str = str(originals_root)
+    # Уже обработанные файлы (_restored) отсекаются в самом обходе
+    for entry in _walk_docx(translations_root, skip_restored=True):
+        # Относительный путь от корня переводов: папки и имя файла
+        *translation_parent_parts, translation_name = entry.path[translations_prefix_len:].split(os.sep)
         
-        # Получаем путь к папке перевода относительно корня
-        translation_parent = relative_path.parent
+        # Определяем имя оригинала (убираем суффикс перевода)
+        stem, suffix = os.path.splitext(translation_name)
+        original_name = TRANSLATED_NAME_SUFFIX_RE.sub('', stem, count=1) + suffix
         
         # Убираем суффиксы перевода из пути папок
-        original_parent_parts = []
-        for part in translation_parent.parts:
-            part_cleaned = part
-            for suffix in ['_to_en_us', '_en', '_EN', '_translated']:
-                if part.endswith(suffix):
-                    part_cleaned = part[:-len(suffix)]
-                    break
-            original_parent_parts.append(part_cleaned)
+        original_parent_parts = [TRANSLATED_FOLDER_SUFFIX_RE.sub('', part, count=1) for part in translation_parent_parts]
         
-        # Строим путь к оригиналу
-        if original_parent_parts:
-            original_path = originals_root / Path(*original_parent_parts) / original_name
-        else:
-            original_path = originals_root / original_name
-        
-        if original_path.exists():
-            pairs.append((translation_file, original_path))
+        original_key = os.path.join(*original_parent_parts, original_name).lower()
+        found_original = originals_index.get(original_key)
+        if found_original is not None:
+            pairs.append((Path(entry.path), Path(found_original)))
         else:
             not_found.append({
-                'translation': translation_file,
-                'expected_original': original_path
+                'translation': Path(entry.path),
+                'expected_original': Path(os.path.join(originals_root_str, *original_parent_parts, original_name))
             })
             
     return pairs, not_found
 
 
+# Экземпляр PlaceholderRestorer в процессе-обработчике (создается один раз на процесс, кэш оригиналов сохраняется)
+_worker_restorer = None
+
+
+def _process_pair(translation, original, output_path, force_mode):
+    """
+    Обрабатывает одну пару (перевод, оригинал) в процессе пула.
+    Вывод обработчика перехватывается и возвращается, чтобы напечатать его в порядке файлов.
+    Возвращает (ProcessResult, статистика, вывод).
+    """
+    global _worker_restorer
+    if _worker_restorer is None:
+        _worker_restorer = PlaceholderRestorer()
+    output = io.StringIO()
+    with redirect_stdout(output):
+        result = _worker_restorer.process_document(
+            translation,
+            output_path=output_path,
+            original_doc_path=original,
+            fix_damaged=True,
+            force_mode=force_mode
+        )
+    return result, _worker_restorer.stats, output.getvalue()
+
+
 def process_multiple_files(pairs, restorer, output_root, translations_root, dry_run=False, force_mode=False):
     """
     Обрабатывает множество файлов
     
     Параметры:
     - pairs: список кортежей (перевод, оригинал)
-    - restorer: экземпляр PlaceholderRestorer
+    - restorer: экземпляр PlaceholderRestorer (анализ в режиме предпросмотра; обработка идет в пуле процессов)
     - output_root: корневая папка для сохранения результатов
     - translations_root: корневая папка с переводами (для расчета относительных путей)
     - dry_run: если True, только показывает что будет сделано
     - force_mode: принудительный режим для несоответствий
     
-    Возвращает словарь с результатами
+    Возвращает словарь с итоговыми счетчиками ('stats') и путем к файлу записей ('records_file').
+    Записи о каждом файле не накапливаются в памяти, а сразу пишутся в JSON Lines файл
+    в папке результатов; в режиме предпросмотра файл записей не создается (records_file = None)
     """
+    records_file = None if dry_run else output_root / RESULTS_RECORDS_NAME
     results = {
-        'success': [],
-        'failed': [],
-        'skipped': [],
-        'processed_without_placeholders': [],
-        'damaged_fixed': [],
+        'records_file': records_file,
         'stats': {
             'total_files': len(pairs),
             'total_placeholders_replaced': 0,
             'total_damaged_fixed': 0,
-            'files_without_placeholders': 0
+            'files_without_placeholders': 0,
+            'n_success': 0,
+            'n_failed': 0,
+            'n_skipped': 0
         }
     }
     
     if dry_run:
         print("\n🔍 РЕЖИМ ПРЕДПРОСМОТРА (изменения не будут сохранены)")
     
-    total = len(pairs)
-    for i, (translation, original) in enumerate(pairs, 1):
-        print(f"\n[{i}/{total}] Обработка: {translation.name}")
-        print(f"         Оригинал: {original.name}")
-        
-        # Рассчитываем путь для сохранения с сохранением структуры папок
-        try:
-            relative_path = translation.relative_to(translations_root)
-            output_path = output_root / relative_path
-        except ValueError:
-            # Если не удается получить относительный путь, используем имя файла
-            output_path = output_root / translation.name
+    # Счетчики в локальных переменных: в цикле по файлам без обращений к results['stats'][...];
+    # итоговые значения записываются в results['stats'] после цикла
+    total_placeholders_replaced = 0
+    total_damaged_fixed = 0
+    files_without_placeholders = 0
+    n_success = 0
+    n_failed = 0
+    n_skipped = 0
+    
+    records = None
+    if records_file is not None:
+        output_root.mkdir(parents=True, exist_ok=True)
+        records = open(records_file, 'w', encoding='utf-8')
+    
+    def write_record(kind, translation, **fields):
+        """Записывает одну строку JSON о файле (в режиме предпросмотра - ничего)"""
+        if records is not None:
+            records.write(json.dumps({'kind': kind, 'file': str(translation), **fields},
+                                     ensure_ascii=False, default=str))
+            records.write('\n')
+    
+    # Документы обрабатываются параллельно в пуле процессов; результаты выводятся в исходном порядке
+    executor = None if dry_run else ProcessPoolExecutor(max_workers=RESTORE_MAX_WORKERS)
+    try:
+        scheduled = []
+        for i, (translation, original) in enumerate(pairs, 1):
+            # Рассчитываем путь для сохранения с сохранением структуры папок
+            try:
+                relative_path = translation.relative_to(translations_root)
+                output_path = output_root / relative_path
+            except ValueError:
+                # Если не удается получить относительный путь, используем имя файла
+                output_path = output_root / translation.name
             
-        if output_path.exists():
-            print("         ⚠️  Пропущен: выходной файл уже существует")
-            results['skipped'].append({
-                'file': translation,
-                'reason': 'Выходной файл уже существует'
-            })
-            continue
+            skipped = output_path.exists()
+            future = None
+            if not skipped and executor is not None:
+                future = executor.submit(_process_pair, translation, original, output_path, force_mode)
+            scheduled.append((i, translation, original, output_path, skipped, future))
         
-        if dry_run:
-            # В режиме предпросмотра только анализируем
-            problems = restorer.check_document_for_damaged_placeholders(translation)
-            trans_placeholders = restorer.extract_placeholders_list(translation)
-            orig_placeholders = restorer.extract_placeholders_list(original)
+        total = len(pairs)
+        for i, translation, original, output_path, skipped, future in scheduled:
+            print(f"\n[{i}/{total}] Обработка: {translation.name}")
+            print(f"         Оригинал: {original.name}")
+                
+            if skipped:
+                print("         ⚠️  Пропущен: выходной файл уже существует")
+                n_skipped += 1
+                write_record('skipped', translation, reason='Выходной файл уже существует')
+                continue
             
-            if problems:
-                print(f"         ⚠️  Поврежденных плейсхолдеров: {len(problems)}")
-            if trans_placeholders and orig_placeholders:
-                print(f"         📊 Плейсхолдеров: перевод={len(trans_placeholders)}, оригинал={len(orig_placeholders)}")
-                if len(trans_placeholders) != len(orig_placeholders):
-                    print("         ⚠️  Количество не совпадает!")
-            results['success'].append({
-                'file': translation,
-                'output': output_path,
-                'message': f"Будет обработано {len(trans_placeholders) if trans_placeholders else 0} плейсхолдеров"
-            })
-        else:
-            # Реальная обработка
-            try:
-                success, message = restorer.process_document(
-                    translation,
-                    output_path=output_path,
-                    original_doc_path=original,
-                    fix_damaged=True,
-                    force_mode=force_mode
-                )
+            if dry_run:
+                # В режиме предпросмотра только анализируем
+                # Перевод разбирается один раз; для оригинала нужен только список плейсхолдеров
+                problems, trans_placeholders = restorer.analyze(translation)
+                orig_placeholders = restorer.extract_placeholders_list(original)
                 
-                if success:
-                    # Проверяем типы обработки
-                    if "без плейсхолдеров" in message:
-                        results['processed_without_placeholders'].append({
-                            'file': translation,
-                            'output': output_path,
-                            'message': message
-                        })
-                        results['stats']['files_without_placeholders'] += 1
+                if problems:
+                    print(f"         ⚠️  Поврежденных плейсхолдеров: {len(problems)}")
+                if trans_placeholders and orig_placeholders:
+                    print(f"         📊 Плейсхолдеров: перевод={len(trans_placeholders)}, оригинал={len(orig_placeholders)}")
+                    if len(trans_placeholders) != len(orig_placeholders):
+                        print("         ⚠️  Количество не совпадает!")
+                n_success += 1
+                write_record('success', translation, output=str(output_path),
+                             message=f"Будет обработано {len(trans_placeholders) if trans_placeholders else 0} плейсхолдеров")
+            else:
+                # Реальная обработка (результат из пула процессов)
+                try:
+                    result, worker_stats, worker_output = future.result()
+                    if worker_output:
+                        print(worker_output, end='')
+                    
+                    if result.ok:
+                        # Проверяем типы обработки
+                        if not result.had_placeholders:
+                            files_without_placeholders += 1
+                            write_record('no_placeholders', translation, output=str(output_path),
+                                         message=result.message)
+                        else:
+                            n_success += 1
+                            write_record('success', translation, output=str(output_path),
+                                         message=result.message)
+                            
+                            # Подсчитываем статистику
+                            if result.damaged_fixed > 0:
+                                total_damaged_fixed += result.damaged_fixed
+                                write_record('damaged_fixed', translation, count=result.damaged_fixed,
+                                             details=worker_stats['damaged_placeholders_details'])
+                            total_placeholders_replaced += result.replaced
                     else:
-                        results['success'].append({
-                            'file': translation,
-                            'output': output_path,
-                            'message': message
-                        })
+                        n_failed += 1
+                        write_record('failed', translation, error=result.message)
                         
-                        # Подсчитываем статистику
-                        if "Исправлено поврежденных" in message:
-                            results['stats']['total_damaged_fixed'] += restorer.stats['damaged_placeholders_fixed']
-                            if restorer.stats['damaged_placeholders_fixed'] > 0:
-                                results['damaged_fixed'].append({
-                                    'file': translation,
-                                    'count': restorer.stats['damaged_placeholders_fixed'],
-                                    'details': restorer.stats['damaged_placeholders_details']
-                                })
-                        results['stats']['total_placeholders_replaced'] += restorer.stats['placeholders_replaced']
-                else:
-                    results['failed'].append({
-                        'file': translation,
-                        'error': message
-                    })
-                    
-            except Exception as e:
-                results['failed'].append({
-                    'file': translation,
-                    'error': str(e)
-                })
+                except Exception as e:
+                    n_failed += 1
+                    write_record('failed', translation, error=str(e))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if records is not None:
+            records.close()
+    
+    stats = results['stats']
+    stats['total_placeholders_replaced'] = total_placeholders_replaced
+    stats['total_damaged_fixed'] = total_damaged_fixed
+    stats['files_without_placeholders'] = files_without_placeholders
+    stats['n_success'] = n_success
+    stats['n_failed'] = n_failed
+    stats['n_skipped'] = n_skipped
                 
     return results
 
 
-def generate_report(results, not_found, output_file=None):
-    """
-    Генерирует подробный отчет о результатах обработки
-    """
-    if output_file is None:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_file = f"eqn_restoration_report_{timestamp}.txt"
+def _iter_records(records_file, kind):
+    """Потоково читает из файла записей (JSON Lines) записи одного вида"""
+    if records_file is None:
+        return
+    with open(records_file, encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            if record['kind'] == kind:
+                yield record
+
+
+def _write_report_lines(report_file, results, not_found):
+    """Пишет отчет построчно прямо в открытый файл, не собирая его целиком в памяти"""
+    def write_line(line):
+        report_file.write(line)
+        report_file.write("\n")
     
-    report_lines = []
-    report_lines.append("="*80)
-    report_lines.append("ОТЧЕТ О ВОССТАНОВЛЕНИИ ПЛЕЙСХОЛДЕРОВ УРАВНЕНИЙ")
-    report_lines.append("="*80)
-    report_lines.append(f"Дата и время: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    report_lines.append("")
-    
-    # Общая статистика
-    report_lines.append("ОБЩАЯ СТАТИСТИКА:")
-    report_lines.append("-"*40)
-    report_lines.append(f"Всего файлов для обработки: {results['stats']['total_files']}")
-    report_lines.append(f"Успешно обработано с плейсхолдерами: {len(results['success'])}")
-    report_lines.append(f"Исправлено поврежденных плейсхолдеров: {results['stats']['total_damaged_fixed']}")
-    report_lines.append(f"Обработано без плейсхолдеров: {len(results.get('processed_without_placeholders', []))}")
-    report_lines.append(f"С ошибками: {len(results['failed'])}")
-    report_lines.append(f"Пропущено: {len(results['skipped'])}")
-    report_lines.append(f"Файлов без пары: {len(not_found)}")
-    report_lines.append(f"Всего заменено плейсхолдеров: {results['stats']['total_placeholders_replaced']}")
-    report_lines.append("")
+    write_line("="*80)
+    write_line("ОТЧЕТ О ВОССТАНОВЛЕНИИ ПЛЕЙСХОЛДЕРОВ УРАВНЕНИЙ")
+    write_line("="*80)
+    write_line(f"Дата и время: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    write_line("")
+    
+    # Общая статистика (итоговые счетчики, накопленные в process_multiple_files)
+    stats = results['stats']
+    write_line("ОБЩАЯ СТАТИСТИКА:")
+    write_line("-"*40)
+    write_line(f"Всего файлов для обработки: {stats['total_files']}")
+    write_line(f"Успешно обработано с плейсхолдерами: {stats['n_success']}")
+    write_line(f"Исправлено поврежденных плейсхолдеров: {stats['total_damaged_fixed']}")
+    write_line(f"Обработано без плейсхолдеров: {stats['files_without_placeholders']}")
+    write_line(f"С ошибками: {stats['n_failed']}")
+    write_line(f"Пропущено: {stats['n_skipped']}")
+    write_line(f"Файлов без пары: {len(not_found)}")
+    write_line(f"Всего заменено плейсхолдеров: {stats['total_placeholders_replaced']}")
+    write_line("")
+    
+    # Подробности по файлам читаются из файла записей по мере вывода
+    records_file = results.get('records_file')
     
     # Файлы с исправленными поврежденными плейсхолдерами
-    if results.get('damaged_fixed'):
-        report_lines.append("\nФАЙЛЫ С ИСПРАВЛЕННЫМИ ПОВРЕЖДЕННЫМИ ПЛЕЙСХОЛДЕРАМИ:")
-        report_lines.append("-"*40)
-        for item in results['damaged_fixed']:
-            report_lines.append(f"🔧 {item['file'].name}")
-            report_lines.append(f"   Исправлено: {item['count']} плейсхолдеров")
+    if stats['total_damaged_fixed'] > 0 and records_file is not None:
+        write_line("\nФАЙЛЫ С ИСПРАВЛЕННЫМИ ПОВРЕЖДЕННЫМИ ПЛЕЙСХОЛДЕРАМИ:")
+        write_line("-"*40)
+        for item in _iter_records(records_file, 'damaged_fixed'):
+            write_line(f"🔧 {os.path.basename(item['file'])}")
+            write_line(f"   Исправлено: {item['count']} плейсхолдеров")
             for detail in item['details'][:3]:
-                report_lines.append(f"   • {detail['original']} → {detail['fixed']}")
+                write_line(f"   • {detail['original']} → {detail['fixed']}")
             if len(item['details']) > 3:
-                report_lines.append(f"   ... и еще {len(item['details']) - 3}")
-            report_lines.append("")
+                write_line(f"   ... и еще {len(item['details']) - 3}")
+            write_line("")
     
     # Успешно обработанные файлы
-    if results['success']:
-        report_lines.append("\nУСПЕШНО ОБРАБОТАННЫЕ ФАЙЛЫ:")
-        report_lines.append("-"*40)
-        for item in results['success']:
-            report_lines.append(f"✅ {item['file'].name}")
-            report_lines.append(f"   → {item['output'].name}")
-            report_lines.append(f"   {item['message']}")
-            report_lines.append("")
+    if stats['n_success'] > 0 and records_file is not None:
+        write_line("\nУСПЕШНО ОБРАБОТАННЫЕ ФАЙЛЫ:")
+        write_line("-"*40)
+        for item in _iter_records(records_file, 'success'):
+            write_line(f"✅ {os.path.basename(item['file'])}")
+            write_line(f"   → {os.path.basename(item['output'])}")
+            write_line(f"   {item['message']}")
+            write_line("")
     
     # Остальные категории...
     # [Код для остальных категорий остается тем же]
+
+
+def generate_report(results, not_found, output_file=None):
+    """
+    Генерирует подробный отчет о результатах обработки
+    """
+    if output_file is None:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_file = f"eqn_restoration_report_{timestamp}.txt"
     
-    # Сохранение отчета
-    report_text = "\n".join(report_lines)
-    
+    # Сохранение отчета (строки пишутся в файл по мере формирования)
     try:
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(report_text)
+        with open(output_file, 'w', encoding='utf-8', buffering=1 << 20) as report_file:
+            _write_report_lines(report_file, results, not_found)
         print(f"\n📄 Отчет сохранен: {output_file}")
+        if results.get('records_file') is not None:
+            print(f"📄 Записи по каждому файлу: {results['records_file']}")
     except Exception as e:
         print(f"\n⚠️  Не удалось сохранить отчет: {e}")
     
@@ -580,12 +819,13 @@ def generate_report(results, not_found, output_file=None):
     print("\n" + "="*70)
     print("ИТОГОВАЯ СТАТИСТИКА")
     print("="*70)
-    print(f"✅ Успешно обработано: {len(results['success'])}")
-    if results['stats']['total_damaged_fixed'] > 0:
-        print(f"🔧 Исправлено поврежденных плейсхолдеров: {results['stats']['total_damaged_fixed']}")
-    print(f"📊 Всего заменено плейсхолдеров: {results['stats']['total_placeholders_replaced']}")
-    if results['failed']:
-        print(f"❌ С ошибками: {len(results['failed'])}")
+    stats = results['stats']
+    print(f"✅ Успешно обработано: {stats['n_success']}")
+    if stats['total_damaged_fixed'] > 0:
+        print(f"🔧 Исправлено поврежденных плейсхолдеров: {stats['total_damaged_fixed']}")
+    print(f"📊 Всего заменено плейсхолдеров: {stats['total_placeholders_replaced']}")
+    if stats['n_failed']:
+        print(f"❌ С ошибками: {stats['n_failed']}")
     if not_found:
         print(f"❓ Без пары: {len(not_found)}")
     
@@ -596,19 +836,19 @@ def process_single_file(restorer):
     """Обработка одного файла с детальным анализом"""
     # Запрашиваем переведенный файл
     print("\n1. Путь к ПЕРЕВЕДЕННОМУ файлу:")
-    file_path = input("   → ").strip().strip('"\'')
+    file_path = input("   → ").strip(INPUT_STRIP_CHARS)
     file_path = Path(file_path)
     
-    if not file_path.exists() or not file_path.is_file():
+    if not file_path.is_file():
         print(f"\n❌ Ошибка: файл не найден: {file_path}")
         return
         
     # Запрашиваем оригинал
     print("\n2. Путь к ОРИГИНАЛЬНОМУ файлу:")
-    original_path = input("   → ").strip().strip('"\'')
+    original_path = input("   → ").strip(INPUT_STRIP_CHARS)
     original_path = Path(original_path)
     
-    if not original_path.exists() or not original_path.is_file():
+    if not original_path.is_file():
         print(f"\n❌ Ошибка: файл не найден: {original_path}")
         return
     
@@ -629,15 +869,15 @@ def process_single_file(restorer):
     
     print("\n⏳ Исправление поврежденных плейсхолдеров и восстановление последовательности...")
     
-    success, message = restorer.process_document(
+    result = restorer.process_document(
         file_path,
         original_doc_path=original_path,
         fix_damaged=True
     )
     
-    if success:
+    if result.ok:
         print(f"\n✅ Успешно обработано!")
-        print(f"📊 {message}")
+        print(f"📊 {result.message}")
         output_path = file_path.parent / f"{file_path.stem}_restored{file_path.suffix}"
         print(f"📄 Результат сохранен: {output_path}")
         
@@ -649,7 +889,7 @@ def process_single_file(restorer):
             if len(restorer.stats['damaged_placeholders_details']) > 5:
                 print(f"   ... и еще {len(restorer.stats['damaged_placeholders_details']) - 5}")
     else:
-        print(f"\n❌ Ошибка: {message}")
+        print(f"\n❌ Ошибка: {result.message}")
 
 
 def process_folders(restorer):
@@ -661,19 +901,19 @@ def process_folders(restorer):
     # Запрашиваем папку с переводами
     print("\n1. Путь к папке с ПЕРЕВЕДЕННЫМИ файлами:")
     print("   (структура папок должна включать суффиксы _en, _EN, _to_en_us и т.п.)")
-    translations_path = input("   → ").strip().strip('"\'')
+    translations_path = input("   → ").strip(INPUT_STRIP_CHARS)
     translations_root = Path(translations_path)
     
-    if not translations_root.exists() or not translations_root.is_dir():
+    if not translations_root.is_dir():
         print(f"\n❌ Ошибка: папка не найдена: {translations_root}")
         return
     
     # Запрашиваем папку с оригиналами
     print("\n2. Путь к папке с ОРИГИНАЛЬНЫМИ файлами:")
-    originals_path = input("   → ").strip().strip('"\'')
+    originals_path = input("   → ").strip(INPUT_STRIP_CHARS)
     originals_root = Path(originals_path)
     
-    if not originals_root.exists() or not originals_root.is_dir():
+    if not originals_root.is_dir():
         print(f"\n❌ Ошибка: папка не найдена: {originals_root}")
         return
     
@@ -1,8 +1,20 @@
 #!/usr/bin/env python3
 import os
+import re
 import sys
+import argparse
+from functools import lru_cache
 from pathlib import Path
-from collections import defaultdict
+
+# Суффиксы перевода и восстановления в конце имени: _translated_[язык], _to_[язык], _restored
+TRANSLATION_SUFFIX_RE = re.compile(r'(?:_translated_[a-z\-]+|_to_[a-z\-]+|_restored)+$')
+
+def parse_arguments():
+    """Парсит аргументы командной строки"""
+    parser = argparse.ArgumentParser(description='Сравнение статей: исходники vs переводы')
+    parser.add_argument('--no-sort', action='store_true',
+                        help='Не сортировать списки недостающих файлов (быстрее на очень больших деревьях)')
+    return parser.parse_args()
 
 def get_folder_path(prompt):
     """Запрашивает путь к папке у пользователя"""
@@ -13,37 +25,43 @@ def get_folder_path(prompt):
         else:
             print(f"Ошибка: Путь '{path}' не существует или не является папкой. Попробуйте еще раз.")
 
+@lru_cache(maxsize=8192)  # Одинаковые имена статей встречаются в обоих деревьях и в разных журналах
 def normalize_filename(filename):
     """Нормализует имя файла, убирая подпись перевода"""
     # Убираем расширение для сравнения
     name_without_ext = os.path.splitext(filename)[0]
     
-    # Убираем суффиксы перевода и восстановления
-    # Ищем паттерны вида _translated_*, _to_*, _restored
-    import re
     # Убираем _translated_[язык] или _to_[язык] или _restored в конце
-    cleaned = re.sub(r'(_translated_[a-z\-]+|_to_[a-z\-]+|_restored)+$', '', name_without_ext)
+    cleaned = TRANSLATION_SUFFIX_RE.sub('', name_without_ext)
     
     return cleaned
 
 def get_articles_structure(root_path):
     """Получает структуру статей в формате {журнал: {статья: путь}}"""
-    articles = defaultdict(dict)
-    
-    # Проходим по папкам журналов
-    for journal_dir in root_path.iterdir():
-        if journal_dir.is_dir():
-            journal_name = journal_dir.name
-            
-            # Проходим по файлам статей в папке журнала
-            for article_file in journal_dir.iterdir():
-                if article_file.is_file() and not article_file.name.startswith('.'):
-                    normalized_name = normalize_filename(article_file.name)
-                    articles[journal_name][normalized_name] = str(article_file)
+    articles = {}
+    
+    # Проходим по папкам журналов (os.scandir: тип записи берется из readdir, без лишних stat)
+    with os.scandir(root_path) as journal_entries:
+        for journal_entry in journal_entries:
+            if journal_entry.is_dir():
+                # Имена журналов интернируются: они совпадают в обоих деревьях и служат ключами множеств
+                journal_name = sys.intern(journal_entry.name)
+                journal_articles = {}
+                
+                # Проходим по файлам статей в папке журнала
+                with os.scandir(journal_entry.path) as article_entries:
+                    for article_entry in article_entries:
+                        if article_entry.is_file() and not article_entry.name.startswith('.'):
+                            normalized_name = normalize_filename(article_entry.name)
+                            journal_articles[normalized_name] = article_entry.path
+                
+                # Журналы без статей в структуру не попадают
+                if journal_articles:
+                    articles[journal_name] = journal_articles
     
     return articles
 
-def compare_articles(source_path, translation_path):
+def compare_articles(source_path, translation_path, sort_results=True):
     """Сравнивает статьи в исходной папке и папке с переводами"""
     print("\nАнализирую структуру папок...")
     
@@ -53,20 +71,24 @@ def compare_articles(source_path, translation_path):
     print(f"\nНайдено журналов в исходниках: {len(source_articles)}")
     print(f"Найдено журналов в переводах: {len(translation_articles)}")
     
-    missing_in_translations = []
-    missing_in_source = []
-    
-    # Проверяем статьи в исходниках
-    for journal, articles in source_articles.items():
-        for article, path in articles.items():
-            if journal not in translation_articles or article not in translation_articles[journal]:
-                missing_in_translations.append((journal, article, path))
-    
-    # Проверяем статьи в переводах
-    for journal, articles in translation_articles.items():
-        for article, path in articles.items():
-            if journal not in source_articles or article not in source_articles[journal]:
-                missing_in_source.append((journal, article, path))
+    # Множества пар (журнал, статья): недостающие статьи - разность множеств
+    source_keys = {(journal, article) for journal, articles in source_articles.items() for article in articles}
+    translation_keys = {(journal, article) for journal, articles in translation_articles.items() for article in articles}
+    
+    # Статьи исходников без перевода и переводы без исходников
+    missing_in_translations = [
+        (journal, article, source_articles[journal][article])
+        for journal, article in source_keys - translation_keys
+    ]
+    missing_in_source = [
+        (journal, article, translation_articles[journal][article])
+        for journal, article in translation_keys - source_keys
+    ]
+    
+    # Сортируем один раз на месте: подробный список и краткая сводка идут по одному и тому же списку
+    if sort_results:
+        missing_in_translations.sort()
+        missing_in_source.sort()
     
     # Выводим результаты
     print("\n" + "="*80)
@@ -76,7 +98,7 @@ def compare_articles(source_path, translation_path):
     if missing_in_translations:
         print(f"\n📄 ФАЙЛЫ БЕЗ ПЕРЕВОДА ({len(missing_in_translations)}):")
         print("-"*80)
-        for journal, article, path in sorted(missing_in_translations):
+        for journal, article, path in missing_in_translations:
             filename = os.path.basename(path)
             print(f"❌ {filename}")
             print(f"   Журнал: {journal}")
@@ -88,7 +110,7 @@ def compare_articles(source_path, translation_path):
     if missing_in_source:
         print(f"\n📝 Переводы без исходников ({len(missing_in_source)}):")
         print("-"*80)
-        for journal, article, path in sorted(missing_in_source):
+        for journal, article, path in missing_in_source:
             print(f"Журнал: {journal}")
             print(f"Статья: {article}")
             print(f"Путь: {path}")
@@ -121,12 +143,14 @@ def compare_articles(source_path, translation_path):
         print("\n" + "="*80)
         print("🔴 СПИСОК ФАЙЛОВ БЕЗ ПЕРЕВОДА:")
         print("="*80)
-        for journal, article, path in sorted(missing_in_translations):
+        for journal, article, path in missing_in_translations:
             filename = os.path.basename(path)
             print(f"• {filename}")
         print("="*80)
 
 def main():
+    args = parse_arguments()
+    
     print("="*80)
     print("СРАВНЕНИЕ СТАТЕЙ: ИСХОДНИКИ vs ПЕРЕВОДЫ")
     print("="*80)
@@ -141,7 +165,7 @@ def main():
     translation_path = get_folder_path("Введите путь к папке с переводами: ")
     
     # Выполняем сравнение
-    compare_articles(source_path, translation_path)
+    compare_articles(source_path, translation_path, sort_results=not args.no_sort)
     
     print("\n" + "="*80)
     input("\nНажмите Enter для выхода...")
@@ -5,39 +5,118 @@
 На основе deepl_simple_translator_simple.py с улучшениями
 """
 
-import deepl
 import os
+import csv
 import sys
 import time
+import atexit
+import threading
 import json
+import logging
+import mmap
+import shutil
+import sqlite3
 import hashlib
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional, Dict, List, Tuple
 from datetime import datetime
-from dotenv import load_dotenv
 from enum import Enum
+from types import MappingProxyType
+
+# deepl, python-docx и dotenv импортируются лениво - только когда действительно нужны
+deepl = None
+
+# orjson сериализует JSON заметно быстрее стандартного модуля; если не установлен - используем json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Индикатор прогресса для перевода папки (опционально, иначе - одна перерисовываемая строка)
+try:
+    from tqdm import tqdm
+    TQDM_AVAILABLE = True
+except ImportError:
+    TQDM_AVAILABLE = False
 
-# Загрузка переменных окружения
 BASE_DIR = Path(__file__).resolve().parent
-load_dotenv(BASE_DIR / '.env')
 
 # Конфигурация
-DEEPL_API_KEY = os.getenv('DEEPL_API_KEY', '')
 SUPPORTED_EXTENSIONS = ['.docx', '.pdf', '.html', '.htm', '.txt']
+# Целевые языки, для которых DeepL поддерживает параметр formality
+FORMALITY_LANGS = frozenset({'DE', 'FR', 'IT', 'ES', 'NL', 'PL', 'PT-PT', 'PT-BR', 'RU', 'JA'})
 TRANSLATION_SUFFIX = "_translated"
 PAUSE_BETWEEN_REQUESTS = 0.5  # Пауза между запросами в секундах
 CACHE_DIR = BASE_DIR / '.translation_cache'
 MAX_RETRIES = 3
+FOLDER_MAX_WORKERS = 4  # Документы папки переводятся параллельно (одновременные задачи DeepL)
+WRITE_API_MAX_CONCURRENCY = 4  # Одновременных запросов к Write API (на весь процесс)
 RETRY_DELAY = 2.0
+CACHE_SCHEMA_VERSION = 1  # Версия схемы кэша: при несовпадении база кэша создается заново
+STATS_FLUSH_INTERVAL = 100  # Статистика кэша сбрасывается на диск раз в N обновлений (и при выходе)
+LOG_LEVEL = logging.INFO  # Подробности по каждому файлу при переводе папки пишутся на уровне DEBUG
 
+# Журнал переводчика; обработчик настраивается в main()
+log = logging.getLogger('translator')
 
-# Проверка доступности python-docx
-DOCX_AVAILABLE = False
-try:
-    from docx import Document
-    DOCX_AVAILABLE = True
-except ImportError:
-    pass
+
+# Проверка доступности python-docx (без импорта самой библиотеки)
+DOCX_AVAILABLE = importlib.util.find_spec('docx') is not None
+
+
+# Ограничение одновременных запросов к Write API вместо паузы после каждого запроса;
+# общее для всех потоков, в том числе при параллельном переводе папки
+_write_api_slots = threading.BoundedSemaphore(WRITE_API_MAX_CONCURRENCY)
+
+
+def _iter_files(root):
+    """Рекурсивно обходит папку через os.scandir и возвращает DirEntry файлов (stat берется из записи)"""
+    stack = [str(root)]
+    while stack:
+        current_dir = stack.pop()
+        try:
+            with os.scandir(current_dir) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file():
+                        yield entry
+        except OSError as e:
+            print(f"Предупреждение: Не удалось прочитать папку {current_dir}: {e}")
+
+
+def dump_json(obj):
+    """Сериализует объект в JSON с отступами (UTF-8 bytes): через orjson, если он установлен, иначе через json."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+
+
+def load_json(data):
+    """Разбирает JSON из UTF-8 bytes: через orjson, если он установлен, иначе через json."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data.decode('utf-8'))
+
+
+def _load_deepl():
+    """Импортирует deepl при первом обращении"""
+    global deepl
+    if deepl is None:
+        import deepl as deepl_module
+        deepl = deepl_module
+    return deepl
+
+
+@lru_cache(maxsize=None)
+def _api_key() -> str:
+    """Ключ DeepL API из переменных окружения (.env читается один раз, при первом запросе)"""
+    from dotenv import load_dotenv
+    load_dotenv(BASE_DIR / '.env')
+    return os.getenv('DEEPL_API_KEY', '')
 
 # Языковые опции (расширенные)
 LANGUAGE_OPTIONS = {
@@ -115,6 +194,12 @@ SCIENTIFIC_GLOSSARIES = {
     }
 }
 
+# Глоссарии неизменяемы: замораживаем их, чтобы безопасно разделять между потоками и воркерами
+SCIENTIFIC_GLOSSARIES = MappingProxyType({
+    field: MappingProxyType({lang: MappingProxyType(terms) for lang, terms in lang_map.items()})
+    for field, lang_map in SCIENTIFIC_GLOSSARIES.items()
+})
+
 # Тона для Write API
 TONE_OPTIONS = {
     "confident": "Уверенный (для научных выводов)",
@@ -169,69 +254,135 @@ QUALITY_SETTINGS = {
 class TranslationCache:
     """Кэширование переводов для оптимизации"""
 
+    # Тексты запросов неизменны - SQLite берет скомпилированные выражения из кэша соединения
+    _SQL_KEYS = "SELECT hash FROM translations"
+    _SQL_GET = "SELECT translation FROM translations WHERE hash = ?"
+    _SQL_SET = "INSERT OR REPLACE INTO translations (hash, translation) VALUES (?, ?)"
+    _SQL_SET_PREVIEW = "INSERT OR REPLACE INTO previews (hash, preview) VALUES (?, ?)"
+    _SQL_CLEAR = "DELETE FROM translations"
+    _SQL_CLEAR_PREVIEWS = "DELETE FROM previews"
+    _SQL_GET_DOC = "SELECT output_path FROM doc_cache WHERE src_hash = ?"
+    _SQL_SET_DOC = "INSERT OR REPLACE INTO doc_cache (src_hash, output_path, mtime) VALUES (?, ?, ?)"
+
     def __init__(self, cache_dir: Path = CACHE_DIR):
         self.cache_dir = cache_dir
         self.cache_dir.mkdir(exist_ok=True)
-        self.cache_file = self.cache_dir / 'translations.json'
-        self.cache = self._load_cache()
+        # Переводы хранятся в SQLite: точечные чтения по индексу и запись одной строки,
+        # без загрузки всего кэша в память и перезаписи файла целиком.
+        # Соединение одно на весь срок жизни кэша и открывается при первом обращении
+        self.db_file = self.cache_dir / 'translations.db'
+        self._db = None
+        # Множество известных ключей (загружается при открытии базы): промахи определяются без запроса
+        self._known = set()
+        # Соединение и счетчики разделяются между потоками параллельного перевода папки
+        self._lock = threading.Lock()
         self.stats_file = self.cache_dir / 'stats.json'
         self.stats = self._load_stats()
-
-    def _load_cache(self) -> Dict:
-        """Загрузка кэша из файла"""
-        try:
-            if self.cache_file.exists():
-                with open(self.cache_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-        except Exception as e:
-            print(f"Предупреждение: Не удалось загрузить кэш: {e}")
-        return {}
+        # Счетчики обновляются в памяти; на диск - пачками и при завершении программы
+        self._pending_stats_updates = 0
+        atexit.register(self._flush_stats)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Соединение с базой кэша; при первом вызове открывает его (вызывается под self._lock)"""
+        if self._db is None:
+            self._db = self._open_db()
+            self._known = {row[0] for row in self._db.execute(self._SQL_KEYS)}
+        return self._db
+
+    def _open_db(self) -> sqlite3.Connection:
+        """Открытие базы кэша (autocommit, WAL) и создание таблицы"""
+        db = sqlite3.connect(str(self.db_file), isolation_level=None, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("PRAGMA temp_store=MEMORY")
+        db.execute("PRAGMA mmap_size=268435456")
+        db.execute("PRAGMA cache_size=-20000")  # ~20 МБ страничного кэша
+        version = db.execute("PRAGMA user_version").fetchone()[0]
+        if version != CACHE_SCHEMA_VERSION:
+            # Другая схема: кэш можно пересобрать, поэтому таблицы просто создаются заново
+            for table in ("translations", "previews", "doc_cache"):
+                db.execute(f"DROP TABLE IF EXISTS {table}")
+            db.execute(f"PRAGMA user_version={CACHE_SCHEMA_VERSION}")
+        # В горячем пути пишутся только ключ и перевод, время проставляет сама SQLite
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS translations (hash BLOB PRIMARY KEY, translation TEXT, "
+            "ts INTEGER DEFAULT (strftime('%s','now')))"
+        )
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS previews (hash BLOB PRIMARY KEY, preview TEXT)"
+        )
+        # Переведенные документы по хэшу содержимого исходника и настроек перевода
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS doc_cache ("
+            "src_hash BLOB PRIMARY KEY, output_path TEXT, mtime INTEGER)"
+        )
+        return db
 
     def _load_stats(self) -> Dict:
         """Загрузка статистики"""
         try:
             if self.stats_file.exists():
-                with open(self.stats_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                return load_json(self.stats_file.read_bytes())
         except:
             pass
         return {"cache_hits": 0, "cache_misses": 0, "total_chars_saved": 0}
 
-    def _save_cache(self):
-        """Сохранение кэша в файл"""
-        try:
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(self.cache, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"Предупреждение: Не удалось сохранить кэш: {e}")
-
     def _save_stats(self):
         """Сохранение статистики"""
         try:
-            with open(self.stats_file, 'w', encoding='utf-8') as f:
-                json.dump(self.stats, f, indent=2)
+            # JSON собирается в памяти целиком и пишется одним вызовом write
+            payload = dump_json(self.stats)
+            with open(self.stats_file, 'wb') as f:
+                f.write(payload)
         except:
             pass
 
+    def _record_stats_update(self):
+        """Учитывает обновление статистики и сбрасывает ее на диск каждые STATS_FLUSH_INTERVAL обновлений"""
+        self._pending_stats_updates += 1
+        if self._pending_stats_updates >= STATS_FLUSH_INTERVAL:
+            self._flush_stats()
+
+    def _flush_stats(self):
+        """Сохранение статистики, если есть несохраненные изменения"""
+        if self._pending_stats_updates:
+            self._pending_stats_updates = 0
+            self._save_stats()
+
     def get_hash(self, text: str, source_lang: str, target_lang: str,
-                 formality: str = "default") -> str:
-        """Генерация хэша для кэширования"""
-        key = f"{text[:1000]}|{source_lang}|{target_lang}|{formality}"
-        return hashlib.md5(key.encode()).hexdigest()
+                 formality: str = "default") -> bytes:
+        """Генерация ключа кэша: 16-байтный дайджест BLAKE2b (части хэшируются по очереди, без общей строки)"""
+        h = hashlib.blake2b(digest_size=16)
+        h.update(text[:1000].encode())
+        h.update(b'|')
+        h.update(source_lang.encode())
+        h.update(b'|')
+        h.update(target_lang.encode())
+        h.update(b'|')
+        h.update(formality.encode())
+        return h.digest()
 
     def get(self, text: str, source_lang: str, target_lang: str,
             formality: str = "default") -> Optional[str]:
         """Получение перевода из кэша"""
         hash_key = self.get_hash(text, source_lang, target_lang, formality)
-        result = self.cache.get(hash_key)
-
-        if result:
-            self.stats["cache_hits"] += 1
-            self.stats["total_chars_saved"] += len(text)
-            self._save_stats()
-        else:
-            self.stats["cache_misses"] += 1
-            self._save_stats()
+        return self.get_by_hash(hash_key, len(text))
+
+    def get_by_hash(self, hash_key: bytes, text_length: int = 0) -> Optional[str]:
+        """Получение перевода по готовому ключу (из get_hash) без повторного хэширования"""
+        with self._lock:
+            db = self._connection()
+            result = None
+            if hash_key in self._known:
+                row = db.execute(self._SQL_GET, (hash_key,)).fetchone()
+                result = row[0] if row else None
+
+            if result:
+                self.stats["cache_hits"] += 1
+                self.stats["total_chars_saved"] += text_length
+            else:
+                self.stats["cache_misses"] += 1
+            self._record_stats_update()
 
         return result
 
@@ -239,12 +390,57 @@ class TranslationCache:
             target_lang: str, formality: str = "default"):
         """Сохранение перевода в кэш"""
         hash_key = self.get_hash(text, source_lang, target_lang, formality)
-        self.cache[hash_key] = {
-            "translation": translated_text,
-            "timestamp": datetime.now().isoformat(),
-            "source_preview": text[:100]
-        }
-        self._save_cache()
+        self.set_by_hash(hash_key, translated_text)
+
+    def set_by_hash(self, hash_key: bytes, translated_text: str, preview: Optional[str] = None):
+        """Сохранение перевода по готовому ключу (из get_hash) без повторного хэширования.
+
+        Превью исходника пишется в отдельную таблицу previews только по явному запросу.
+        """
+        try:
+            with self._lock:
+                db = self._connection()
+                db.execute(self._SQL_SET, (hash_key, translated_text))
+                if preview is not None:
+                    db.execute(self._SQL_SET_PREVIEW, (hash_key, preview))
+                self._known.add(hash_key)
+        except sqlite3.Error as e:
+            print(f"Предупреждение: Не удалось сохранить кэш: {e}")
+
+    @staticmethod
+    def document_hash(file_path: Path, *settings: str) -> bytes:
+        """
+        Хэш документа для кэша переводов документов: BLAKE2b от настроек перевода и содержимого файла.
+        Файл хэшируется через mmap - без чтения всего содержимого в память
+        """
+        h = hashlib.blake2b(digest_size=16)
+        h.update('|'.join(settings).encode())
+        h.update(b'\0')
+        with open(file_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    h.update(mm)
+        return h.digest()
+
+    def get_document(self, src_hash: bytes) -> Optional[Path]:
+        """Путь к ранее сделанному переводу документа с таким хэшем (если файл еще существует)"""
+        with self._lock:
+            row = self._connection().execute(self._SQL_GET_DOC, (src_hash,)).fetchone()
+        if row:
+            output_path = Path(row[0])
+            if output_path.is_file():
+                return output_path
+        return None
+
+    def set_document(self, src_hash: bytes, output_path: Path):
+        """Запоминает перевод документа с данным хэшем"""
+        try:
+            with self._lock:
+                self._connection().execute(
+                    self._SQL_SET_DOC, (src_hash, str(output_path), int(time.time()))
+                )
+        except sqlite3.Error as e:
+            print(f"Предупреждение: Не удалось сохранить кэш документов: {e}")
 
     def get_stats(self) -> Dict:
         """Получение статистики кэша"""
@@ -252,8 +448,11 @@ class TranslationCache:
 
     def clear(self):
         """Очистка кэша"""
-        self.cache = {}
-        self._save_cache()
+        with self._lock:
+            db = self._connection()
+            db.execute(self._SQL_CLEAR)
+            db.execute(self._SQL_CLEAR_PREVIEWS)
+            self._known.clear()
         print("Кэш очищен.")
 
 
@@ -265,6 +464,8 @@ class GlossaryManager:
         self.glossaries_dir = BASE_DIR / 'glossaries'
         self.glossaries_dir.mkdir(exist_ok=True)
         self.glossaries = {}
+        # Кэш list_glossaries: (mtime_ns папки глоссариев, список)
+        self._glossary_cache: Optional[Tuple[int, List[Dict]]] = None
 
     def create_glossary(self, name: str, source_lang: str, target_lang: str,
                         entries: Dict[str, str]) -> Optional[str]:
@@ -288,15 +489,19 @@ class GlossaryManager:
 
             # Сохраняем локальную копию
             glossary_file = self.glossaries_dir / f"{name}.json"
-            with open(glossary_file, 'w', encoding='utf-8') as f:
-                json.dump({
-                    "id": glossary.glossary_id,
-                    "name": name,
-                    "source_lang": source_lang,
-                    "target_lang": target_lang,
-                    "entries": entries,
-                    "created": datetime.now().isoformat()
-                }, f, ensure_ascii=False, indent=2)
+            # JSON собирается в памяти целиком и пишется одним вызовом write
+            payload = dump_json({
+                "id": glossary.glossary_id,
+                "name": name,
+                "source_lang": source_lang,
+                "target_lang": target_lang,
+                "entries": entries,
+                "created": datetime.now().isoformat()
+            })
+            with open(glossary_file, 'wb') as f:
+                f.write(payload)
+            # Перезапись существующего файла не меняет mtime папки - сбрасываем кэш списка явно
+            self._glossary_cache = None
 
             self.glossaries[name] = glossary.glossary_id
             print(f"✓ Глоссарий '{name}' создан успешно")
@@ -309,31 +514,35 @@ class GlossaryManager:
     def load_glossary_from_file(self, file_path: Path) -> Optional[Dict]:
         """Загрузка глоссария из файла"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                if file_path.suffix == '.json':
-                    return json.load(f)
-                elif file_path.suffix in ['.txt', '.tsv']:
-                    entries = {}
-                    for line in f:
-                        parts = line.strip().split('\t')
-                        if len(parts) == 2:
-                            entries[parts[0]] = parts[1]
-                    return entries
+            if file_path.suffix == '.json':
+                return load_json(file_path.read_bytes())
+            if file_path.suffix in ['.txt', '.tsv']:
+                # csv.reader разбирает строки в C; кавычки не интерпретируются - поля берутся как есть
+                with open(file_path, 'r', encoding='utf-8', newline='') as f:
+                    reader = csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE)
+                    return {row[0].lstrip(): row[1].rstrip() for row in reader if len(row) == 2}
         except Exception as e:
             print(f"Ошибка загрузки глоссария: {e}")
         return None
 
     def list_glossaries(self) -> List[Dict]:
-        """Список доступных глоссариев"""
+        """Список доступных глоссариев (файлы перечитываются, только если папка изменилась)"""
+        try:
+            mtime = self.glossaries_dir.stat().st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime is not None and self._glossary_cache and self._glossary_cache[0] == mtime:
+            return list(self._glossary_cache[1])
+
         glossaries = []
         for file in self.glossaries_dir.glob("*.json"):
             try:
-                with open(file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    glossaries.append(data)
+                glossaries.append(load_json(file.read_bytes()))
             except:
                 continue
-        return glossaries
+        if mtime is not None:
+            self._glossary_cache = (mtime, glossaries)
+        return list(glossaries)
 
     def create_scientific_glossary(self, field: str, source_lang: str = "EN",
                                    target_lang: str = "RU") -> Optional[str]:
@@ -346,7 +555,8 @@ class GlossaryManager:
             print(f"Предупреждение: Язык {source_lang} не поддерживается для области {field}")
             return None
 
-        entries = SCIENTIFIC_GLOSSARIES[field][source_lang]
+        # Копия в обычный dict: записи сохраняются в JSON вместе с глоссарием
+        entries = dict(SCIENTIFIC_GLOSSARIES[field][source_lang])
         glossary_name = f"Scientific_{field}_{source_lang}_{target_lang}"
 
         print(f"Создание научного глоссария: {SCIENTIFIC_FIELDS[field]}")
@@ -359,6 +569,7 @@ class EnhancedTranslator:
     """Расширенный переводчик с дополнительными функциями"""
 
     def __init__(self):
+        _load_deepl()
         self.translator = None
         self.cache = TranslationCache()
         self.glossary_manager = None
@@ -368,10 +579,16 @@ class EnhancedTranslator:
             "characters_processed": 0,
             "errors_encountered": 0
         }
+        self._usage_lock = threading.Lock()  # usage_stats обновляются из потоков перевода папки
+
+    def _count_usage(self, key: str, amount: int = 1):
+        """Потокобезопасное увеличение счетчика usage_stats"""
+        with self._usage_lock:
+            self.usage_stats[key] += amount
 
     def check_api_key(self) -> bool:
         """Проверка наличия API ключа"""
-        if not DEEPL_API_KEY:
+        if not _api_key():
             print("Ошибка: Ключ DeepL API не найден.")
             print("Создайте файл .env и добавьте:")
             print("DEEPL_API_KEY=your_api_key_here")
@@ -386,7 +603,7 @@ class EnhancedTranslator:
             return False
 
         try:
-            self.translator = deepl.Translator(DEEPL_API_KEY)
+            self.translator = deepl.Translator(_api_key())
 
             # Проверка лимитов
             usage = self.translator.get_usage()
@@ -448,13 +665,14 @@ class EnhancedTranslator:
     def translate_text_with_retry(self, text: str, source_lang: str,
                                   target_lang: str, **kwargs) -> Optional[str]:
         """Перевод текста с повторными попытками при ошибке"""
+        # Ключ кэша считается один раз на вызов, а не при каждой попытке и каждом обращении к кэшу
+        formality = kwargs.get('formality', 'default')
+        cache_key = self.cache.get_hash(text, source_lang, target_lang, formality)
+
         for attempt in range(MAX_RETRIES):
             try:
                 # Проверяем кэш
-                cached = self.cache.get(
-                    text, source_lang, target_lang,
-                    kwargs.get('formality', 'default')
-                )
+                cached = self.cache.get_by_hash(cache_key, len(text))
 
                 if cached:
                     print("  📋 Использован кэш")
@@ -471,10 +689,7 @@ class EnhancedTranslator:
                 translated = result.text if hasattr(result, 'text') else str(result)
 
                 # Сохраняем в кэш
-                self.cache.set(
-                    text, translated, source_lang, target_lang,
-                    kwargs.get('formality', 'default')
-                )
+                self.cache.set_by_hash(cache_key, translated)
 
                 return translated
 
@@ -491,7 +706,7 @@ class EnhancedTranslator:
                     time.sleep(RETRY_DELAY)
                 else:
                     print(f"✗ Ошибка перевода: {e}")
-                    self.usage_stats["errors_encountered"] += 1
+                    self._count_usage("errors_encountered")
                     break
 
         return None
@@ -504,11 +719,12 @@ class EnhancedTranslator:
 
         try:
             if hasattr(self.translator, 'rephrase_text'):
-                result = self.translator.rephrase_text(
-                    text,
-                    target_lang=target_lang,
-                    style=style
-                )
+                with _write_api_slots:
+                    result = self.translator.rephrase_text(
+                        text,
+                        target_lang=target_lang,
+                        style=style
+                    )
                 return result.text if hasattr(result, 'text') else str(result)
         except Exception as e:
             print(f"  ⚠ Не удалось применить улучшение стиля: {e}")
@@ -518,19 +734,28 @@ class EnhancedTranslator:
     def translate_document_enhanced(self, file_path: Path, output_path: Path,
                                    source_lang: str, target_lang: str,
                                    quality_setting: Dict,
-                                   glossary_id: Optional[str] = None) -> bool:
-        """Улучшенный перевод документа с дополнительными опциями"""
-
-        print(f"\n{'='*60}")
-        print(f"📄 Перевод: {file_path.name}")
-        print(f"🔄 Направление: {source_lang} -> {target_lang}")
-        print(f"⚙ Настройки: {quality_setting['name']}")
+                                   glossary_id: Optional[str] = None,
+                                   batch: bool = False,
+                                   file_size: Optional[int] = None) -> bool:
+        """
+        Улучшенный перевод документа с дополнительными опциями.
+        batch=True - пакетный режим (перевод папки): без интерактивного вопроса о перезаписи.
+        file_size - размер исходного файла, если уже известен (иначе берется через stat)
+        """
+        # В пакетном режиме ход перевода каждого файла уходит в журнал (DEBUG),
+        # на экране остается только общая строка прогресса папки
+        say = log.debug if batch else print
+
+        say(f"\n{'='*60}")
+        say(f"📄 Перевод: {file_path.name}")
+        say(f"🔄 Направление: {source_lang} -> {target_lang}")
+        say(f"⚙ Настройки: {quality_setting['name']}")
         if glossary_id:
-            print(f"📚 Глоссарий применен")
-        print(f"{'='*60}\n")
+            say(f"📚 Глоссарий применен")
+        say(f"{'='*60}\n")
 
-        # Проверка существования выходного файла
-        if output_path.exists():
+        # Проверка существования выходного файла (в пакетном режиме существующие файлы отсеяны заранее)
+        if not batch and output_path.exists():
             overwrite = input(f"\nФайл {output_path.name} существует. Перезаписать? (y/n): ")
             if overwrite.lower() != 'y':
                 print("Пропуск файла.")
@@ -538,9 +763,10 @@ class EnhancedTranslator:
 
         try:
             start_time = time.time()
-            file_size = file_path.stat().st_size
+            if file_size is None:
+                file_size = file_path.stat().st_size
 
-            print(f"📏 Размер файла: {file_size:,} байт")
+            say(f"📏 Размер файла: {file_size:,} байт")
 
             # Подготовка параметров перевода
             translation_params = {
@@ -551,22 +777,21 @@ class EnhancedTranslator:
             }
 
             # Добавляем formality если поддерживается
-            formality_supported_langs = ['DE', 'FR', 'IT', 'ES', 'NL', 'PL', 'PT-PT', 'PT-BR', 'RU', 'JA']
-            if target_lang in formality_supported_langs and quality_setting.get('formality') != 'default':
+            if target_lang in FORMALITY_LANGS and quality_setting.get('formality') != 'default':
                 translation_params["formality"] = quality_setting['formality']
-                print(f"  ✓ Применена формальность: {quality_setting['formality']}")
+                say(f"  ✓ Применена формальность: {quality_setting['formality']}")
 
             # Добавляем глоссарий если есть
             if glossary_id and hasattr(self.translator, 'translate_document_from_filepath'):
                 translation_params["glossary"] = glossary_id
-                print(f"  ✓ Глоссарий применен")
+                say(f"  ✓ Глоссарий применен")
 
             # Этап 1: Перевод документа
-            print("\n⏳ Этап 1: Перевод документа...")
+            say("\n⏳ Этап 1: Перевод документа...")
             self.translator.translate_document_from_filepath(**translation_params)
 
             elapsed_translation = time.time() - start_time
-            print(f"  ✓ Документ переведен за {elapsed_translation:.1f} сек.")
+            say(f"  ✓ Документ переведен за {elapsed_translation:.1f} сек.")
 
             # Этап 2: Применение Write API для улучшения стиля (если доступен и включен)
             if (quality_setting.get('use_write_api') and
@@ -574,50 +799,64 @@ class EnhancedTranslator:
                 output_path.suffix.lower() == '.docx' and
                 DOCX_AVAILABLE):
 
-                print("\n⏳ Этап 2: Улучшение стиля (Write API)...")
+                say("\n⏳ Этап 2: Улучшение стиля (Write API)...")
 
                 try:
                     # Извлекаем текст из DOCX
+                    from docx import Document
                     doc = Document(output_path)
                     improved_count = 0
-
-                    for para in doc.paragraphs:
-                        if para.text.strip() and len(para.text) > 50:
-                            original_text = para.text
-                            improved_text = self.apply_write_api_improvement(
-                                original_text,
-                                target_lang,
-                                quality_setting.get('writing_style', 'academic')
-                            )
-
+                    style = quality_setting.get('writing_style', 'academic')
+
+                    # Параграфы для улучшения отправляются параллельно; число одновременных
+                    # запросов ограничено семафором Write API.
+                    # para.text собирается из runs при каждом обращении - берем его один раз
+                    paragraphs = doc.paragraphs
+                    candidates = [
+                        (idx, text) for idx, para in enumerate(paragraphs)
+                        if len(text := para.text) > 50 and text.strip()
+                    ]
+
+                    with ThreadPoolExecutor(max_workers=WRITE_API_MAX_CONCURRENCY) as executor:
+                        futures = {
+                            executor.submit(self.apply_write_api_improvement, text, target_lang, style): (idx, text)
+                            for idx, text in candidates
+                        }
+                        for future in as_completed(futures):
+                            idx, original_text = futures[future]
+                            improved_text = future.result()
                             if improved_text != original_text:
-                                para.text = improved_text
+                                paragraphs[idx].text = improved_text
                                 improved_count += 1
 
-                            # Пауза между запросами
-                            if PAUSE_BETWEEN_REQUESTS > 0:
-                                time.sleep(PAUSE_BETWEEN_REQUESTS)
-
                     if improved_count > 0:
-                        doc.save(output_path)
-                        print(f"  ✓ Улучшено {improved_count} параграфов")
+                        # Сохраняем во временный файл рядом и атомарно подменяем результат:
+                        # при сбое записи переведенный документ остается целым
+                        tmp_path = output_path.with_name(output_path.name + '.tmp')
+                        try:
+                            doc.save(tmp_path)
+                            os.replace(tmp_path, output_path)
+                        finally:
+                            if tmp_path.exists():
+                                tmp_path.unlink()
+                        say(f"  ✓ Улучшено {improved_count} параграфов")
                     else:
-                        print("  ℹ Улучшения не требуются")
+                        say("  ℹ Улучшения не требуются")
 
                 except Exception as e:
                     print(f"  ⚠ Не удалось применить улучшения: {e}")
 
             # Обновление статистики
-            self.usage_stats["documents_translated"] += 1
-            self.usage_stats["characters_processed"] += file_size  # Приблизительно
+            self._count_usage("documents_translated")
+            self._count_usage("characters_processed", file_size)  # Приблизительно
 
             elapsed_total = time.time() - start_time
 
-            print(f"\n{'='*60}")
-            print(f"✅ УСПЕШНО ЗАВЕРШЕНО")
-            print(f"⏱ Общее время: {elapsed_total:.1f} сек.")
-            print(f"💾 Сохранено: {output_path.name}")
-            print(f"{'='*60}\n")
+            say(f"\n{'='*60}")
+            say(f"✅ УСПЕШНО ЗАВЕРШЕНО")
+            say(f"⏱ Общее время: {elapsed_total:.1f} сек.")
+            say(f"💾 Сохранено: {output_path.name}")
+            say(f"{'='*60}\n")
 
             # Пауза между запросами
             if PAUSE_BETWEEN_REQUESTS > 0:
@@ -627,14 +866,14 @@ class EnhancedTranslator:
 
         except deepl.DocumentTranslationException as e:
             print(f"✗ Ошибка перевода документа: {e}")
-            self.usage_stats["errors_encountered"] += 1
+            self._count_usage("errors_encountered")
             return False
         except deepl.QuotaExceededException:
             print("✗ Превышена квота API")
             return False
         except Exception as e:
             print(f"✗ Непредвиденная ошибка: {e}")
-            self.usage_stats["errors_encountered"] += 1
+            self._count_usage("errors_encountered")
             import traceback
             traceback.print_exc()
             return False
@@ -654,17 +893,20 @@ class EnhancedTranslator:
             print(f"Ошибка при создании папки: {e}")
             return
 
-        # Поиск файлов
-        files_found = []
-        for ext in SUPPORTED_EXTENSIONS:
-            files_found.extend(folder_path.rglob(f"*{ext}"))
-
-        # Фильтрация файлов
+        # Поиск файлов: один обход дерева для всех расширений, фильтр по имени до создания Path
+        extensions = {ext.lower() for ext in SUPPORTED_EXTENSIONS}
+        # Размер файла берется из той же записи каталога и передается дальше, без повторного stat
         files_to_translate = []
-        for f in files_found:
-            if f.is_file() and not f.name.startswith('~$'):
-                if not any(suffix in f.stem for suffix in ['_translated_', '_to_']):
-                    files_to_translate.append(f)
+        for entry in _iter_files(folder_path):
+            name = entry.name
+            if name.startswith('~$'):
+                continue
+            stem, ext = os.path.splitext(name)
+            if ext.lower() not in extensions:
+                continue
+            if '_translated_' in stem or '_to_' in stem:
+                continue
+            files_to_translate.append((Path(entry.path), entry.stat().st_size))
 
         if not files_to_translate:
             print(f"\n❌ Не найдено файлов {SUPPORTED_EXTENSIONS} в папке.")
@@ -675,7 +917,7 @@ class EnhancedTranslator:
 
         # Показываем список файлов
         print("\n📋 Файлы для перевода:")
-        for i, file in enumerate(files_to_translate[:10], 1):
+        for i, (file, _) in enumerate(files_to_translate[:10], 1):
             print(f"  {i}. {file.name}")
         if len(files_to_translate) > 10:
             print(f"  ... и еще {len(files_to_translate) - 10} файлов")
@@ -686,43 +928,89 @@ class EnhancedTranslator:
             print("Отменено.")
             return
 
-        # Последовательный перевод
+        # Параллельный перевод: документы отправляются в DeepL одновременно (до FOLDER_MAX_WORKERS задач)
         success_count = 0
         error_count = 0
         skipped_count = 0
+        reused_count = 0
 
-        print(f"\n🚀 Начинаю последовательный перевод...\n")
+        print(f"\n🚀 Начинаю параллельный перевод (потоков: {FOLDER_MAX_WORKERS})...\n")
         print("=" * 60)
 
-        for i, file_path in enumerate(files_to_translate, 1):
+        # Уже существующие переводы собираются одним обходом папки результатов, а не exists() на каждый файл
+        existing_outputs = {entry.path for entry in _iter_files(output_folder)}
+        created_dirs = set()
+
+        tasks = []
+        for i, (file_path, file_size) in enumerate(files_to_translate, 1):
             # Вычисляем относительный путь
             try:
                 relative_path = file_path.relative_to(folder_path)
             except ValueError:
-                relative_path = file_path.name
+                relative_path = Path(file_path.name)
 
             # Создаем путь для сохранения
             output_path = output_folder / relative_path.parent / f"{file_path.stem}{TRANSLATION_SUFFIX}_{target_lang.lower()}{file_path.suffix}"
 
-            # Создаем подпапки если нужно
-            output_path.parent.mkdir(parents=True, exist_ok=True)
-
-            print(f"\n[{i}/{len(files_to_translate)}] 📄 {relative_path}")
-
             # Проверяем, не существует ли уже файл
-            if output_path.exists():
-                print("  ⏭ Пропуск: файл уже существует")
+            if str(output_path) in existing_outputs:
+                log.debug("[%d/%d] ⏭ Пропуск: файл уже существует: %s", i, len(files_to_translate), relative_path)
                 skipped_count += 1
                 continue
 
-            # Переводим файл
-            if self.translate_document_enhanced(
-                file_path, output_path, source_lang, target_lang,
-                quality_setting, glossary_id
-            ):
-                success_count += 1
-            else:
-                error_count += 1
+            # Создаем подпапки если нужно (каждую - один раз)
+            if output_path.parent not in created_dirs:
+                output_path.parent.mkdir(parents=True, exist_ok=True)
+                created_dirs.add(output_path.parent)
+            tasks.append((file_path, output_path, relative_path, file_size))
+
+        if skipped_count:
+            print(f"⏭ Пропущено (перевод уже существует): {skipped_count}")
+
+        # Прогресс - одна строка, перерисовываемая на месте, вместо нескольких строк на файл
+        progress = tqdm(total=len(tasks), unit='файл', desc='Перевод') if TQDM_AVAILABLE else None
+
+        with ThreadPoolExecutor(max_workers=FOLDER_MAX_WORKERS) as executor:
+            futures = {
+                executor.submit(
+                    self._translate_folder_file,
+                    file_path, output_path, source_lang, target_lang,
+                    quality_setting, glossary_id, file_size
+                ): relative_path
+                for file_path, output_path, relative_path, file_size in tasks
+            }
+
+            for done, future in enumerate(as_completed(futures), 1):
+                relative_path = futures[future]
+                try:
+                    status = future.result()
+                except Exception as e:
+                    print(f"✗ Непредвиденная ошибка: {e}")
+                    status = "failed"
+
+                if status == "translated":
+                    success_count += 1
+                    mark = '✅'
+                elif status == "reused":
+                    reused_count += 1
+                    mark = '♻'
+                else:
+                    error_count += 1
+                    mark = '❌'
+                log.debug("[%d/%d] %s %s", done, len(tasks), mark, relative_path)
+
+                summary = f"✅ {success_count}  ♻ {reused_count}  ❌ {error_count}"
+                if progress is not None:
+                    progress.set_postfix_str(summary, refresh=False)
+                    progress.update(1)
+                else:
+                    sys.stdout.write(f"\r  [{done}/{len(tasks)}] {summary}")
+                    sys.stdout.flush()
+
+        if progress is not None:
+            progress.close()
+        elif tasks:
+            sys.stdout.write("\n")
 
         # Итоги
         print("\n" + "=" * 60)
@@ -731,12 +1019,46 @@ class EnhancedTranslator:
         print(f"  ✅ Успешно переведено: {success_count}")
         print(f"  ❌ Ошибок: {error_count}")
         print(f"  ⏭ Пропущено: {skipped_count}")
+        print(f"  ♻ Взято из прежних переводов: {reused_count}")
         print(f"  💾 Переводы сохранены в: {output_folder}")
         print("=" * 60)
 
         # Статистика использования
         self._print_usage_stats()
 
+    def _translate_folder_file(self, file_path: Path, output_path: Path,
+                               source_lang: str, target_lang: str,
+                               quality_setting: Dict, glossary_id: Optional[str],
+                               file_size: int) -> str:
+        """
+        Перевод одного файла папки с учетом кэша документов.
+        Если этот же исходник (по содержимому) уже переводился с теми же настройками и перевод
+        сохранился, он копируется вместо повторного обращения к API.
+        Возвращает "translated", "reused" или "failed"
+        """
+        src_hash = None
+        try:
+            src_hash = self.cache.document_hash(
+                file_path, source_lang, target_lang, quality_setting['name'], glossary_id or ''
+            )
+            previous_output = self.cache.get_document(src_hash)
+            if previous_output is not None:
+                shutil.copyfile(previous_output, output_path)
+                log.debug("♻ %s: использован прежний перевод %s", file_path.name, previous_output)
+                return "reused"
+        except OSError as e:
+            print(f"  ⚠ Кэш документов недоступен для {file_path.name}: {e}")
+
+        if not self.translate_document_enhanced(
+            file_path, output_path, source_lang, target_lang,
+            quality_setting, glossary_id, True, file_size
+        ):
+            return "failed"
+
+        if src_hash is not None:
+            self.cache.set_document(src_hash, output_path)
+        return "translated"
+
     def _print_usage_stats(self):
         """Вывод статистики использования"""
         print(f"\n📈 Статистика сессии:")
@@ -884,6 +1206,7 @@ def manage_glossaries(translator: EnhancedTranslator) -> Optional[str]:
 
 def main():
     """Главная функция"""
+    logging.basicConfig(level=LOG_LEVEL, format='%(message)s')
     print("=" * 60)
     print("🚀 DeepL Enhanced Translator")
     print("📚 Улучшенный переводчик научных документов")
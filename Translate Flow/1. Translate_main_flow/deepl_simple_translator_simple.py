@@ -6,8 +6,19 @@
 
 import deepl
 import os
+import re
 import sys
+import json
 import time
+import queue
+import shutil
+import hashlib
+import logging
+import logging.handlers
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -21,9 +32,19 @@ load_dotenv(BASE_DIR / '.env')
 DEEPL_API_KEY = os.getenv('DEEPL_TEXT_API_KEY', '')
 if not DEEPL_API_KEY:
     DEEPL_API_KEY = os.getenv('DEEPL_API_KEY', '')
-SUPPORTED_EXTENSIONS = ['.docx', '.pdf', '.html', '.htm']
+SUPPORTED_EXTENSIONS = frozenset({'.docx', '.pdf', '.html', '.htm'})  # Множество: проверка suffix in ... без перебора списка
+# Имя файла, который уже является переводом (пропускается при переводе папки)
+_ALREADY_TRANSLATED_RE = re.compile(r'_translated_|_to_')
+# Целевые языки, для которых DeepL поддерживает параметр formality
+FORMALITY_SUPPORTED_LANGS = frozenset({'DE', 'FR', 'IT', 'ES', 'NL', 'PL', 'PT-PT', 'PT-BR', 'RU', 'JA'})
 TRANSLATION_SUFFIX = "_translated"
 PAUSE_BETWEEN_REQUESTS = 0.5  # Пауза между запросами в секундах
+MAX_CONCURRENT_TRANSLATIONS = 4  # Документов папки, переводимых одновременно (не больше ~10 на ключ)
+# Кэш переведенных документов: хэш содержимого + настройки -> путь к готовому переводу
+DOC_CACHE_FILE = Path(__file__).resolve().parent / '.deepl_cache' / 'documents.json'
+DOC_CACHE_MAX_ENTRIES = 10_000  # Самые давно не использованные записи вытесняются
+STATUS_POLL_BACKOFF = 1.5  # Множитель паузы между опросами статуса перевода документа
+STATUS_POLL_MAX_DELAY = 30.0  # Максимальная пауза между опросами, сек.
 
 # Проверка доступности python-docx
 DOCX_AVAILABLE = False
@@ -41,6 +62,148 @@ LANGUAGE_OPTIONS = {
 }
 
 
+# Начала запросов к API разносятся не менее чем на PAUSE_BETWEEN_REQUESTS - общее ограничение для всех потоков
+_request_lock = threading.Lock()
+_next_request_at = 0.0
+
+
+def wait_request_slot():
+    """Ожидание очереди на запрос к API (не чаще одного запроса в PAUSE_BETWEEN_REQUESTS сек.)"""
+    global _next_request_at
+    with _request_lock:
+        now = time.monotonic()
+        delay = _next_request_at - now
+        _next_request_at = max(now, _next_request_at) + PAUSE_BETWEEN_REQUESTS
+    if delay > 0:
+        time.sleep(delay)
+
+
+# Журнал перевода папки: сообщения потоков-исполнителей (выводятся через queued_logging)
+log = logging.getLogger('translator')
+
+
+@contextmanager
+def queued_logging():
+    """
+    Вывод журнала через очередь: потоки только кладут записи в очередь, в stdout их пишет
+    один поток QueueListener - без борьбы исполнителей за блокировку stdout.
+    При выходе очередь дописывается до конца, поэтому итоги печатаются после всех сообщений.
+    """
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter('%(message)s'))
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+
+    log.addHandler(queue_handler)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    listener.start()
+    try:
+        yield
+    finally:
+        listener.stop()
+        log.removeHandler(queue_handler)
+
+
+# Индекс кэша документов (OrderedDict в порядке последнего использования), загружается при первом обращении
+_doc_cache = None
+_doc_cache_lock = threading.Lock()
+
+
+def document_cache_key(file_data, source_lang, target_lang, formality):
+    """Ключ кэша документов: BLAKE2b содержимого файла (bytes) и настройки перевода"""
+    digest = hashlib.blake2b(file_data, digest_size=16).hexdigest()
+    return f"{digest}:{source_lang}:{target_lang}:{formality or ''}"
+
+
+def _load_doc_cache():
+    """Загрузка индекса кэша документов с диска (вызывается под _doc_cache_lock)"""
+    global _doc_cache
+    if _doc_cache is None:
+        _doc_cache = OrderedDict()
+        try:
+            with open(DOC_CACHE_FILE, 'r', encoding='utf-8') as f:
+                _doc_cache.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+    return _doc_cache
+
+
+def lookup_cached_translation(key):
+    """Путь к прежнему переводу этого документа или None (записи с удаленными файлами отбрасываются)"""
+    with _doc_cache_lock:
+        cache = _load_doc_cache()
+        cached_path = cache.get(key)
+        if cached_path is None:
+            return None
+        if not os.path.isfile(cached_path):
+            del cache[key]
+            return None
+        cache.move_to_end(key)
+        return Path(cached_path)
+
+
+def remember_translation(key, output_path):
+    """Регистрация готового перевода в кэше документов"""
+    with _doc_cache_lock:
+        cache = _load_doc_cache()
+        cache[key] = str(Path(output_path).resolve())
+        cache.move_to_end(key)
+        while len(cache) > DOC_CACHE_MAX_ENTRIES:
+            cache.popitem(last=False)
+
+
+def save_doc_cache():
+    """Сохранение индекса кэша документов (через временный файл)"""
+    with _doc_cache_lock:
+        if _doc_cache is None:
+            return
+        try:
+            DOC_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = DOC_CACHE_FILE.with_suffix('.tmp')
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(_doc_cache, f, ensure_ascii=False)
+            os.replace(tmp_file, DOC_CACHE_FILE)
+        except OSError as e:
+            print(f"Предупреждение: Не удалось сохранить кэш документов: {e}")
+
+
+def translate_document_with_backoff(translator, input_path, output_path, input_data=None, **params):
+    """
+    Перевод документа в три шага: загрузка, опрос статуса с растущей паузой (1; 1.5; 2.25 ... до
+    STATUS_POLL_MAX_DELAY сек.) и скачивание результата. Клиент DeepL опрашивает статус каждые 5 сек.,
+    что на долгих переводах PDF дает много лишних запросов.
+    При ошибке недописанный выходной файл удаляется, как в translate_document_from_filepath.
+    input_data - уже прочитанное содержимое файла: загружается без повторного чтения с диска.
+    """
+    if input_data is not None:
+        handle = translator.translate_document_upload(input_data, filename=Path(input_path).name, **params)
+    else:
+        with open(input_path, 'rb') as in_file:
+            handle = translator.translate_document_upload(in_file, **params)
+
+    try:
+        attempt = 0
+        status = translator.translate_document_get_status(handle)
+        while status.ok and not status.done:
+            time.sleep(min(STATUS_POLL_MAX_DELAY, STATUS_POLL_BACKOFF ** attempt))
+            attempt += 1
+            status = translator.translate_document_get_status(handle)
+
+        if status.ok:
+            with open(output_path, 'wb') as out_file:
+                translator.translate_document_download(handle, out_file)
+    except Exception as e:
+        Path(output_path).unlink(missing_ok=True)
+        raise deepl.DocumentTranslationException(str(e), handle) from e
+
+    if not status.ok:
+        error_message = status.error_message or "unknown error"
+        raise deepl.DocumentTranslationException(f"Ошибка перевода документа: {error_message}", handle)
+    return status
+
+
 def check_api_key():
     """Проверка наличия API ключа"""
     if not DEEPL_API_KEY:
@@ -119,11 +282,13 @@ def translate_single_file(translator, file_path, source_lang, target_lang):
     print(f"Направление: {source_lang} -> {target_lang}")
     
     # Проверка существования выходного файла
+    overwrite_confirmed = False
     if output_path.exists():
         overwrite = input(f"\nФайл {output_path.name} уже существует. Перезаписать? (y/n): ")
         if overwrite.lower() != 'y':
             print("Пропуск файла.")
             return False
+        overwrite_confirmed = True  # Явная перезапись - значит нужен новый перевод, а не кэш
     
     try:
         start_time = time.time()
@@ -139,14 +304,27 @@ def translate_single_file(translator, file_path, source_lang, target_lang):
         }
         
         # Добавляем formality только для поддерживаемых языков
-        formality_supported_langs = ['DE', 'FR', 'IT', 'ES', 'NL', 'PL', 'PT-PT', 'PT-BR', 'RU', 'JA']
-        if target_lang in formality_supported_langs:
+        if target_lang in FORMALITY_SUPPORTED_LANGS:
             translation_params["formality"] = "more"
         
+        # Тот же документ с теми же настройками уже переводился - копируем готовый перевод
+        # Файл читается один раз: содержимое идет и в ключ кэша, и в загрузку на DeepL
+        file_data = file_path.read_bytes()
+        cache_key = document_cache_key(file_data, source_lang, target_lang, translation_params.get("formality"))
+        cached_path = None if overwrite_confirmed else lookup_cached_translation(cache_key)
+        # Кэш, указывающий на сам выходной файл, копировать некуда (SameFileError)
+        if cached_path is not None and cached_path.resolve() != output_path.resolve():
+            shutil.copyfile(cached_path, output_path)
+            print(f"✓ Использован прежний перевод: {cached_path}")
+            print(f"  Сохранен как: {output_path.name}")
+            return True
+        
         # Примечание: Для научных текстов на английский DeepL автоматически
         # использует формальный стиль на основе контекста документа
         
-        translator.translate_document_from_filepath(**translation_params)
+        translate_document_with_backoff(translator, input_data=file_data, **translation_params)
+        remember_translation(cache_key, output_path)
+        save_doc_cache()
         
         elapsed = time.time() - start_time
         print(f"✓ Успешно переведен за {elapsed:.1f} сек.")
@@ -178,18 +356,11 @@ def translate_single_file(translator, file_path, source_lang, target_lang):
 
 
 def translate_single_file_to_path(translator, file_path, output_path, source_lang, target_lang):
-    """Перевод одного файла с указанием пути вывода"""
-    print(f"  Перевод: {file_path.name}")
-    print(f"  Сохранить как: {output_path.name}")
-    
-    # Проверка существования выходного файла
-    if output_path.exists():
-        print("  Пропуск: файл уже существует")
-        return False
-    
+    """
+    Перевод одного файла с указанием пути вывода (вызывается из нескольких потоков).
+    Существование выходного файла и его папки проверяет translate_folder до отправки задачи.
+    """
     try:
-        start_time = time.time()
-        
         # Выполняем перевод
         translation_params = {
             "input_path": str(file_path),
@@ -199,40 +370,72 @@ def translate_single_file_to_path(translator, file_path, output_path, source_lan
         }
         
         # Добавляем formality только для поддерживаемых языков
-        formality_supported_langs = ['DE', 'FR', 'IT', 'ES', 'NL', 'PL', 'PT-PT', 'PT-BR', 'RU', 'JA']
-        if target_lang in formality_supported_langs:
+        if target_lang in FORMALITY_SUPPORTED_LANGS:
             translation_params["formality"] = "more"
         
-        translator.translate_document_from_filepath(**translation_params)
+        # Дубликаты и повторные запуски обслуживаются копированием, без обращения к API
+        # Файл читается один раз: содержимое идет и в ключ кэша, и в загрузку на DeepL
+        file_data = file_path.read_bytes()
+        cache_key = document_cache_key(file_data, source_lang, target_lang, translation_params.get("formality"))
+        cached_path = lookup_cached_translation(cache_key)
+        if cached_path is not None:
+            shutil.copyfile(cached_path, output_path)
+            log.info("  ✓ %s: использован прежний перевод", file_path.name)
+            return True
         
-        elapsed = time.time() - start_time
-        print(f"  ✓ Успешно за {elapsed:.1f} сек.")
+        # Вместо паузы после каждого файла - общий для потоков интервал между запросами
+        wait_request_slot()
+        log.info("  Перевод: %s -> %s", file_path.name, output_path.name)
+        start_time = time.time()
+        
+        translate_document_with_backoff(translator, input_data=file_data, **translation_params)
+        remember_translation(cache_key, output_path)
+        
+        log.info("  ✓ %s: успешно за %.1f сек.", file_path.name, time.time() - start_time)
         
         # Постобработка для DOCX файлов (удаление скобок из индексов)
         if output_path.suffix.lower() == '.docx' and DOCX_AVAILABLE:
             # Применяем только для перевода RU->EN
             if source_lang == 'RU' and target_lang.startswith('EN'):
-                print("  Постобработка DOCX доступна через отдельные скрипты")
+                log.info("  Постобработка DOCX доступна через отдельные скрипты")
                 # remove_brackets_from_indices(output_path)  # Функция не определена
         
-        # Пауза между запросами
-        if PAUSE_BETWEEN_REQUESTS > 0:
-            print(f"  Пауза {PAUSE_BETWEEN_REQUESTS} сек...")
-            time.sleep(PAUSE_BETWEEN_REQUESTS)
-        
         return True
         
     except deepl.DocumentTranslationException as e:
-        print(f"  ✗ Ошибка перевода: {e}")
+        log.error("  ✗ %s: ошибка перевода: %s", file_path.name, e)
         return False
     except deepl.QuotaExceededException:
-        print("  ✗ Превышена квота API")
+        log.error("  ✗ %s: превышена квота API", file_path.name)
         return False
     except Exception as e:
-        print(f"  ✗ Непредвиденная ошибка: {e}")
+        log.error("  ✗ %s: непредвиденная ошибка: %s", file_path.name, e)
         return False
 
 
+def _walk_files_to_translate(root):
+    """Обходит дерево папок одним проходом os.scandir и возвращает пути (строки) файлов для перевода."""
+    stack = [root]
+    while stack:
+        current_dir = stack.pop()
+        try:
+            with os.scandir(current_dir) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                        continue
+                    name = entry.name
+                    if name.startswith('~$'):
+                        continue
+                    stem, ext = os.path.splitext(name)
+                    if ext.lower() not in SUPPORTED_EXTENSIONS or _ALREADY_TRANSLATED_RE.search(stem):
+                        continue
+                    if entry.is_file():
+                        yield entry.path
+        except OSError as e:
+            print(f"Предупреждение: Не удалось прочитать папку {current_dir}: {e}")
+
+
 def translate_folder(translator, folder_path, source_lang, target_lang):
     """Перевод всех файлов в папке с сохранением структуры"""
     # Создаем папку для переводов рядом с исходной
@@ -245,21 +448,11 @@ def translate_folder(translator, folder_path, source_lang, target_lang):
         print(f"Ошибка при создании папки: {e}")
         return
     
-    # Поиск файлов
-    files_found = []
-    for ext in SUPPORTED_EXTENSIONS:
-        files_found.extend(folder_path.rglob(f"*{ext}"))
-    
-    # Фильтрация временных файлов и уже переведенных
-    files_to_translate = []
-    for f in files_found:
-        if f.is_file() and not f.name.startswith('~$'):
-            # Пропускаем файлы, которые уже содержат суффикс перевода
-            if not any(suffix in f.stem for suffix in ['_translated_', '_to_']):
-                files_to_translate.append(f)
+    # Поиск файлов: один обход дерева, фильтрация временных и уже переведенных файлов прямо при обходе
+    files_to_translate = [Path(path) for path in _walk_files_to_translate(str(folder_path))]
     
     if not files_to_translate:
-        print(f"\nНе найдено файлов {SUPPORTED_EXTENSIONS} в папке.")
+        print(f"\nНе найдено файлов {', '.join(sorted(SUPPORTED_EXTENSIONS))} в папке.")
         return
     
     print(f"\nНайдено файлов для перевода: {len(files_to_translate)}")
@@ -271,33 +464,58 @@ def translate_folder(translator, folder_path, source_lang, target_lang):
         print("Отменено.")
         return
     
-    # Последовательный перевод
+    # Параллельный перевод: запросы к DeepL ждут сети, поэтому документы отправляются одновременно
     success_count = 0
     error_count = 0
+    skipped_count = 0
+    
+    # Уже существующие переводы собираются одним обходом папки результатов, а не exists() на каждый файл
+    existing_outputs = {str(path) for path in output_folder.rglob(f"*{TRANSLATION_SUFFIX}_*")}
+    created_dirs = set()
     
-    print(f"\nНачинаю последовательный перевод...\n")
+    print(f"\nНачинаю параллельный перевод (потоков: {MAX_CONCURRENT_TRANSLATIONS})...\n")
     print("-" * 50)
     
-    for i, file_path in enumerate(files_to_translate, 1):
-        # Вычисляем относительный путь от исходной папки
-        try:
-            relative_path = file_path.relative_to(folder_path)
-        except ValueError:
-            relative_path = file_path.name
-        
-        # Создаем путь для сохранения с сохранением структуры папок
-        output_path = output_folder / relative_path.parent / f"{file_path.stem}{TRANSLATION_SUFFIX}_{target_lang.lower()}{file_path.suffix}"
-        
-        # Создаем подпапки если нужно
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        print(f"\n[{i}/{len(files_to_translate)}] Файл: {relative_path}")
+    with queued_logging(), ThreadPoolExecutor(max_workers=MAX_CONCURRENT_TRANSLATIONS) as executor:
+        futures = {}
+        for file_path in files_to_translate:
+            # Вычисляем относительный путь от исходной папки
+            try:
+                relative_path = file_path.relative_to(folder_path)
+            except ValueError:
+                relative_path = Path(file_path.name)
+            
+            # Создаем путь для сохранения с сохранением структуры папок
+            output_path = output_folder / relative_path.parent / f"{file_path.stem}{TRANSLATION_SUFFIX}_{target_lang.lower()}{file_path.suffix}"
+            
+            # Проверка существования выходного файла
+            if str(output_path) in existing_outputs:
+                log.info("  Пропуск: файл уже существует: %s", relative_path)
+                skipped_count += 1
+                continue
+            
+            # Создаем подпапки если нужно (каждую - один раз)
+            if output_path.parent not in created_dirs:
+                output_path.parent.mkdir(parents=True, exist_ok=True)
+                created_dirs.add(output_path.parent)
+            
+            # Переводим файл с указанием конкретного пути вывода
+            future = executor.submit(
+                translate_single_file_to_path, translator, file_path, output_path, source_lang, target_lang
+            )
+            futures[future] = relative_path
         
-        # Переводим файл с указанием конкретного пути вывода
-        if translate_single_file_to_path(translator, file_path, output_path, source_lang, target_lang):
-            success_count += 1
-        else:
-            error_count += 1
+        # Результаты собираются в главном потоке по мере готовности
+        for done, future in enumerate(as_completed(futures), 1):
+            if future.result():
+                success_count += 1
+                mark = '✓'
+            else:
+                error_count += 1
+                mark = '✗'
+            log.info("[%d/%d] %s %s", done, len(futures), mark, futures[future])
+    
+    save_doc_cache()
     
     # Итоги
     print("\n" + "=" * 50)
@@ -305,6 +523,7 @@ def translate_folder(translator, folder_path, source_lang, target_lang):
     print(f"  Всего файлов: {len(files_to_translate)}")
     print(f"  Успешно переведено: {success_count}")
     print(f"  Ошибок: {error_count}")
+    print(f"  Пропущено (перевод уже существует): {skipped_count}")
     print(f"  Переводы сохранены в: {output_folder}")
     print("=" * 50)
 
@@ -351,7 +570,7 @@ def main():
             print(f"Расширение: {file_path.suffix.lower()}")
             
             if file_path.suffix.lower() not in SUPPORTED_EXTENSIONS:
-                print(f"Ошибка: Поддерживаются только {SUPPORTED_EXTENSIONS}")
+                print(f"Ошибка: Поддерживаются только {', '.join(sorted(SUPPORTED_EXTENSIONS))}")
                 print(f"Ваш файл имеет расширение: {file_path.suffix}")
                 continue
             
@@ -1,10 +1,23 @@
 import deepl
+import hashlib
+import io
+import itertools
+import json
+import logging
+import logging.handlers
 import os
+import queue
 import sys
 import time
 import traceback
+import zipfile
+from bisect import bisect_right
+from contextlib import contextmanager
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from types import SimpleNamespace
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from functools import lru_cache
+from xml.sax.saxutils import escape as xml_escape
 import re  # Для регулярных выражений
 from dotenv import load_dotenv
 
@@ -18,10 +31,12 @@ except ImportError:
 
 # --- Проверка и импорт python-docx ---
 try:
-    from docx import Document
     from docx.shared import Pt  # Для возможной работы со стилями, если понадобится
-    from docx.text.paragraph import Paragraph
     from docx.text.run import Run
+    from docx.oxml import OxmlElement, parse_xml
+    from docx.oxml.ns import nsdecls
+    from docx.oxml.parser import element_class_lookup
+    from lxml import etree  # Устанавливается вместе с python-docx
 except ImportError:
     print("Ошибка: Необходима библиотека python-docx.")
     print("Пожалуйста, установите ее: pip install python-docx")
@@ -40,6 +55,13 @@ DEEPL_API_KEY = os.getenv('DEEPL_API_KEY', '')
 SUPPORTED_EXTENSIONS = ['.docx', '.pdf']
 TRANSLATION_SUFFIX = "_to_{target_lang_code}"
 MAX_CONCURRENT_TRANSLATIONS = 2  # Можно настроить
+VERBOSE_ERROR_REPORT = False  # Печатать трассировки стека в итоговом отчете об ошибках
+LOG_LEVEL = logging.INFO  # logging.DEBUG - подробный вывод по каждому файлу (языки, глоссарий, стадии пост-обработки)
+
+# Локальный кэш DeepL (общий с deepl_translate_main.py): последнее известное использование API
+DEEPL_CACHE_PATH = BASE_DIR / '.deepl_cache.json'
+USAGE_CACHE_TTL = 60  # Время жизни кэша использования в секундах
+USAGE_CACHE_SAFE_RATIO = 0.9  # Кэш использования доверяем, только если израсходовано меньше 90% лимита
 
 LANGUAGE_OPTIONS = {
     "1": {"name": "Русский -> Английский (US)", "source": "RU", "target": "EN-US"},
@@ -94,13 +116,89 @@ def get_user_input():
     return source_root_path, selected_lang['source'], selected_lang['target']
 
 
+def load_deepl_cache():
+    """Читает локальный кэш DeepL. При отсутствии или повреждении файла возвращает пустой словарь."""
+    try:
+        with open(DEEPL_CACHE_PATH, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_deepl_cache(cache):
+    """Сохраняет локальный кэш DeepL. Ошибки записи не критичны."""
+    cache['ts'] = time.time()
+    try:
+        with open(DEEPL_CACHE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False, indent=2)
+    except OSError as e:
+        print(f"Предупреждение: Не удалось сохранить кэш DeepL: {e}")
+
+
+def _usage_to_cache(usage):
+    """Преобразует объект использования DeepL в словарь для кэша."""
+    document = getattr(usage, 'document', None)
+    return {
+        'character': {'count': usage.character.count, 'limit': usage.character.limit},
+        'document': {'count': document.count, 'limit': document.limit} if document and document.valid else None,
+        'ts': time.time()
+    }
+
+
+def _usage_from_cache(cache):
+    """
+    Возвращает использование из кэша в виде объекта с атрибутами как у deepl.Usage,
+    если кэш свежий и до лимита еще далеко. Иначе None.
+    """
+    cached_usage = cache.get('usage')
+    if not cached_usage or time.time() - cached_usage.get('ts', 0) > USAGE_CACHE_TTL:
+        return None
+
+    character = cached_usage.get('character') or {}
+    char_count, char_limit = character.get('count'), character.get('limit')
+    if char_count is None or (char_limit is not None and char_count >= char_limit * USAGE_CACHE_SAFE_RATIO):
+        return None
+
+    document = cached_usage.get('document')
+    if document and document.get('limit') is not None and document.get('count') is not None \
+            and document['count'] >= document['limit'] * USAGE_CACHE_SAFE_RATIO:
+        return None
+
+    return SimpleNamespace(
+        character=SimpleNamespace(count=char_count, limit=char_limit),
+        document=SimpleNamespace(valid=True, **document) if document else None,
+        any_limit_exceeded=False
+    )
+
+
+def get_usage_cached(translator):
+    """Использование DeepL API: из локального кэша, если он свежий, иначе запросом get_usage() (с записью в кэш)."""
+    deepl_cache = load_deepl_cache()
+    usage = _usage_from_cache(deepl_cache)
+    if usage is not None:
+        print(f"  (Лимиты взяты из локального кэша: проверка была менее {USAGE_CACHE_TTL} сек. назад)")
+        return usage
+    usage = translator.get_usage()
+    deepl_cache['usage'] = _usage_to_cache(usage)
+    save_deepl_cache(deepl_cache)
+    return usage
+
+
+def invalidate_usage_cache():
+    """Сбрасывает кэшированное использование после перевода: счетчики DeepL уже изменились."""
+    deepl_cache = load_deepl_cache()
+    if deepl_cache.pop('usage', None) is not None:
+        save_deepl_cache(deepl_cache)
+
+
 def initialize_translator(api_key):
     """Initializes the DeepL translator and checks usage."""
     print("\nИнициализация переводчика DeepL...")
     try:
         translator = deepl.Translator(api_key)
         print("Проверка лимитов DeepL API...")
-        usage = translator.get_usage()
+        usage = get_usage_cached(translator)
 
         # Character limit check
         char_count = usage.character.count
@@ -176,14 +274,54 @@ def get_or_create_glossary(translator, source_lang, target_lang):
         return None
 
     glossary_name = f"Universal Scientific Terms RU-EN v1"
+    # Хэш записей: идентификатор из кэша используется, только пока словарь глоссария не менялся
+    entries_hash = hashlib.blake2b(
+        json.dumps(glossary_entries, ensure_ascii=False, sort_keys=True).encode('utf-8'), digest_size=16
+    ).hexdigest()
 
     try:
+        deepl_cache = load_deepl_cache()
+
+        # Сначала ищем глоссарий в локальном кэше: один запрос get_glossary вместо списка всех глоссариев
+        for cached in deepl_cache.get('glossaries', []):
+            if cached.get('name') == glossary_name and cached.get('source') == "RU" and cached.get('target') == "EN" \
+                    and cached.get('entries_hash') == entries_hash:
+                try:
+                    glossary = translator.get_glossary(cached['id'])
+                except deepl.DeepLException:
+                    break  # Глоссарий удален - ищем заново по списку
+                print(f"✅ Найден глоссарий из кэша: {glossary.name} (ID: {glossary.glossary_id})")
+                print(f"   Количество терминов: {glossary.entry_count}")
+                return glossary
+
+        # Хэши записей, с которыми глоссарии были найдены или созданы ранее
+        known_hashes = {cached.get('id'): cached.get('entries_hash') for cached in deepl_cache.get('glossaries', [])}
+
         # Пытаемся найти существующий глоссарий
         print("\nПроверка существующих глоссариев...")
         glossaries = translator.list_glossaries()
+        deepl_cache['glossaries'] = [
+            {'name': g.name, 'id': g.glossary_id, 'source': g.source_lang, 'target': g.target_lang,
+             'entry_count': g.entry_count}
+            for g in glossaries
+        ]
 
         for glossary in glossaries:
             if glossary.name == glossary_name and glossary.source_lang == "RU" and glossary.target_lang == "EN":
+                if known_hashes.get(glossary.glossary_id) not in (None, entries_hash):
+                    # Глоссарий создан из прежней версии записей - удаляем его и создаем заново
+                    print(f"Записи глоссария изменились, пересоздание: {glossary.name} (ID: {glossary.glossary_id})")
+                    translator.delete_glossary(glossary)
+                    deepl_cache['glossaries'] = [
+                        cached for cached in deepl_cache['glossaries'] if cached['id'] != glossary.glossary_id
+                    ]
+                    break
+                # Найденный по имени глоссарий запоминается с хэшем текущих записей
+                deepl_cache['glossaries'] = [
+                    dict(cached, entries_hash=entries_hash) if cached['id'] == glossary.glossary_id else cached
+                    for cached in deepl_cache['glossaries']
+                ]
+                save_deepl_cache(deepl_cache)
                 print(f"✅ Найден существующий глоссарий: {glossary.name} (ID: {glossary.glossary_id})")
                 print(f"   Количество терминов: {glossary.entry_count}")
                 return glossary
@@ -196,6 +334,10 @@ def get_or_create_glossary(translator, source_lang, target_lang):
             target_lang="EN",
             entries=glossary_entries
         )
+        deepl_cache['glossaries'].append(
+            {'name': glossary.name, 'id': glossary.glossary_id, 'source': glossary.source_lang,
+             'target': glossary.target_lang, 'entry_count': glossary.entry_count, 'entries_hash': entries_hash})
+        save_deepl_cache(deepl_cache)
         print(f"✅ Глоссарий успешно создан: {glossary.name} (ID: {glossary.glossary_id})")
         print(f"   Количество терминов: {len(glossary_entries)}")
         return glossary
@@ -210,318 +352,417 @@ def get_or_create_glossary(translator, source_lang, target_lang):
         return None
 
 
+def _walk_supported_files(root):
+    """
+    Обходит дерево папок одним проходом os.scandir и возвращает DirEntry поддерживаемых файлов.
+    Символические ссылки на папки не раскрываются, поэтому каждый файл встречается один раз.
+    """
+    supported_suffixes = tuple(SUPPORTED_EXTENSIONS)
+    stack = [root]
+    while stack:
+        current_dir = stack.pop()
+        try:
+            with os.scandir(current_dir) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file():
+                        name = entry.name
+                        if name.startswith('~$'):
+                            continue
+                        if name.lower().endswith(supported_suffixes):
+                            yield entry
+        except OSError as e:
+            print(f"Предупреждение: Не удалось прочитать папку '{current_dir}': {e}. Пропуск.")
+
+
 def find_files_to_translate(source_root_path):
     """Recursively finds files with supported extensions, excluding temporary files."""
     print("\nПоиск файлов для перевода...")
-    files_found = []
-    for extension in SUPPORTED_EXTENSIONS:
-        extension_pattern = "".join([f"[{c.lower()}{c.upper()}]" for c in extension[1:]])
-        pattern = f"*.{extension_pattern}"
-        # print(f"Поиск файлов с шаблоном: {pattern} в {source_root_path}") # Debug log
-        files_found.extend(list(source_root_path.rglob(pattern)))
-
-    processed_paths = set()
+    seen_files = set()
     files_to_process = []
-    for f in files_found:
+    for entry in _walk_supported_files(str(source_root_path)):
+        # Один и тот же файл (жесткая или символическая ссылка) отсеивается по (устройство, inode);
+        # без resolve() пути остаются внутри source_root_path и relative_to работает и для относительного пути
         try:
-            resolved_f = f.resolve()
-            if resolved_f.is_file() and not resolved_f.name.startswith('~$') and resolved_f not in processed_paths:
-                files_to_process.append(resolved_f)
-                processed_paths.add(resolved_f)
-        except Exception as e:
-            print(f"Предупреждение: Не удалось обработать путь файла '{f}': {e}. Пропуск.")
+            file_stat = entry.stat()
+        except OSError as e:
+            print(f"Предупреждение: Не удалось обработать путь файла '{entry.path}': {e}. Пропуск.")
+            continue
+        # На Windows os.scandir не заполняет st_ino - там ключом служит сам путь
+        file_id = (file_stat.st_dev, file_stat.st_ino) if file_stat.st_ino else entry.path
+        if file_id in seen_files:
+            continue
+        seen_files.add(file_id)
+        files_to_process.append(Path(entry.path))
 
     files_to_process.sort()
     print(f"Найдено {len(files_to_process)} файлов с расширениями {SUPPORTED_EXTENSIONS} (исключая временные файлы).")
     return files_to_process
 
 
-# --- ОБНОВЛЕННАЯ ФУНКЦИЯ ОЧИСТКИ (Версия 3 Translate_politics) ---
-def clean_translated_docx(docx_path):
+# Журнал обработки файлов: сообщения потоков перевода и пост-обработки
+log = logging.getLogger('translator')
+
+
+@contextmanager
+def queued_logging():
     """
-    Открывает переведенный DOCX и исправляет искаженные плейсхолдеры
-    к виду <<EqnXXX.eps>>. Обрабатывает случаи с лишней точкой,
-    отсутствующими >>, и отсутствующим .eps.
-    Перезаписывает файл. Возвращает True при успехе/отсутствии изменений, False при ошибке.
+    Вывод журнала через очередь: потоки только кладут записи в очередь, в stdout их пишет
+    один поток QueueListener - без борьбы исполнителей за блокировку stdout.
+    При выходе очередь дописывается до конца, поэтому итоги печатаются после всех сообщений.
     """
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter('%(message)s'))
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+
+    log.addHandler(queue_handler)
+    log.setLevel(LOG_LEVEL)
+    log.propagate = False
+    listener.start()
     try:
-        if not docx_path.is_file():
-            print(f"  -> ОШИБКА Пост-обработки: Файл не найден {docx_path}")
-            return False
-
-        document = Document(docx_path)
-        changes_made = 0  # Счетчик изменений для логирования
-
-        # УЛУЧШЕННОЕ РЕГУЛЯРНОЕ ВЫРАЖЕНИЕ v3:
-        pattern = re.compile(
-            r'(<<Eqn(\d+))'  # Группа 1: <<Eqn<цифры>, Группа 2: только цифры
-            r'(?!'  # Начало негативного просмотра вперед (убеждаемся, что ДАЛЬШЕ НЕ...)
-            r'\.eps>>'  # ...ровно ".eps>>"
-            r'([,\s]|$)'  # ...за которым идет запятая, пробел или конец строки/параграфа
-            r')'  # Конец негативного просмотра
-            r'([\.\w>]+)?'  # Группа 3 Translate_politics (опциональная): Захватываем сам "мусор" - точки, буквы(eps), >.
-        )
-
-        # Строка для замены: Восстанавливаем правильный формат, используя Группу 2 (цифры)
-        replacement_pattern = r'<<Eqn\2.eps>>'
-
-        # Вспомогательная функция для обработки параграфа
-        def process_paragraph(para: Paragraph):
-            nonlocal changes_made
-            # Быстрая проверка для оптимизации - ищем хотя бы начало плейсхолдера
-            if '<<Eqn' not in para.text:
-                return False
-
-            original_text = para.text
-            # Применяем замену ко всему тексту параграфа
-            new_text = pattern.sub(replacement_pattern, original_text)
-
-            if new_text != original_text:
-                # Считаем количество реальных замен (хотя бы примерно)
-                # Это не идеально точно, но дает представление
-                num_replacements = len(pattern.findall(original_text))
-                changes_made += num_replacements
-
-                # Простой способ обновления: очистить параграф и вставить новый текст
-                para.clear()  # Очищает все runs и текст
-                para.add_run(new_text)  # Добавляет новый текст одним run (может сбросить форматирование)
-
-                # Debug Log (можно раскомментировать для отладки)
-                # print(f"    Debug: Replaced in para. Orig: '{original_text}'. New: '{new_text}'")
-                return True
-            return False
+        yield
+    finally:
+        listener.stop()
+        log.removeHandler(queue_handler)
+        log.propagate = True
+
+
+# УЛУЧШЕННОЕ РЕГУЛЯРНОЕ ВЫРАЖЕНИЕ v3 (компилируется один раз для всех файлов):
+EQN_PLACEHOLDER_PATTERN = re.compile(
+    r'(<<Eqn(\d+)(?!\d))'  # Группа 1: <<Eqn<цифры>, Группа 2: только цифры (номер берется целиком)
+    r'(?!'  # Начало негативного просмотра вперед (убеждаемся, что ДАЛЬШЕ НЕ...)
+    r'\.eps>>'  # ...ровно ".eps>>"
+    r'([,\s]|$)'  # ...за которым идет запятая, пробел или конец строки/параграфа
+    r')'  # Конец негативного просмотра
+    r'([\.\w>]+)?'  # Группа 3 Translate_politics (опциональная): Захватываем сам "мусор" - точки, буквы(eps), >.
+)
+
+# Строка для замены: Восстанавливаем правильный формат, используя Группу 2 (цифры)
+EQN_REPLACEMENT = r'<<Eqn\2.eps>>'
+
+# Теги WordprocessingML: параграф и текстовый узел
+W_NAMESPACE = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+W_PARAGRAPH_TAG = f'{{{W_NAMESPACE}}}p'
+W_TEXT_TAG = f'{{{W_NAMESPACE}}}t'
+XML_SPACE_ATTR = '{http://www.w3.org/XML/1998/namespace}space'
+# Части DOCX с текстом, в которых исправляются плейсхолдеры: основной текст и колонтитулы
+DOCX_TEXT_PART_PATTERN = re.compile(r'word/(?:document|header\d*|footer\d*)\.xml')
+# Файл-метка рядом с очищенным DOCX: хэш содержимого после очистки (повторная очистка пропускается)
+CLEAN_HASH_SUFFIX = '.cleanhash'
+
+
+def _fix_eqn_placeholders_in_paragraph(paragraph):
+    """
+    Исправляет плейсхолдеры в текстовых узлах <w:t> одного параграфа <w:p>. Возвращает число исправлений.
+    Совпадения ищутся по тексту всего параграфа; исправление пишется в узел, где совпадение начинается,
+    а остаток разорванного плейсхолдера удаляется из следующих узлов. Остальной текст не переносится -
+    форматирование runs и положение табуляций сохраняются.
+    """
+    # Узлы вложенных параграфов (надписи) обрабатываются вместе со своим параграфом
+    text_nodes = [node for node in paragraph.iter(W_TEXT_TAG)
+                  if next(node.iterancestors(W_PARAGRAPH_TAG)) is paragraph]
+    node_texts = [node.text or '' for node in text_nodes]
+    text = ''.join(node_texts)
+    # Быстрая проверка для оптимизации - ищем хотя бы начало плейсхолдера
+    if '<<Eqn' not in text:
+        return 0
+
+    node_starts = list(itertools.accumulate((len(t) for t in node_texts[:-1]), initial=0))
+    pieces = [[] for _ in text_nodes]
+
+    def keep(start, end):
+        """Раскладывает неизмененный текст [start, end) по узлам, в которых он был"""
+        i = bisect_right(node_starts, start) - 1
+        while start < end:
+            node_end = node_starts[i] + len(node_texts[i])
+            if start < node_end:
+                pieces[i].append(text[start:min(end, node_end)])
+                start = min(end, node_end)
+            i += 1
+
+    num_replacements = 0
+    position = 0
+    for match in EQN_PLACEHOLDER_PATTERN.finditer(text):
+        replacement = match.expand(EQN_REPLACEMENT)
+        if replacement == match.group():
+            continue
+        keep(position, match.start())
+        pieces[bisect_right(node_starts, match.start()) - 1].append(replacement)
+        position = match.end()
+        num_replacements += 1
+    if not num_replacements:
+        return 0
+    keep(position, len(text))
+
+    for node, old_text, node_pieces in zip(text_nodes, node_texts, pieces):
+        new_text = ''.join(node_pieces)
+        if new_text != old_text:
+            node.text = new_text
+            if new_text != new_text.strip():
+                node.set(XML_SPACE_ATTR, 'preserve')
+    return num_replacements
+
+
+def _clean_eqn_placeholders_inplace(root):
+    """Исправляет плейсхолдеры во всех параграфах разобранной части DOCX. Возвращает количество исправлений."""
+    return sum(_fix_eqn_placeholders_in_paragraph(paragraph) for paragraph in root.iter(W_PARAGRAPH_TAG))
+
+
+def _docx_clean_hash(docx_data):
+    """Хэш содержимого DOCX для файла-метки очистки (BLAKE2b, 16 байт, hex)"""
+    return hashlib.blake2b(docx_data, digest_size=16).hexdigest()
+
+
+# Регулярные выражения для химических формул (компилируются один раз для всех файлов)
+# Subscript-текст: (число) -> число, число) -> число, (число -> число (одним проходом)
+SUBSCRIPT_PARENS_PATTERN = re.compile(r'^\(?(\d+(?:\.\d+)?)\)?$')
+# Одиночные скобки в subscript удаляются целиком
+SUBSCRIPT_LONE_PARENS = frozenset('()')
+# Обычный текст: элемент с числом в скобках, например Ti(49) -> Ti49 (49 в subscript)
+CHEM_FORMULA_PATTERN = re.compile(r'([A-Z][a-z]?)\((\d+(?:\.\d+)?)\)')
+# XPath-запрос (компилируется один раз): все run с текстом
+W_RUNS_WITH_TEXT_XPATH = etree.XPath('.//w:r[w:t]', namespaces={'w': W_NAMESPACE})
+# Теги свойств run для проверки subscript
+W_RUN_PROPS_TAG = f'{{{W_NAMESPACE}}}rPr'
+W_VERT_ALIGN_TAG = f'{{{W_NAMESPACE}}}vertAlign'
+W_VAL_ATTR = f'{{{W_NAMESPACE}}}val'
+
+
+@lru_cache(maxsize=1024)  # Run с одинаковым форматированием повторяются по всему документу
+def _subscript_rpr_xml(rpr_xml):
+    """Возвращает XML свойств run (<w:rPr>) с добавленным subscript; пустая строка - у run нет свойств"""
+    sub_rpr = parse_xml(rpr_xml) if rpr_xml else OxmlElement('w:rPr')
+    sub_rpr.subscript = True
+    return etree.tostring(sub_rpr, encoding='unicode')
+
+
+def _chem_formula_runs(run_element, text):
+    """
+    Строит новые <w:r> для текста run с химическими формулами одним проходом CHEM_FORMULA_PATTERN.subn:
+    весь XML собирается строкой и разбирается одним вызовом parse_xml вместо add_run на каждый фрагмент.
+    Элемент и окружающий текст получают свойства исходного run, число - те же свойства с subscript.
 
-        # --- Основная логика обхода документа ---
-        # Итерация по параграфам в основном тексте
-        for para in document.paragraphs: process_paragraph(para)
-
-        # Итерация по таблицам
-        for table in document.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for para in cell.paragraphs: process_paragraph(para)
-
-        # Итерация по колонтитулам (если нужно)
-        for section in document.sections:
-            # Headers
-            for para in section.header.paragraphs: process_paragraph(para)
-            for table in section.header.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        for para in cell.paragraphs: process_paragraph(para)
-            # Footers
-            for para in section.footer.paragraphs: process_paragraph(para)
-            for table in section.footer.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        for para in cell.paragraphs: process_paragraph(para)
-        # --- Конец обхода ---
-
-        if changes_made > 0:
-            print(f"  -> Пост-обработка V3: Исправлено ~{changes_made} искаженных плейсхолдеров в {docx_path.name}")
-            document.save(docx_path)  # Перезаписываем файл
-        else:
-            print(
-                f"  -> Пост-обработка V3: Искаженные плейсхолдеры (требующие исправления) не найдены в {docx_path.name}")
+    Returns:
+        tuple: (список новых элементов <w:r>, количество исправленных формул)
+    """
+    rpr = run_element.rPr
+    rpr_xml = etree.tostring(rpr, encoding='unicode') if rpr is not None else ''
+    sub_rpr_xml = _subscript_rpr_xml(rpr_xml)
+
+    text_open = f'<w:r>{rpr_xml}<w:t xml:space="preserve">'
+    text_close = '</w:t></w:r>'
+    # run.text отдает табуляцию и разрывы строк символами - возвращаем их элементами
+    escaped = (xml_escape(text)
+               .replace('\t', '</w:t><w:tab/><w:t xml:space="preserve">')
+               .replace('\n', '</w:t><w:br/><w:t xml:space="preserve">'))
+    body, fixes = CHEM_FORMULA_PATTERN.subn(
+        lambda m: (f'{text_close}'
+                   f'<w:r>{rpr_xml}<w:t>{m.group(1)}</w:t></w:r>'
+                   f'<w:r>{sub_rpr_xml}<w:t>{m.group(2)}</w:t></w:r>'
+                   f'{text_open}'),
+        escaped)
+    # Пустые run (формула в начале/конце текста или подряд) не создаем
+    body = f'{text_open}{body}{text_close}'.replace(f'{text_open}{text_close}', '')
+    return list(parse_xml(f'<w:p {nsdecls("w")}>{body}</w:p>')), fixes
+
+
+def _is_subscript_run(run_element):
+    """Проверяет <w:rPr>/<w:vertAlign w:val="subscript"> у run прямым чтением lxml (без Font и XPath)"""
+    # По схеме <w:rPr> всегда первый дочерний элемент run
+    if not len(run_element) or run_element[0].tag != W_RUN_PROPS_TAG:
+        return False
+    for vert_align in run_element[0].iterchildren(W_VERT_ALIGN_TAG):
+        return vert_align.get(W_VAL_ATTR) == 'subscript'
+    return False
 
-        return True
 
-    except FileNotFoundError:
-        print(f"  -> ОШИБКА Пост-обработки: Файл не найден {docx_path}")
-        return False
-    except Exception as e:
-        # Используем f-string для форматирования
-        print(f"  -> КРИТИЧЕСКАЯ ОШИБКА Пост-обработки: Не удалось обработать {docx_path.name}: {e}")
-        print(traceback.format_exc())  # Для отладки
-        return False
+def _fix_chemical_formulas_in_run(run_element):
+    """
+    Исправляет химические формулы в одном run (элемент <w:r>) прямо в lxml-дереве.
+    Subscript-run: удаляются скобки вокруг числа. Обычный run с формулой вида Ti(49)
+    заменяется на месте новыми run, где число стоит в subscript.
 
+    Returns:
+        int: количество исправлений
+    """
+    text = run_element.text
+    if _is_subscript_run(run_element):
+        # Без скобок исправлять нечего - регулярное выражение не запускаем
+        if '(' not in text and ')' not in text:
+            return 0
+
+        # Паттерны 1-3: (число), число), (число -> число
+        match = SUBSCRIPT_PARENS_PATTERN.match(text)
+        new_text = match.group(1) if match else text
+
+        # Паттерн 4: одиночная скобка
+        if new_text in SUBSCRIPT_LONE_PARENS:
+            new_text = ''
+
+        if new_text == text:
+            return 0
+        # Меняем только узлы <w:t>: свойства run и прочие дочерние элементы
+        # (поля, сноски, закладки) остаются на месте. Совпавший текст состоит лишь из цифр и скобок,
+        # поэтому он целиком собран из <w:t>
+        text_nodes = run_element.findall(W_TEXT_TAG)
+        text_nodes[0].text = new_text
+        for text_node in text_nodes[1:]:
+            run_element.remove(text_node)
+        return 1
+
+    # Обычный текст: формула возможна только при наличии открывающей скобки
+    # Например: Ti(49) -> Ti49 (где 49 должно быть в subscript)
+    if '(' not in text or not CHEM_FORMULA_PATTERN.search(text):
+        return 0
+
+    new_elements, fixes = _chem_formula_runs(run_element, text)
+    # Вставляем новые run на место исходного
+    for new_element in reversed(new_elements):
+        run_element.addnext(new_element)
+    run_element.getparent().remove(run_element)
+    return fixes
+
+
+def _fix_chemical_formulas_inplace(root):
+    """
+    Исправляет химические формулы в разобранной части DOCX (H(2)O -> H2O, где 2 в subscript).
+    Все run с текстом (включая таблицы и гиперссылки) выбираются одним XPath-запросом.
+    Возвращает количество исправлений.
+    """
+    return sum(_fix_chemical_formulas_in_run(run_element) for run_element in W_RUNS_WITH_TEXT_XPATH(root))
 
-# --- КОНЕЦ ОБНОВЛЕННОЙ ФУНКЦИИ ---
 
-def fix_chemical_formulas_in_docx(docx_path):
+# --- ПОСТ-ОБРАБОТКА DOCX (Версия 3 Translate_politics) ---
+def postprocess_translated_docx(docx_path):
     """
-    Исправляет химические формулы в переведенных DOCX файлах.
-    Удаляет скобки из чисел в нижнем индексе (subscript).
-    Например: H(2)O -> H2O (где 2 остается в subscript)
+    Пост-обработка переведенного DOCX за одно чтение и одну запись файла:
+    - исправляет искаженные плейсхолдеры к виду <<EqnXXX.eps>> (лишняя точка, отсутствующие >>, отсутствующий .eps);
+    - исправляет химические формулы: удаляет скобки из чисел в subscript, Ti(49) -> Ti49 (49 в subscript).
+    Каждая часть с текстом разбирается один раз, обе стадии работают с одним деревом.
 
     Args:
         docx_path: Path объект к DOCX файлу
 
     Returns:
-        bool: True если обработка прошла успешно, False в случае ошибки
+        bool: True при успехе/отсутствии изменений, False при ошибке
     """
+    log.debug("  -> Запуск пост-обработки V3 для %s...", docx_path.name)
     try:
         if not docx_path.is_file():
-            print(f"  -> ОШИБКА: Файл не найден {docx_path}")
+            log.error("  -> ОШИБКА Пост-обработки: Файл не найден %s", docx_path)
             return False
 
-        document = Document(docx_path)
-        total_fixes = 0
-
-        def process_runs_in_paragraph(paragraph):
-            """Обрабатывает все run в параграфе для исправления химических формул"""
-            nonlocal total_fixes
-            fixes_in_para = 0
-
-            # Создаем новый список runs для замены
-            new_runs = []
-
-            for run in paragraph.runs:
-                if run.font.subscript:
-                    # Это subscript текст
-                    original_text = run.text
-
-                    # Удаляем скобки из текста
-                    # Паттерн 1: (число) -> число
-                    new_text = re.sub(r'^\((\d+(?:\.\d+)?)\)$', r'\1', original_text)
-
-                    # Паттерн 2: число) -> число
-                    new_text = re.sub(r'^(\d+(?:\.\d+)?)\)$', r'\1', new_text)
-
-                    # Паттерн 3 Translate_politics: (число -> число
-                    new_text = re.sub(r'^\((\d+(?:\.\d+)?)$', r'\1', new_text)
-
-                    # Паттерн 4: одиночная скобка
-                    if new_text in ['(', ')']:
-                        new_text = ''
-
-                    if new_text != original_text:
-                        fixes_in_para += 1
-
-                        # Создаем новый run с исправленным текстом
-                        new_run = paragraph.add_run(new_text)
-                        # Копируем форматирование
-                        new_run.font.subscript = True
-                        if run.font.size:
-                            new_run.font.size = run.font.size
-                        if run.font.name:
-                            new_run.font.name = run.font.name
-                        if run.font.bold:
-                            new_run.font.bold = run.font.bold
-                        if run.font.italic:
-                            new_run.font.italic = run.font.italic
-                        new_runs.append(new_run)
-                    else:
-                        new_runs.append(run)
-                else:
-                    # Обычный текст - проверяем на наличие формул
-                    text = run.text
-
-                    # Проверяем, есть ли химические формулы с числами не в subscript
-                    # Например: Ti(49) -> Ti49 (где 49 должно быть в subscript)
-                    pattern = re.compile(r'([A-Z][a-z]?)\((\d+(?:\.\d+)?)\)')
-
-                    if pattern.search(text):
-                        # Есть формула для исправления
-                        parts = []
-                        last_end = 0
-
-                        for match in pattern.finditer(text):
-                            # Добавляем текст до формулы
-                            if match.start() > last_end:
-                                part_run = paragraph.add_run(text[last_end:match.start()])
-                                # Копируем форматирование
-                                if run.font.size:
-                                    part_run.font.size = run.font.size
-                                if run.font.name:
-                                    part_run.font.name = run.font.name
-                                if run.font.bold:
-                                    part_run.font.bold = run.font.bold
-                                if run.font.italic:
-                                    part_run.font.italic = run.font.italic
-                                parts.append(part_run)
-
-                            # Добавляем элемент
-                            element = match.group(1)
-                            element_run = paragraph.add_run(element)
-                            # Копируем форматирование
-                            if run.font.size:
-                                element_run.font.size = run.font.size
-                            if run.font.name:
-                                element_run.font.name = run.font.name
-                            if run.font.bold:
-                                element_run.font.bold = run.font.bold
-                            if run.font.italic:
-                                element_run.font.italic = run.font.italic
-                            parts.append(element_run)
-
-                            # Добавляем число в subscript
-                            number = match.group(2)
-                            number_run = paragraph.add_run(number)
-                            number_run.font.subscript = True
-                            if run.font.size:
-                                number_run.font.size = run.font.size
-                            if run.font.name:
-                                number_run.font.name = run.font.name
-                            parts.append(number_run)
-
-                            last_end = match.end()
-                            fixes_in_para += 1
-
-                        # Добавляем оставшийся текст
-                        if last_end < len(text):
-                            part_run = paragraph.add_run(text[last_end:])
-                            # Копируем форматирование
-                            if run.font.size:
-                                part_run.font.size = run.font.size
-                            if run.font.name:
-                                part_run.font.name = run.font.name
-                            if run.font.bold:
-                                part_run.font.bold = run.font.bold
-                            if run.font.italic:
-                                part_run.font.italic = run.font.italic
-                            parts.append(part_run)
-
-                        new_runs.extend(parts)
-                    else:
-                        new_runs.append(run)
-
-            if fixes_in_para > 0:
-                # Очищаем параграф и добавляем новые runs
-                paragraph.clear()
-                paragraph._p.extend([run._element for run in new_runs])
-                total_fixes += fixes_in_para
-                return True
+        eqn_changes = 0  # Счетчики изменений для логирования
+        formula_fixes = 0
+        fixed_parts = {}  # Имя части архива -> исправленный XML
 
-            return False
+        # Файл читается целиком одним вызовом, дальше архив разбирается в памяти - и для исправлений,
+        # и для копирования частей в исправленный архив
+        docx_data = docx_path.read_bytes()
 
-        # Обрабатываем все части документа
-        # Параграфы
-        for para in document.paragraphs:
-            process_runs_in_paragraph(para)
-
-        # Таблицы
-        for table in document.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for para in cell.paragraphs:
-                        process_runs_in_paragraph(para)
-
-        # Колонтитулы
-        for section in document.sections:
-            # Headers
-            for para in section.header.paragraphs:
-                process_runs_in_paragraph(para)
-            # Footers
-            for para in section.footer.paragraphs:
-                process_runs_in_paragraph(para)
-
-        # Сохраняем результат
-        if total_fixes > 0:
-            document.save(docx_path)
-            print(f"  -> Исправление химических формул: исправлено {total_fixes} формул")
-            return True
+        # Файл не менялся с прошлой пост-обработки (хэш совпадает с сохраненным рядом) - разбирать его не нужно
+        hash_path = docx_path.with_name(docx_path.name + CLEAN_HASH_SUFFIX)
+        try:
+            if hash_path.read_text(encoding='ascii') == _docx_clean_hash(docx_data):
+                log.debug("  -> Пост-обработка V3: %s уже обработан ранее, пропуск", docx_path.name)
+                return True
+        except OSError:
+            pass
+
+        # Парсер с классами элементов python-docx (нужны для run) создается на каждый файл:
+        # объекты парсера lxml нельзя делить между потоками пула пост-обработки
+        parser = etree.XMLParser(huge_tree=True, resolve_entities=False)
+        parser.set_element_class_lookup(element_class_lookup)
+
+        with zipfile.ZipFile(io.BytesIO(docx_data)) as source_zip:
+            # Разбираем только XML основного текста и колонтитулов,
+            # без объектной модели python-docx и без загрузки остальных частей пакета
+            for part_name in source_zip.namelist():
+                if not DOCX_TEXT_PART_PATTERN.fullmatch(part_name):
+                    continue
+                raw = source_zip.read(part_name)
+                root = etree.fromstring(raw, parser)
+                part_eqn_changes = _clean_eqn_placeholders_inplace(root)
+                # Быстрая проверка части: формула в обычном тексте требует '(', а одиночная ')' исправляется
+                # только в subscript-run - без них и без vertAlign исправлять химические формулы нечего
+                if b'(' in raw or (b')' in raw and b'vertAlign' in raw):
+                    part_formula_fixes = _fix_chemical_formulas_inplace(root)
+                else:
+                    part_formula_fixes = 0
+                if part_eqn_changes or part_formula_fixes:
+                    fixed_parts[part_name] = etree.tostring(root, xml_declaration=True, encoding='UTF-8',
+                                                            standalone=True)
+                    eqn_changes += part_eqn_changes
+                    formula_fixes += part_formula_fixes
+
+            if fixed_parts:
+                # Остальные части копируются как есть; новый архив собирается в памяти
+                target_buffer = io.BytesIO()
+                with zipfile.ZipFile(target_buffer, 'w', compression=zipfile.ZIP_DEFLATED) as target_zip:
+                    for item in source_zip.infolist():
+                        data = fixed_parts.get(item.filename)
+                        if data is None:
+                            data = source_zip.read(item)
+                        target_zip.writestr(item, data)
+
+        if eqn_changes > 0:
+            log.info("  -> Пост-обработка V3: Исправлено ~%d искаженных плейсхолдеров в %s", eqn_changes, docx_path.name)
         else:
-            return True  # Изменений не требуется, но это не ошибка
+            log.debug("  -> Пост-обработка V3: Искаженные плейсхолдеры (требующие исправления) не найдены в %s",
+                      docx_path.name)
+        if formula_fixes > 0:
+            log.info("  -> Исправление химических формул: исправлено %d формул в %s", formula_fixes, docx_path.name)
+
+        if fixed_parts:
+            # Записываем во временный файл и атомарно подменяем исходный - при сбое файл остается целым
+            tmp_path = docx_path.with_name(docx_path.name + '.tmp')
+            try:
+                tmp_path.write_bytes(target_buffer.getbuffer())
+                os.replace(tmp_path, docx_path)
+            finally:
+                tmp_path.unlink(missing_ok=True)
+            docx_data = target_buffer.getvalue()
+
+        # Запоминаем хэш обработанного файла; ошибка записи не мешает результату пост-обработки
+        try:
+            hash_path.write_text(_docx_clean_hash(docx_data), encoding='ascii')
+        except OSError as e:
+            log.warning("  -> Предупреждение: Не удалось сохранить хэш очистки для %s: %s", docx_path.name, e)
+
+        return True
 
+    except FileNotFoundError:
+        log.error("  -> ОШИБКА Пост-обработки: Файл не найден %s", docx_path)
+        return False
     except Exception as e:
-        print(f"  -> ОШИБКА при исправлении химических формул: {e}")
+        # Трассировка форматируется потоком журнала
+        log.error("  -> КРИТИЧЕСКАЯ ОШИБКА Пост-обработки: Не удалось обработать %s: %s", docx_path.name, e,
+                  exc_info=True)
         return False
 
 
+# --- КОНЕЦ ПОСТ-ОБРАБОТКИ DOCX ---
+
+def translation_base_kwargs(source_lang, target_lang, glossary=None):
+    """Общие для всех файлов пакета параметры translate_document_from_filepath: языки и глоссарий"""
+    base_kwargs = {"target_lang": target_lang, "source_lang": source_lang}
+    if glossary:
+        base_kwargs["glossary"] = glossary
+    return base_kwargs
+
+
 def translate_single_document(input_path, output_path, translator, target_lang, source_lang, file_index, total_files,
-                              source_root_path, glossary=None, sequential_mode=False):
-    """Translates a single document and handles errors. Includes enhanced post-processing for DOCX."""
+                              source_root_path, glossary=None, sequential_mode=False, post_proc_pool=None,
+                              base_kwargs=None):
+    """Translates a single document and handles errors. Includes enhanced post-processing for DOCX.
+
+    If post_proc_pool is given, DOCX post-processing is submitted there and the result contains
+    its future under 'post_processing_future' (the translation thread is freed immediately).
+    base_kwargs - parameters shared by the whole batch (see translation_base_kwargs), built once by the caller.
+    """
     # Конвертируем Path объекты в строки для DeepL API и логгирования
     input_path_str = str(input_path)
     output_path_str = str(output_path)
@@ -532,12 +773,11 @@ def translate_single_document(input_path, output_path, translator, target_lang,
         relative_path_for_display = input_path
     except Exception as e:
         relative_path_for_display = f"Ошибка при определении пути: {input_path_str}"  # Используем str
-        print(f"Предупреждение: Не удалось определить относительный путь для отображения: {e}")
+        log.warning("Предупреждение: Не удалось определить относительный путь для отображения: %s", e)
 
     # Используем имена файлов из Path объектов для большей точности
-    print(f"\n[{file_index}/{total_files}] Обработка файла: {relative_path_for_display}")
-    print(f"  Перевод '{input_path.name}' -> '{output_path.name}'...")
-    print(f"     (Языки: {source_lang} -> {target_lang})")
+    log.info("[%d/%d] Обработка файла: %s", file_index, total_files, relative_path_for_display)
+    log.debug("  Перевод '%s' -> '%s'...", input_path.name, output_path.name)
 
     post_processing_error_occurred = False  # Флаг для отслеживания ошибок пост-обработки
 
@@ -547,47 +787,37 @@ def translate_single_document(input_path, output_path, translator, target_lang,
 
         start_time = time.time()
 
-        # Добавляем логирование использования глоссария
-        if glossary:
-            print(f"     (Используется глоссарий: {glossary.name})")
-
-        # Передаем глоссарий в функцию перевода, если он доступен
+        # Языки и глоссарий общие для пакета; для файла добавляются только пути
+        if base_kwargs is None:
+            base_kwargs = translation_base_kwargs(source_lang, target_lang, glossary)
         translation_kwargs = {
+            **base_kwargs,
             "input_path": input_path_str,  # DeepL требует строку
             "output_path": output_path_str,  # DeepL требует строку
-            "target_lang": target_lang,
-            "source_lang": source_lang
         }
 
-        if glossary:
-            translation_kwargs["glossary"] = glossary
-
         translator.translate_document_from_filepath(**translation_kwargs)
 
         end_time = time.time()
-        print(f"  -> УСПЕШНО переведен за {end_time - start_time:.2f} сек.")
+        log.info("  -> %s: УСПЕШНО переведен за %.2f сек.", input_path.name, end_time - start_time)
 
         # Добавляем паузу между запросами в последовательном режиме
         if sequential_mode:
-            print(f"  -> Пауза 1 секунда перед следующим запросом...")
+            log.debug("  -> Пауза 1 секунда перед следующим запросом...")
             time.sleep(1)
 
         # --- ИНТЕГРАЦИЯ ПОСТ-ОБРАБОТКИ ---
         if output_path.suffix.lower() == '.docx':
-            print(f"  -> Запуск пост-обработки V3 для {output_path.name}...")
-            # Передаем Path объект в функцию очистки
-            cleaning_successful = clean_translated_docx(output_path)
-            if not cleaning_successful:
-                # Логируем предупреждение и устанавливаем флаг
-                print(f"  -> ПРЕДУПРЕЖДЕНИЕ: Пост-обработка файла {output_path.name} завершилась с ошибкой.")
+            if post_proc_pool is not None:
+                # Пост-обработка идет в отдельном пуле: поток перевода сразу берет следующий файл
+                return {
+                    "status": "success",
+                    "input": input_path_str,
+                    "output": output_path_str,
+                    "post_processing_future": post_proc_pool.submit(postprocess_translated_docx, output_path)
+                }
+            if not postprocess_translated_docx(output_path):
                 post_processing_error_occurred = True  # Отмечаем ошибку пост-обработки
-
-            # Добавляем исправление химических формул
-            print(f"  -> Проверка и исправление химических формул...")
-            formulas_fixed = fix_chemical_formulas_in_docx(output_path)
-            if not formulas_fixed:
-                print(f"  -> ПРЕДУПРЕЖДЕНИЕ: Исправление химических формул завершилось с ошибкой.")
-                post_processing_error_occurred = True
         # --- КОНЕЦ ИНТЕГРАЦИИ ---
 
         # Возвращаем статус и пути. Добавляем информацию об ошибке пост-обработки.
@@ -601,41 +831,41 @@ def translate_single_document(input_path, output_path, translator, target_lang,
     # Обработка ошибок DeepL API и файловой системы
     except deepl.DocumentTranslationException as e:
         error_msg = f"Ошибка перевода документа DeepL: {e}"
-        print(f"  -> ОШИБКА: {error_msg}")
+        log.error("  -> ОШИБКА: %s", error_msg)
         # ... (дополнительные детали ошибки DeepL, если нужны) ...
         return {"status": "error", "input": input_path_str, "error": error_msg}
     except deepl.QuotaExceededException:
         error_msg = "Превышена квота DeepL API."
-        print(f"  -> ОШИБКА: {error_msg}")
+        log.error("  -> ОШИБКА: %s", error_msg)
         return {"status": "error", "input": input_path_str, "error": error_msg, "quota_exceeded": True}
     except deepl.TooManyRequestsException:
         error_msg = "Слишком много запросов к DeepL API."
-        print(f"  -> ОШИБКА: {error_msg}")
+        log.error("  -> ОШИБКА: %s", error_msg)
         return {"status": "error", "input": input_path_str, "error": error_msg, "rate_limited": True}
     except deepl.ConnectionException as e:
         error_msg = f"Ошибка сети при обращении к DeepL: {e}"
-        print(f"  -> ОШИБКА: {error_msg}")
+        log.error("  -> ОШИБКА: %s", error_msg)
         return {"status": "error", "input": input_path_str, "error": error_msg}
     except deepl.DeepLException as e:  # Общая ошибка DeepL
         error_msg = f"Общая ошибка DeepL API: {e}"
-        print(f"  -> ОШИБКА: {error_msg}")
+        log.error("  -> ОШИБКА: %s", error_msg)
         return {"status": "error", "input": input_path_str, "error": error_msg}
     except FileNotFoundError:
         # Скорее всего, не найден ИСХОДНЫЙ файл
         error_msg = f"Исходный файл не найден: {input_path_str}"
-        print(f"  -> ОШИБКА: {error_msg}")
+        log.error("  -> ОШИБКА: %s", error_msg)
         return {"status": "error", "input": input_path_str, "error": error_msg}
     except PermissionError:
         error_msg = f"Нет прав на чтение/запись файла ({input_path_str} -> {output_path_str})."
-        print(f"  -> ОШИБКА: {error_msg}")
+        log.error("  -> ОШИБКА: %s", error_msg)
         return {"status": "error", "input": input_path_str, "error": error_msg}
     except Exception as e:
-        # Перехват других непредвиденных ошибок (включая возможные ошибки при вызове clean_translated_docx)
+        # Перехват других непредвиденных ошибок (включая возможные ошибки при вызове postprocess_translated_docx)
         error_msg = f"Непредвиденная ошибка при обработке файла '{input_path_str}': {e}"
-        print(f"  -> КРИТИЧЕСКАЯ ОШИБКА: {error_msg}")
-        print(traceback.format_exc())
-        return {"status": "error", "input": input_path_str, "output": output_path_str,
-                "error": f"{error_msg}\n{traceback.format_exc()}"}
+        log.error("  -> КРИТИЧЕСКАЯ ОШИБКА: %s", error_msg, exc_info=True)
+        # Трассировка хранится без кадров стека и форматируется только для подробного отчета
+        return {"status": "error", "input": input_path_str, "output": output_path_str, "error": error_msg,
+                "traceback": traceback.TracebackException.from_exception(e, lookup_lines=False)}
 
 
 def process_translations(translator, file_paths, source_root_path, target_root_path, source_lang, target_lang,
@@ -657,50 +887,67 @@ def process_translations(translator, file_paths, source_root_path, target_root_p
     processing_mode = "ПОСЛЕДОВАТЕЛЬНОЙ" if sequential_mode else f"параллельной (до {MAX_CONCURRENT_TRANSLATIONS} потоков)"
 
     print(f"\nЗапуск {processing_mode} обработки {total_files} файлов...")
+    print(f"     (Языки: {source_lang} -> {target_lang})")
+    if glossary:
+        print(f"     (Используется глоссарий: {glossary.name})")
     print("-" * 30)
 
+    # Параметры перевода, общие для всех файлов, собираются один раз
+    base_kwargs = translation_base_kwargs(source_lang, target_lang, glossary)
+
     executor = ThreadPoolExecutor(max_workers=max_workers)
+    # Отдельный пул для пост-обработки DOCX (lxml): не занимает потоки, ожидающие DeepL
+    post_proc_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
     future_to_path_obj = {}  # Храним Path объекты
+    post_proc_futures = {}  # future пост-обработки -> результат перевода
     files_submitted = 0
-
-    for i, input_path_obj in enumerate(file_paths):  # Используем Path объект
-        if stop_processing:
-            print(
-                f"\n[{i + 1}/{total_files}] Пропуск отправки файла {input_path_obj.name} из-за критической ошибки API.")
-            continue
-
-        file_index = i + 1
+    # В работе держим не больше max_workers * 2 заданий: очередь пула не растет на весь список файлов,
+    # а при превышении квоты новые файлы перестают отправляться сразу
+    max_in_flight = max_workers * 2
+
+    # Части исходного корня считаем один раз: относительный путь файла - срез его частей
+    source_root_parts = source_root_path.parts
+    source_root_len = len(source_root_parts)
+
+    # Уже существующие переводы собираем одним обходом целевой папки вместо stat на каждый файл
+    existing_outputs = {os.path.join(dir_path, name)
+                        for dir_path, _, file_names in os.walk(target_root_path)
+                        for name in file_names}
+
+    def submit_file(file_index, input_path_obj):
+        """Проверяет файл и отправляет задание на перевод; возвращает future или None, если файл пропущен"""
+        nonlocal error_count, skipped_suffix_count, skipped_exists_count, files_submitted
         try:
-            relative_path_for_target = input_path_obj.relative_to(source_root_path)
+            input_parts = input_path_obj.parts
+            if input_parts[:source_root_len] != source_root_parts:
+                raise ValueError(f"'{input_path_obj}' не находится внутри '{source_root_path}'")
+            relative_path_for_target = Path(*input_parts[source_root_len:])
             output_path_obj = target_root_path / relative_path_for_target.with_name(
                 f"{input_path_obj.stem}{actual_suffix}{input_path_obj.suffix}")
         except Exception as e:
-            print(
-                f"\n[{file_index}/{total_files}] Ошибка при расчете выходного пути для {input_path_obj.name}: {e}. Пропуск файла.")
+            log.error("[%d/%d] Ошибка при расчете выходного пути для %s: %s. Пропуск файла.",
+                      file_index, total_files, input_path_obj.name, e)
             error_count += 1
             # Добавляем детали ошибки
             errors_list.append(
                 {"status": "error", "file": str(input_path_obj), "error": f"Ошибка при расчете выходного пути: {e}"})
-            continue
+            return None
 
         # --- Skip Checks ---
         if input_path_obj.stem.endswith(actual_suffix):
-            try:
-                display_path = input_path_obj.relative_to(source_root_path)
-            except ValueError:
-                display_path = input_path_obj.name
-            print(f"\n[{file_index}/{total_files}] Пропуск (файл уже имеет суффикс '{actual_suffix}'): {display_path}")
+            log.info("[%d/%d] Пропуск (файл уже имеет суффикс '%s'): %s",
+                     file_index, total_files, actual_suffix, relative_path_for_target)
             skipped_suffix_count += 1
-            continue
+            return None
 
-        if output_path_obj.exists():
+        if str(output_path_obj) in existing_outputs:
             try:
                 display_path = output_path_obj.relative_to(target_root_path)
             except ValueError:
                 display_path = output_path_obj.name
-            print(f"\n[{file_index}/{total_files}] Пропуск (переведенный файл уже существует): {display_path}")
+            log.info("[%d/%d] Пропуск (переведенный файл уже существует): %s", file_index, total_files, display_path)
             skipped_exists_count += 1
-            continue
+            return None
         # --- End Skip Checks ---
 
         # Submit the translation task
@@ -715,68 +962,120 @@ def process_translations(translator, file_paths, source_root_path, target_root_p
             total_files,
             source_root_path,  # Path
             glossary,  # Передаем глоссарий
-            sequential_mode  # Передаем режим обработки
+            sequential_mode,  # Передаем режим обработки
+            post_proc_pool,  # Пул для пост-обработки DOCX
+            base_kwargs  # Общие параметры перевода
         )
         future_to_path_obj[future] = input_path_obj  # Храним Path объект
         files_submitted += 1
-
-    print(f"\nОтправлено {files_submitted} заданий на перевод. Ожидание завершения...")
-
-    # --- Сбор результатов ---
-    try:
-        for future in as_completed(future_to_path_obj):
-            input_path_obj = future_to_path_obj[future]
-            input_filename_str = str(input_path_obj)  # Строка для логов
-            try:
-                result = future.result()  # Получаем результат из потока
-
-                if result['status'] == "success":
-                    success_count += 1
-                elif result['status'] == "success_with_postprocessing_error":
-                    # Успешный перевод, но проблема с очисткой
-                    success_with_warnings += 1
-                    # Добавляем информацию об ошибке пост-обработки в общий список ошибок
-                    errors_list.append({
-                        "status": "warning",  # Используем статус warning
-                        "file": result.get('input', input_filename_str),
-                        "output": result.get('output'),
-                        "error": f"Ошибка пост-обработки файла {Path(result.get('output', '')).name}"
-                    })
-                elif result['status'] == "error":
-                    # Ошибка перевода или другая критическая ошибка
-                    error_count += 1
-                    # Убедимся, что ключ 'file' есть в словаре ошибки для отчета
-                    if 'file' not in result: result['file'] = result.get('input', input_filename_str)
-                    errors_list.append(result)
-                    # Проверяем на критические ошибки API для остановки
-                    if result.get("quota_exceeded") or result.get("rate_limited"):
-                        if not stop_processing:
-                            print("\n*** Обнаружено превышение квоты или лимита запросов DeepL. ***")
-                            print("*** Новые задания не будут отправляться. Дождитесь завершения текущих. ***")
-                        stop_processing = True
-                else:
-                    # Непредвиденный статус
-                    print(
-                        f"Предупреждение: Неизвестный статус результата '{result.get('status')}' для файла {input_filename_str}")
-                    error_count += 1  # Считаем как ошибку
-                    errors_list.append({"status": "error", "file": input_filename_str,
-                                        "error": f"Неизвестный статус результата: {result.get('status')}"})
-
-
-            except Exception as exc:
-                # Ошибка получения результата из самого future (редко)
-                error_count += 1
-                error_msg = f"Критическая ошибка при получении результата для файла '{input_filename_str}': {exc}"
-                print(f"  -> КРИТИЧЕСКАЯ ОШИБКА ПОТОКА: {error_msg}")
-                print(traceback.format_exc())
-                errors_list.append(
-                    {"status": "error", "file": input_filename_str, "error": f"{error_msg}\n{traceback.format_exc()}"})
-    finally:
-        # Гарантированно закрываем пул потоков
-        executor.shutdown(wait=True)
+        return future
+
+    def record_result(result, input_filename_str):
+        """Учитывает результат обработки файла в счетчиках и списке ошибок"""
+        nonlocal success_count, success_with_warnings, error_count, stop_processing
+        if result['status'] == "success":
+            success_count += 1
+        elif result['status'] == "success_with_postprocessing_error":
+            # Успешный перевод, но проблема с очисткой
+            success_with_warnings += 1
+            # Добавляем информацию об ошибке пост-обработки в общий список ошибок
+            errors_list.append({
+                "status": "warning",  # Используем статус warning
+                "file": result.get('input', input_filename_str),
+                "output": result.get('output'),
+                "error": f"Ошибка пост-обработки файла {Path(result.get('output', '')).name}"
+            })
+        elif result['status'] == "error":
+            # Ошибка перевода или другая критическая ошибка
+            error_count += 1
+            # Убедимся, что ключ 'file' есть в словаре ошибки для отчета
+            if 'file' not in result: result['file'] = result.get('input', input_filename_str)
+            errors_list.append(result)
+            # Проверяем на критические ошибки API для остановки
+            if result.get("quota_exceeded") or result.get("rate_limited"):
+                if not stop_processing:
+                    log.warning("*** Обнаружено превышение квоты или лимита запросов DeepL. ***")
+                    log.warning("*** Новые задания не будут отправляться. Дождитесь завершения текущих. ***")
+                stop_processing = True
+        else:
+            # Непредвиденный статус
+            log.warning("Предупреждение: Неизвестный статус результата '%s' для файла %s",
+                        result.get('status'), input_filename_str)
+            error_count += 1  # Считаем как ошибку
+            errors_list.append({"status": "error", "file": input_filename_str,
+                                "error": f"Неизвестный статус результата: {result.get('status')}"})
+
+    def collect_result(future):
+        """Забирает результат завершенного задания перевода"""
+        nonlocal error_count
+        input_path_obj = future_to_path_obj.pop(future)
+        input_filename_str = str(input_path_obj)  # Строка для логов
+        try:
+            result = future.result()  # Получаем результат из потока
+            post_future = result.pop('post_processing_future', None)
+            if post_future is not None:
+                # Итог файла известен только после пост-обработки
+                post_proc_futures[post_future] = result
+                return
+            record_result(result, input_filename_str)
+
+        except Exception as exc:
+            # Ошибка получения результата из самого future (редко)
+            error_count += 1
+            error_msg = f"Критическая ошибка при получении результата для файла '{input_filename_str}': {exc}"
+            log.error("  -> КРИТИЧЕСКАЯ ОШИБКА ПОТОКА: %s", error_msg, exc_info=True)
+            errors_list.append({"status": "error", "file": input_filename_str, "error": error_msg,
+                                "traceback": traceback.TracebackException.from_exception(exc, lookup_lines=False)})
+
+    # --- Отправка заданий и сбор результатов ---
+    files_iter = enumerate(file_paths, 1)  # Используем Path объекты
+    pending = set()
+    # Сообщения потоков выводятся через очередь журнала
+    with queued_logging():
+        try:
+            while True:
+                # Досылаем задания, пока есть место и не было критической ошибки API
+                while len(pending) < max_in_flight and not stop_processing:
+                    next_file = next(files_iter, None)
+                    if next_file is None:
+                        break
+                    future = submit_file(*next_file)
+                    if future is not None:
+                        pending.add(future)
+
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect_result(future)
+
+            if stop_processing:
+                not_submitted = sum(1 for _ in files_iter)  # Оставшиеся в очереди файлы
+                log.warning("Из-за критической ошибки API не отправлено файлов: %d", not_submitted)
+            log.info("Отправлено %d заданий на перевод.", files_submitted)
+
+            # --- Ожидание пост-обработки DOCX ---
+            for post_future in as_completed(post_proc_futures):
+                result = post_proc_futures[post_future]
+                try:
+                    postprocessing_ok = post_future.result()
+                except Exception as exc:
+                    log.error("  -> КРИТИЧЕСКАЯ ОШИБКА пост-обработки файла %s: %s", Path(result['output']).name, exc,
+                              exc_info=True)
+                    postprocessing_ok = False
+                if not postprocessing_ok:
+                    result['status'] = "success_with_postprocessing_error"
+                    result['post_processing_error'] = True
+                record_result(result, result['input'])
+        finally:
+            # Гарантированно закрываем пулы потоков
+            executor.shutdown(wait=True)
+            post_proc_pool.shutdown(wait=True)
 
     print("-" * 30)
     print("Обработка завершена.")
+    if success_count or success_with_warnings:
+        invalidate_usage_cache()
     # Возвращаем все счетчики
     return success_count, success_with_warnings, skipped_suffix_count, skipped_exists_count, error_count, errors_list
 
@@ -850,6 +1149,9 @@ def handle_single_file(translator):
         sequential_mode=True
     )
 
+    if result['status'] in ("success", "success_with_postprocessing_error"):
+        invalidate_usage_cache()
+
     # 7. Выводим результат
     print("\n" + "=" * 50)
     if result['status'] == "success":
@@ -964,10 +1266,13 @@ def handle_folder_with_menu(translator):
                 prefix = "Предупреждение"
 
             error_message_full = str(err_info.get('error', 'Нет деталей'))
-            error_message_short = error_message_full.splitlines()[0]
+            error_message_short = error_message_full.partition('\n')[0]
 
             print(f"  {i + 1}. Файл: {file_display_name}")
             print(f"     {prefix}: {error_message_short}")
+            if VERBOSE_ERROR_REPORT and err_info.get('traceback') is not None:
+                for line in err_info['traceback'].format():
+                    print(f"       {line.rstrip()}")
 
     print(f"\nПереведенные файлы сохранены в: {target_root_path}")
     print("-" * 30)
@@ -977,6 +1282,8 @@ def handle_folder_with_menu(translator):
 
 if __name__ == "__main__":
     start_total_time = time.time()
+    # Сообщения журнала вне перевода папки (режим одного файла) выводятся в stdout без префиксов
+    logging.basicConfig(level=LOG_LEVEL, format='%(message)s', stream=sys.stdout)
 
     check_api_key_placeholder()
     translator = initialize_translator(DEEPL_API_KEY)
@@ -18,17 +18,116 @@ from pathlib import Path
 import re
 from datetime import datetime
 import json
+import itertools
+import shutil
+from bisect import bisect_right
 
 try:
     from docx import Document
+    from docx.oxml.ns import nsmap
+    from lxml import etree
 except ImportError:
     print("Ошибка: Необходима библиотека python-docx.")
     print("Установите: pip install python-docx")
     sys.exit(1)
 
+def may_contain_placeholder(text):
+    """
+    Быстрая проверка подстрокой перед запуском regex: в большинстве параграфов плейсхолдеров нет.
+    Паттерны регистронезависимые: обычное 'Eqn' проверяется сразу, любое другое написание - через lower()
+    """
+    return 'Eqn' in text or 'eqn' in text.lower()
+
+
+# Параграфы основного текста и ячеек таблиц верхнего уровня - те же, что document.paragraphs и
+# table.rows[*].cells[*].paragraphs, но без построения прокси-объектов python-docx
+W_BODY_PARAGRAPHS_XPATH = etree.XPath('./w:p', namespaces={'w': nsmap['w']})
+W_TABLE_PARAGRAPHS_XPATH = etree.XPath('./w:tbl/w:tr/w:tc/w:p', namespaces={'w': nsmap['w']})
+# Текст параграфа одним XPath (как CT_P.text, но склейка на стороне lxml)
+W_PARAGRAPH_TEXT_XPATH = etree.XPath(
+    './w:r/w:t/text() | ./w:hyperlink/w:r/w:t/text()', namespaces={'w': nsmap['w']}
+)
+# Элементы, которые CT_P.text превращает в символы (\t, \n, -) - для таких параграфов берется CT_P.text
+W_PARAGRAPH_HAS_SPECIAL_XPATH = etree.XPath(
+    'boolean((./w:r | ./w:hyperlink/w:r)/*[self::w:tab or self::w:ptab or self::w:br '
+    'or self::w:cr or self::w:noBreakHyphen])',
+    namespaces={'w': nsmap['w']}
+)
+
+
+def paragraph_element_text(p):
+    """Текст элемента w:p - тот же, что Paragraph.text (вместе с гиперссылками), склейка на стороне lxml"""
+    if W_PARAGRAPH_HAS_SPECIAL_XPATH(p):
+        return p.text
+    return ''.join(W_PARAGRAPH_TEXT_XPATH(p))
+
+
+def iter_paragraph_texts(document):
+    """
+    Тексты параграфов в том же порядке, что и iter_document_paragraphs, но прямо из дерева lxml,
+    без прокси-объектов python-docx. Текст тот же, что Paragraph.text (вместе с гиперссылками).
+    Ячейки-продолжения вертикально объединенных ячеек дают пустой текст, а не пропускаются
+    """
+    body = document.element.body
+    for p in W_BODY_PARAGRAPHS_XPATH(body):
+        yield paragraph_element_text(p)
+    for p in W_TABLE_PARAGRAPHS_XPATH(body):
+        yield paragraph_element_text(p)
+
+    for section in document.sections:
+        header, footer = section.header, section.footer
+        if not header.is_linked_to_previous:
+            for p in W_BODY_PARAGRAPHS_XPATH(header.part.element):
+                yield paragraph_element_text(p)
+        if not footer.is_linked_to_previous:
+            for p in W_BODY_PARAGRAPHS_XPATH(footer.part.element):
+                yield paragraph_element_text(p)
+
+
+def iter_document_paragraphs(document):
+    """
+    Обходит все параграфы документа один раз в порядке: основной текст, таблицы, колонтитулы.
+    Возвращает (часть документа, номер, параграф) - строка места для журнала собирается
+    только для измененных параграфов. Объединенные ячейки таблиц повторяются
+    в row.cells - их параграфы выдаются один раз. Колонтитул, связанный с предыдущим разделом,
+    пропускается: его параграфы уже выданы с тем разделом, а обращение к нему в первом разделе
+    создало бы в документе пустой колонтитул.
+    """
+    for i, para in enumerate(document.paragraphs):
+        yield "Параграф", i+1, para
+
+    seen_cells = set()
+    for t_idx, table in enumerate(document.tables):
+        for row in table.rows:
+            for cell in row.cells:
+                if cell._tc in seen_cells:
+                    continue
+                seen_cells.add(cell._tc)
+                for para in cell.paragraphs:
+                    yield "Таблица", t_idx+1, para
+
+    for s_idx, section in enumerate(document.sections):
+        # Прокси колонтитулов создаются один раз на раздел
+        header, footer = section.header, section.footer
+        if not header.is_linked_to_previous:
+            for para in header.paragraphs:
+                yield "Заголовок", s_idx+1, para
+        if not footer.is_linked_to_previous:
+            for para in footer.paragraphs:
+                yield "Подвал", s_idx+1, para
+
+
 class PlaceholderRestorer:
     """Окончательно исправленный класс для восстановления последовательности плейсхолдеров"""
 
+    # Счетчики статистики, обнуляемые перед каждым документом
+    _RESET_KEYS = (
+        'placeholders_replaced',
+        'placeholders_found_in_translation',
+        'placeholders_found_in_original',
+        'damaged_placeholders_fixed',
+    )
+
     def __init__(self):
         self.stats = {
             'placeholders_replaced': 0,
@@ -38,112 +137,83 @@ class PlaceholderRestorer:
             'damaged_placeholders_details': []
         }
 
-        # Паттерн для поиска ВСЕХ плейсхолдеров (правильных и поврежденных)
-        self.pattern_all_placeholders = re.compile(
-            r'(?:<<|<\s*<|<|^|\s)'           # начало 
-            r'(Eqn\d+(?:\.eps)?)'             # основная часть (группа 1)
-            r'(?:>>>|>>|>\s*>|>|(?=\s)|(?=$)|(?=[,.]))'  # конец
-            r'(?:[,.>\s]*)?',                  # возможные артефакты после
-            re.IGNORECASE | re.MULTILINE
+        # Паттерны извлечения и замены (компилируются один раз, а не на каждый параграф)
+        # Плейсхолдеры оригинала - правильные и поврежденные в одном паттерне: один проход finditer,
+        # совпадения не пересекаются, поэтому проверка наложений не нужна.
+        # Номер, .eps и запятая сразу попадают в именованные группы n/eps/comma
+        self.pattern_original = re.compile(
+            r'(?:(?P<lts><\s+<)|(?P<lt><<)|(?<!<))'   # начало: '< <', '<<' или без << (перед Eqn нет '<')
+            r'Eqn(?P<n>\d+)(?P<eps>\.eps)?'
+            r'(?(lts)>\s*>'                           # с пробелами
+            r'|(?(lt)(?P<gt>>>>+|>>|(?!\d|\.eps|>>))'  # лишние >, правильный, без >> (без отката в номер или .eps)
+            r'|>>))'                                  # без <<
+            r'(?P<comma>,)?',
+            re.IGNORECASE
+        )
+        # Нормализованные плейсхолдеры по (номер, .eps, запятая): повторяющиеся ссылки на одну формулу
+        # разделяют одну интернированную строку, а не собираются f-строкой заново
+        self._placeholder_cache = {}
+
+        # Быстрый путь для правильно оформленного оригинала: литеральное начало '<<Eqn' без альтернатив
+        self.pattern_correct = re.compile(r'<<Eqn\d+(?:\.eps)?>>(?!>),?', re.IGNORECASE)
+        # Все варианты плейсхолдеров в переводе (правильные и поврежденные) для замены
+        self.pattern_comprehensive = re.compile(
+            r'(?:<<|<\s*<|(?<!\w))Eqn\d+(?:\.eps)?(?:>>|>\s*>|(?=\W)|$)(?:[,>\s]*)?',
+            re.IGNORECASE
         )
 
-    def extract_placeholders_list(self, doc_path):
+    def iter_placeholders(self, doc_path):
         """
-        Извлекает список всех плейсхолдеров из документа в порядке появления
+        Выдает плейсхолдеры документа по одному в порядке появления (без промежуточного списка)
         КРИТИЧЕСКИ ВАЖНО: сохраняет точный формат из оригинала
         """
-        placeholders = []
-
         try:
             document = Document(doc_path)
         except Exception as e:
             print(f"⚠️ Не удалось открыть {doc_path.name}: {e}")
-            return []
+            return
 
         def extract_from_text(text):
             """Извлекает плейсхолдеры из текста с сохранением точного формата"""
-            if not text:
+            if not text or not may_contain_placeholder(text):
                 return []
 
-            # Ищем все варианты плейсхолдеров
-            found_placeholders = []
+            # Каждое вхождение Eqn (в любом регистре) - правильный плейсхолдер: разбор повреждений не нужен
+            correct = self.pattern_correct.findall(text)
+            if len(correct) == text.lower().count('eqn'):
+                return correct
 
-            # Сначала ищем правильно оформленные
-            correct_pattern = re.compile(r'<<Eqn\d+(?:\.eps)?>>(?:,)?', re.IGNORECASE)
-            for match in correct_pattern.finditer(text):
-                found_placeholders.append((match.start(), match.end(), match.group()))
-
-            # Затем ищем поврежденные в местах, где нет правильных
-            damaged_patterns = [
-                r'(?<!<)Eqn\d+(?:\.eps)?>>(?:,)?',  # без <<
-                r'<<Eqn\d+(?:\.eps)?(?!>>)',        # без >>  
-                r'<\s+<Eqn\d+(?:\.eps)?>\s*>',    # с пробелами
-                r'<<Eqn\d+(?:\.eps)?>>>+(?:,)?',    # лишние >
-            ]
-
-            for pattern in damaged_patterns:
-                for match in re.finditer(pattern, text, re.IGNORECASE):
-                    start, end = match.start(), match.end()
-                    # Проверяем, не пересекается ли с уже найденными
-                    overlap = False
-                    for existing_start, existing_end, _ in found_placeholders:
-                        if not (end <= existing_start or start >= existing_end):
-                            overlap = True
-                            break
-
-                    if not overlap:
-                        # Исправляем поврежденный плейсхолдер
-                        original = match.group()
-                        eqn_match = re.search(r'Eqn(\d+)', original, re.IGNORECASE)
-                        if eqn_match:
-                            num = eqn_match.group(1)
-                            has_eps = '.eps' in original.lower()
-                            has_comma = original.endswith(',')
-
-                            if has_eps:
-                                fixed = f'<<Eqn{num}.eps>>'
-                            else:
-                                fixed = f'<<Eqn{num}>>'
-
-                            if has_comma:
-                                fixed = fixed[:-2] + ',>>'
-
-                            found_placeholders.append((start, end, fixed))
-
-            # Сортируем по позиции и возвращаем только плейсхолдеры
-            found_placeholders.sort(key=lambda x: x[0])
-            return [placeholder for _, _, placeholder in found_placeholders]
-
-        # Извлекаем из всех частей документа
-        for para in document.paragraphs:
-            placeholders.extend(extract_from_text(para.text))
-
-        for table in document.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for para in cell.paragraphs:
-                        placeholders.extend(extract_from_text(para.text))
-
-        for section in document.sections:
-            for para in section.header.paragraphs:
-                placeholders.extend(extract_from_text(para.text))
-            for para in section.footer.paragraphs:
-                placeholders.extend(extract_from_text(para.text))
-
-        return placeholders
+            # Один проход по тексту: совпадения идут слева направо и уже упорядочены
+            found_placeholders = []
+            for match in self.pattern_original.finditer(text):
+                if match['lt'] and match['gt'] == '>>':
+                    # Правильный - сохраняем точный формат оригинала
+                    found_placeholders.append(match.group())
+                    continue
+
+                # Исправляем поврежденный плейсхолдер: <<EqnN[.eps]>>[,]
+                key = (match['n'], bool(match['eps']), bool(match['comma']))
+                placeholder = self._placeholder_cache.get(key)
+                if placeholder is None:
+                    eps = '.eps' if key[1] else ''
+                    comma = ',' if key[2] else ''
+                    placeholder = self._placeholder_cache[key] = sys.intern(f"<<Eqn{key[0]}{eps}>>{comma}")
+                found_placeholders.append(placeholder)
+
+            return found_placeholders
+
+        # Извлекаем из всех частей документа (тот же порядок обхода, что и при замене)
+        for text in iter_paragraph_texts(document):
+            yield from extract_from_text(text)
 
     def process_document(self, doc_path, output_path=None, original_doc_path=None):
         """
         КРИТИЧЕСКИ ИСПРАВЛЕННАЯ обработка документа
         """
-        # Сброс статистики
-        self.stats = {
-            'placeholders_replaced': 0,
-            'placeholders_found_in_translation': 0,
-            'placeholders_found_in_original': 0,
-            'damaged_placeholders_fixed': 0,
-            'damaged_placeholders_details': []
-        }
+        # Сброс статистики на месте (словарь и список переиспользуются при пакетной обработке)
+        for key in self._RESET_KEYS:
+            self.stats[key] = 0
+        self.stats['damaged_placeholders_details'].clear()
 
         if output_path is None:
             output_path = doc_path.parent / f"{doc_path.stem}_fixed{doc_path.suffix}"
@@ -157,86 +227,106 @@ class PlaceholderRestorer:
         if not original_doc_path:
             return False, "Не указан оригинальный документ"
 
-        # Извлекаем плейсхолдеры из оригинала
-        original_placeholders = self.extract_placeholders_list(original_doc_path)
-        if not original_placeholders:
+        # Плейсхолдеры оригинала читаются потоком, по мере замены
+        original_placeholders = self.iter_placeholders(original_doc_path)
+        first_placeholder = next(original_placeholders, None)
+        if first_placeholder is None:
             return False, f"Не удалось извлечь плейсхолдеры из оригинала"
+        original_placeholders = itertools.chain((first_placeholder,), original_placeholders)
 
-        self.stats['placeholders_found_in_original'] = len(original_placeholders)
-        print(f"\n📊 Найдено плейсхолдеров в оригинале: {len(original_placeholders)}")
-
-        # Счетчик для замены
+        # Счетчики для замены - локальные, в self.stats записываются после обхода
         placeholder_index = 0
+        replaced = 0
 
         def replace_placeholder(match):
             """Заменяет найденный плейсхолдер на соответствующий из оригинала"""
-            nonlocal placeholder_index
-
-            if placeholder_index < len(original_placeholders):
-                replacement = original_placeholders[placeholder_index]
-                placeholder_index += 1
-                self.stats['placeholders_replaced'] += 1
-                return replacement
-            else:
-                placeholder_index += 1
-                return match.group(0)
+            nonlocal placeholder_index, replaced
 
-        def process_text(text, location=""):
-            """Обрабатывает текст с заменой плейсхолдеров"""
-            if not text:
-                return text
+            placeholder_index += 1
+            try:
+                replacement = next(original_placeholders)
+            except StopIteration:
+                return match.group(0)
+            replaced += 1
+            return replacement
 
+        def process_text(text):
+            """Обрабатывает текст с заменой плейсхолдеров; возвращает (новый текст, число замен)"""
             # КРИТИЧЕСКИ ВАЖНО: используем правильный паттерн для замены
             # Находим ВСЕ плейсхолдеры (правильные и поврежденные) и заменяем их
-
-            # Паттерн для поиска всех вариантов плейсхолдеров
-            comprehensive_pattern = re.compile(
-                r'(?:<<|<\s*<|(?<!\w))Eqn\d+(?:\.eps)?(?:>>|>\s*>|(?=\W)|$)(?:[,>\s]*)?',
-                re.IGNORECASE
-            )
-
-            result_text = comprehensive_pattern.sub(replace_placeholder, text)
-            return result_text
-
-        # Сбрасываем индекс
-        placeholder_index = 0
+            return self.pattern_comprehensive.subn(replace_placeholder, text)
+
+        def process_runs(para, text):
+            """
+            Заменяет плейсхолдеры прямо в текстах runs - форматирование сохраняется.
+            Совпадения ищутся по тексту всего параграфа (как и в process_text), поэтому порядок и
+            границы те же. Возвращает None, если плейсхолдер разбит между runs или текст параграфа
+            не складывается из его runs (гиперссылки) - тогда нужна замена всего параграфа
+            """
+            runs = para.runs
+            run_texts = [run.text for run in runs]
+            if ''.join(run_texts) != text:
+                return None
+
+            run_starts = list(itertools.accumulate((len(t) for t in run_texts[:-1]), initial=0))
+            matches = []
+            for match in self.pattern_comprehensive.finditer(text):
+                run_idx = bisect_right(run_starts, match.start()) - 1
+                if match.end() > run_starts[run_idx] + len(run_texts[run_idx]):
+                    return None
+                matches.append((run_idx, match))
+
+            # Замены вызываются только после проверки всех совпадений - счетчик не сдвигается при откате
+            changed = False
+            pos = {}
+            pieces = {}
+            for run_idx, match in matches:
+                run_start = run_starts[run_idx]
+                run_pos = pos.get(run_idx, 0)
+                run_pieces = pieces.setdefault(run_idx, [])
+                run_pieces.append(run_texts[run_idx][run_pos:match.start() - run_start])
+                run_pieces.append(replace_placeholder(match))
+                pos[run_idx] = match.end() - run_start
+
+            for run_idx, run_pieces in pieces.items():
+                run_pieces.append(run_texts[run_idx][pos[run_idx]:])
+                new_run_text = ''.join(run_pieces)
+                if new_run_text != run_texts[run_idx]:
+                    runs[run_idx].text = new_run_text
+                    changed = True
+            return changed
 
         print("\n🔄 Обработка документа...")
 
-        # Обработка параграфов
-        for i, para in enumerate(document.paragraphs):
-            if para.text and 'Eqn' in para.text:
-                original_text = para.text
-                new_text = process_text(para.text, f"Параграф {i+1}")
-                if new_text != original_text:
+        # Параграфы, таблицы и колонтитулы - один обход и один паттерн на параграф; текст читается
+        # тем же способом, что и при извлечении из оригинала (см. paragraph_element_text)
+        for part_name, part_number, para in iter_document_paragraphs(document):
+            original_text = paragraph_element_text(para._p)
+            if not may_contain_placeholder(original_text):
+                continue
+            changed = process_runs(para, original_text)
+            if changed is None:
+                # Плейсхолдер разбит между runs - переписываем параграф целиком
+                new_text, changed = process_text(original_text)
+                if changed:
                     para.text = new_text
-                    print(f"  ✏️ Параграф {i+1}: обработан")
-
-        # Обработка таблиц
-        for t_idx, table in enumerate(document.tables):
-            for r_idx, row in enumerate(table.rows):
-                for c_idx, cell in enumerate(row.cells):
-                    for p_idx, para in enumerate(cell.paragraphs):
-                        if para.text and 'Eqn' in para.text:
-                            original_text = para.text
-                            new_text = process_text(para.text, f"Таблица {t_idx+1}")
-                            if new_text != original_text:
-                                para.text = new_text
-
-        # Обработка колонтитулов
-        for s_idx, section in enumerate(document.sections):
-            for para in section.header.paragraphs:
-                if para.text and 'Eqn' in para.text:
-                    para.text = process_text(para.text, f"Заголовок {s_idx+1}")
-            for para in section.footer.paragraphs:
-                if para.text and 'Eqn' in para.text:
-                    para.text = process_text(para.text, f"Подвал {s_idx+1}")
+            if changed:
+                print(f"  ✏️ {part_name} {part_number}: обработан")
 
         self.stats['placeholders_found_in_translation'] = placeholder_index
+        self.stats['placeholders_replaced'] = replaced
+        # Оставшиеся в оригинале досчитываются без сохранения
+        self.stats['placeholders_found_in_original'] = replaced + sum(1 for _ in original_placeholders)
+        print(f"\n📊 Найдено плейсхолдеров в оригинале: {self.stats['placeholders_found_in_original']}")
 
         # Сохранение
         try:
             output_path.parent.mkdir(parents=True, exist_ok=True)
+            if self.stats['placeholders_replaced'] == 0:
+                # Документ не менялся - копируем файл вместо пересборки всего пакета через python-docx
+                shutil.copyfile(doc_path, output_path)
+                return True, f"Плейсхолдеры не заменялись; документ скопирован без изменений. Доступно в оригинале: {self.stats['placeholders_found_in_original']}"
+
             document.save(output_path)
 
             message = f"Заменено плейсхолдеров: {self.stats['placeholders_replaced']}/{self.stats['placeholders_found_in_translation']}; Доступно в оригинале: {self.stats['placeholders_found_in_original']}"
@@ -1,2 +1,10 @@
 # Config module
-from .settings import *
\ No newline at end of file
+from . import settings
+from .settings import *
+
+
+def __getattr__(name):
+    # Ленивые настройки из .env (DEEPL_API_KEY и т.д.) не попадают в "import *" - берем их из settings
+    if name in settings._LAZY_SETTINGS:
+        return getattr(settings, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
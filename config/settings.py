@@ -2,34 +2,84 @@
 Конфигурационный файл для чтения настроек из .env
 """
 import os
+from functools import lru_cache
 from pathlib import Path
 from dotenv import load_dotenv
 
-# Загружаем переменные окружения из .env файла
+# Путь к .env файлу
 BASE_DIR = Path(__file__).resolve().parent.parent
 ENV_PATH = BASE_DIR / '.env'
 
-# Загружаем .env файл
-load_dotenv(ENV_PATH)
+
+@lru_cache(maxsize=None)
+def _load():
+    """Загружает .env один раз за процесс - при первом обращении к настройке, а не при импорте"""
+    load_dotenv(ENV_PATH, override=False)
+
 
 # DeepL настройки
-DEEPL_API_KEY = os.getenv('DEEPL_API_KEY', '')
-DEEPL_API_KEY_ALT = os.getenv('DEEPL_API_KEY_ALT', '')  # Альтернативный ключ если нужен
+@lru_cache(maxsize=None)
+def deepl_api_key():
+    _load()
+    return os.getenv('DEEPL_API_KEY', '')
+
+
+@lru_cache(maxsize=None)
+def deepl_api_key_alt():
+    """Альтернативный ключ если нужен"""
+    _load()
+    return os.getenv('DEEPL_API_KEY_ALT', '')
+
 
 # Aspose настройки
-ASPOSE_LICENSE_PATH = os.getenv('ASPOSE_LICENSE_PATH', 'Aspose.Words.lic')
+@lru_cache(maxsize=None)
+def aspose_license_path():
+    _load()
+    return os.getenv('ASPOSE_LICENSE_PATH', 'Aspose.Words.lic')
+
 
 # Настройки перевода
-MAX_CONCURRENT_TRANSLATIONS = int(os.getenv('MAX_CONCURRENT_TRANSLATIONS', '2'))
+@lru_cache(maxsize=None)
+def max_concurrent_translations():
+    _load()
+    return int(os.getenv('MAX_CONCURRENT_TRANSLATIONS', '2'))
+
 
 # Пути
-OUTPUT_DIR = os.getenv('OUTPUT_DIR', './out')
-TEMP_DIR = os.getenv('TEMP_DIR', './temp')
+@lru_cache(maxsize=None)
+def output_dir():
+    _load()
+    return os.getenv('OUTPUT_DIR', './out')
+
+
+@lru_cache(maxsize=None)
+def temp_dir():
+    _load()
+    return os.getenv('TEMP_DIR', './temp')
+
+
+# Прежние имена констант (from config.settings import DEEPL_API_KEY) - через ленивые функции выше
+_LAZY_SETTINGS = {
+    'DEEPL_API_KEY': deepl_api_key,
+    'DEEPL_API_KEY_ALT': deepl_api_key_alt,
+    'ASPOSE_LICENSE_PATH': aspose_license_path,
+    'MAX_CONCURRENT_TRANSLATIONS': max_concurrent_translations,
+    'OUTPUT_DIR': output_dir,
+    'TEMP_DIR': temp_dir,
+}
+
+
+def __getattr__(name):
+    getter = _LAZY_SETTINGS.get(name)
+    if getter is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getter()
+
 
 # Проверка наличия ключа
 def check_deepl_key():
     """Проверяет, установлен ли DeepL API ключ"""
-    if not DEEPL_API_KEY:
+    if not deepl_api_key():
         raise ValueError(
             "DeepL API ключ не найден! "
             "Пожалуйста, установите DEEPL_API_KEY в файле .env"